@@ -9,20 +9,12 @@ echo 步骤1: 处理成日数据
 echo ==================================================
 python processing/run_pipeline.py extract --year 2016 --granularity city --workers 4 --aggregate-mean
 echo 日数据处理完成
-timeout /t 3 /nobreak > nul
 
 echo ==================================================
-echo 步骤2: 聚合为月数据
+echo 步骤2: 聚合为月数据和年数据（按月并行，某年 12 个月完成后立即生成年数据）
 echo ==================================================
-python front/public/data/monthly_aggregation.py
-echo 月数据聚合完成
-timeout /t 3 /nobreak > nul
-
-echo ==================================================
-echo 步骤3: 聚合为年数据
-echo ==================================================
-python front/public/data/yearly_aggregation.py
-echo 年数据聚合完成
+python front/public/data/run_aggregation.py 2016
+echo 月/年数据聚合完成
 
 echo ==================================================
 echo 所有处理完成！
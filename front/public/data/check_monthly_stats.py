@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+月度统计回归检查：对比向量化的 calculate_monthly_stats 与基线提交中逐城市循环实现的输出
+
+用法：python check_monthly_stats.py [--year 2013] [--months 01 02 ...]
+reference_monthly_stats 是原 calculate_monthly_stats 的原样拷贝（按 province/city 分组，没有
+region_id 与 _sum/_sumsq 列）。新实现去掉这些新增列、按省市排序后，列名、列顺序、dtype、缺测位置
+必须与原实现一致；数值允许第 6 位小数上 1 个单位的差异（两者都保留 6 位小数，groupby 与 Series
+的求和顺序不同，舍入边界上可能差 1e-6）。新增的 _sum 另与 _mean * _count 核对。
+不一致时返回非零退出码
+"""
+
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+
+from monthly_aggregation import (NUMERIC_COLUMNS, load_region_registry, aggregate_monthly_data,
+                                 calculate_monthly_stats)
+
+def reference_monthly_stats(month_df, year, month):
+    """
+    计算月度统计指标
+    （基线提交中 calculate_monthly_stats 的原样拷贝，仅改了函数名并加了这行说明，用于回归对比）
+    """
+    if month_df.empty:
+        return pd.DataFrame()
+
+    # 数值列
+    numeric_columns = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+
+    # 将数值列转换为float类型
+    for col in numeric_columns:
+        if col in month_df.columns:
+            month_df[col] = pd.to_numeric(month_df[col], errors='coerce')
+
+    # 按province和city分组计算统计指标
+    grouped_stats = []
+
+    for (province, city), group in month_df.groupby(['province', 'city']):
+        stat_record = {
+            'province': province,
+            'city': city,
+            'year': int(year),
+            'month': int(month),
+            'total_days': len(group['date'].unique()),  # 该月有多少天有数据
+            'total_records': len(group)  # 该月的总记录数
+        }
+
+        # 计算每个数值字段的统计指标
+        for col in numeric_columns:
+            if col in group.columns:
+                values = group[col].dropna()
+                if not values.empty:
+                    stat_record.update({
+                        f'{col}_mean': round(float(values.mean()), 6),
+                        f'{col}_max': round(float(values.max()), 6),
+                        f'{col}_min': round(float(values.min()), 6),
+                        f'{col}_std': round(float(values.std()), 6) if len(values) > 1 else 0,
+                        f'{col}_count': len(values),  # 非空值数量
+                        f'{col}_missing': len(group) - len(values)  # 缺失值数量
+                    })
+                else:
+                    stat_record.update({
+                        f'{col}_mean': None,
+                        f'{col}_max': None,
+                        f'{col}_min': None,
+                        f'{col}_std': None,
+                        f'{col}_count': 0,
+                        f'{col}_missing': len(group)
+                    })
+
+        grouped_stats.append(stat_record)
+
+    return pd.DataFrame(grouped_stats)
+
+def compare(month_df, year, month):
+    t0 = time.perf_counter()
+    expected = reference_monthly_stats(month_df.copy(), year, month)
+    t_ref = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    actual = calculate_monthly_stats(month_df.copy(), year, month)
+    t_new = time.perf_counter() - t0
+    ok = True
+    try:
+        # 新增列只能是 region_id 与各变量的 _sum/_sumsq；其余列与原实现逐列对比（原实现按省市排序）
+        columns = [c for c in NUMERIC_COLUMNS if c in month_df.columns]
+        added = ['region_id'] + [f'{c}_{s}' for c in columns for s in ('sum', 'sumsq')]
+        assert [c for c in actual.columns if c not in added] == list(expected.columns), \
+            f'columns differ: {list(actual.columns)} vs {list(expected.columns)}'
+        assert set(actual.columns) - set(expected.columns) <= set(added), 'unexpected columns'
+        actual = actual.sort_values(['province', 'city'], kind='stable').reset_index(drop=True)
+        pd.testing.assert_frame_equal(actual[list(expected.columns)], expected,
+                                      check_exact=False, rtol=1e-12, atol=1.5e-6)
+        # sum 与 mean * count 一致（mean 已舍入到 6 位小数）
+        for col in columns:
+            count = actual[f'{col}_count']
+            implied = actual[f'{col}_mean'] * count
+            assert actual[f'{col}_sum'].isna().equals(count == 0), f'{col}_sum missing mismatch'
+            assert ((actual[f'{col}_sum'] - implied).abs() <= 1e-6 * count + 1e-9).where(count > 0, True).all(), \
+                f'{col}_sum does not match {col}_mean * {col}_count'
+    except AssertionError as e:
+        print(e)
+        ok = False
+    print(f"{year}-{month}: rows={len(actual)} loop={t_ref:.3f}s vectorized={t_new:.3f}s {'OK' if ok else 'FAIL'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='regression check for calculate_monthly_stats')
+    parser.add_argument('--year', default='2013')
+    parser.add_argument('--months', nargs='*', default=[f'{m:02d}' for m in range(1, 13)])
+    args = parser.parse_args()
+
+    data_dir = os.path.dirname(os.path.abspath(__file__))
+    year_path = os.path.join(data_dir, args.year)
+    regions = load_region_registry(data_dir)
+    ok = True
+    for month in args.months:
+        month_df = aggregate_monthly_data(year_path, month, regions)
+        if month_df.empty:
+            continue
+        ok &= compare(month_df, args.year, month)
+        # 同时检查按省市名称分组（没有注册表时）的路径
+        ok &= compare(month_df.drop(columns=['region_id'], errors='ignore'), args.year, month)
+        # 部分数值缺测
+        holed = month_df.copy()
+        holed.loc[holed.index[::7], 'pm25'] = None
+        holed.loc[holed['city'] == holed['city'].iloc[0], 'o3'] = None
+        ok &= compare(holed, args.year, month)
+    print('regression: ' + ('OK' if ok else 'FAILED'))
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,70 @@
 """
 
 import os
+import sys
+import warnings
 import json
+import hashlib
 import pandas as pd
-from datetime import datetime
-import glob
 from collections import defaultdict
 import numpy as np
 
+# 增量聚合状态（清单 + 合并后的日数据 pickle）与清单版本。状态不能放在 front/public 下，
+# 否则会被 vite 原样打包进站点；默认放在仓库 resources/cache/monthly_aggregation/<year>/
+MANIFEST_VERSION = 2
+
+def default_state_dir(data_dir):
+    """
+    增量状态根目录：与 processing/src/config.py 的 RESOURCE_DIR 相同的规则（优先仓库根目录的 resources/，
+    否则 processing/resources/），其下 cache/monthly_aggregation
+    """
+    repo_root = os.path.abspath(os.path.join(data_dir, '..', '..', '..'))
+    resource_dir = os.path.join(repo_root, 'resources')
+    if not os.path.isdir(resource_dir):
+        resource_dir = os.path.join(repo_root, 'processing', 'resources')
+    return os.path.join(resource_dir, 'cache', 'monthly_aggregation')
+
+def load_region_registry(data_dir):
+    """
+    读取行政区注册表 regions.json（由 run_pipeline.py regions 生成），
+    返回 region_id/province/city 表；文件不存在时返回空表
+    """
+    registry_path = os.path.join(data_dir, 'regions.json')
+    if not os.path.exists(registry_path):
+        return pd.DataFrame(columns=['region_id', 'province', 'city'])
+    with open(registry_path, 'r', encoding='utf-8') as f:
+        regions = json.load(f).get('regions', [])
+    df = pd.DataFrame(regions, columns=['id', 'province', 'city']).rename(columns={'id': 'region_id'})
+    df['region_id'] = df['region_id'].astype('int64')
+    return df
+
+def attach_region_ids(df, regions):
+    """
+    为记录补齐 region_id（按省市名称）或省市名称（只有 region_id 的紧凑日文件）
+    """
+    if df.empty or regions.empty:
+        return df
+    has_names = 'province' in df.columns and 'city' in df.columns
+    if 'region_id' not in df.columns:
+        return df.merge(regions, on=['province', 'city'], how='left')
+    df = df.copy()
+    df['region_id'] = pd.to_numeric(df['region_id'], errors='coerce').astype('Int64')
+    if not has_names:
+        return df.merge(regions.astype({'region_id': 'Int64'}), on='region_id', how='left')
+    missing = df['region_id'].isna()
+    if missing.any():
+        filled = df.loc[missing, ['province', 'city']].merge(regions, on=['province', 'city'], how='left')
+        df.loc[missing, 'region_id'] = filled['region_id'].to_numpy()
+    return df
+
+def region_group_keys(df):
+    """
+    所有记录都有 region_id 时按整数 ID 分组，否则回退到省市名称
+    """
+    if 'region_id' in df.columns and df['region_id'].notna().all():
+        return ['region_id']
+    return ['province', 'city']
+
 def load_daily_data(json_file_path):
     """
     加载单个日期的JSON数据
@@ -24,23 +81,13 @@ def load_daily_data(json_file_path):
         print(f"Error loading {json_file_path}: {e}")
         return pd.DataFrame()
 
-def aggregate_monthly_data(year_path, month):
+def list_month_day_files(year_path, month):
     """
-    聚合指定年份和月份的数据
+    列出某月的日文件，返回 [(YYYYMMDD, 路径)]（只包含存在的文件）
     """
     month_path = os.path.join(year_path, month)
     year = os.path.basename(year_path)
-
-    if not os.path.exists(month_path):
-        print(f"Month directory not found: {month_path}")
-        return pd.DataFrame()
-
-    print(f"Aggregating data for {year}-{month}")
-
-    # 收集该月的所有日期数据
-    monthly_data = []
-
-    # 遍历该月的每一天
+    files = []
     for day_dir in sorted(os.listdir(month_path)):
         day_path = os.path.join(month_path, day_dir)
 
@@ -48,136 +95,468 @@ def aggregate_monthly_data(year_path, month):
             continue
 
         # 查找JSON文件
-        json_pattern = os.path.join(day_path, f"{year}{month}{day_dir.zfill(2)}.json")
-        if os.path.exists(json_pattern):
-            daily_df = load_daily_data(json_pattern)
-            if not daily_df.empty:
-                # 添加日期信息
-                daily_df['date'] = f"{year}-{month}-{day_dir.zfill(2)}"
-                monthly_data.append(daily_df)
+        day_key = f"{year}{month}{day_dir.zfill(2)}"
+        json_path = os.path.join(day_path, f"{day_key}.json")
+        if os.path.exists(json_path):
+            files.append((day_key, json_path))
         else:
-            print(f"JSON file not found: {json_pattern}")
+            print(f"JSON file not found: {json_path}")
+    return files
 
+def load_month_days(day_files, regions=None):
+    """
+    读取若干日文件并合并，添加 date 列（YYYY-MM-DD）
+    """
+    monthly_data = []
+    for day_key, path in day_files:
+        daily_df = load_daily_data(path)
+        if not daily_df.empty:
+            # 添加日期信息
+            daily_df['date'] = f"{day_key[:4]}-{day_key[4:6]}-{day_key[6:8]}"
+            monthly_data.append(daily_df)
     if not monthly_data:
+        return pd.DataFrame()
+    month_df = pd.concat(monthly_data, ignore_index=True)
+    if regions is not None:
+        month_df = attach_region_ids(month_df, regions)
+    return month_df
+
+def aggregate_monthly_data(year_path, month, regions=None):
+    """
+    聚合指定年份和月份的数据
+    """
+    month_path = os.path.join(year_path, month)
+    year = os.path.basename(year_path)
+
+    if not os.path.exists(month_path):
+        print(f"Month directory not found: {month_path}")
+        return pd.DataFrame()
+
+    print(f"Aggregating data for {year}-{month}")
+
+    # 收集并合并该月的所有日期数据
+    day_files = list_month_day_files(year_path, month)
+    month_df = load_month_days(day_files, regions)
+
+    if month_df.empty:
         print(f"No data found for {year}-{month}")
         return pd.DataFrame()
 
-    # 合并该月的所有数据
-    month_df = pd.concat(monthly_data, ignore_index=True)
-    print(f"Combined {len(monthly_data)} days of data, total {len(month_df)} records")
+    print(f"Combined {month_df['date'].nunique()} days of data, total {len(month_df)} records")
 
     return month_df
 
+# 数值列
+NUMERIC_COLUMNS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+
 def calculate_monthly_stats(month_df, year, month):
     """
-    计算月度统计指标
+    计算月度统计指标：一次 groupby.agg 得到所有 {col}_mean/_max/_min/_std/_count/_missing/_sum/_sumsq，
+    输出列与逐城市循环的旧实现完全一致（回归检查见 check_monthly_stats.py）
     """
     if month_df.empty:
         return pd.DataFrame()
 
-    # 数值列
-    numeric_columns = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
-
     # 将数值列转换为float类型
-    for col in numeric_columns:
-        if col in month_df.columns:
-            month_df[col] = pd.to_numeric(month_df[col], errors='coerce')
+    columns = [col for col in NUMERIC_COLUMNS if col in month_df.columns]
+    for col in columns:
+        month_df[col] = pd.to_numeric(month_df[col], errors='coerce')
+
+    # 按region_id（或province和city）分组计算统计指标
+    group_keys = region_group_keys(month_df)
+    values = month_df[list(dict.fromkeys(group_keys + ['province', 'city', 'date'] + columns))].copy()
+    spec = {}
+    if 'region_id' in group_keys:
+        spec.update({'province': ('province', 'first'), 'city': ('city', 'first')})
+    spec.update({
+        'total_days': ('date', 'nunique'),  # 该月有多少天有数据
+        'total_records': ('date', 'size'),  # 该月的总记录数
+    })
+    for col in columns:
+        values[f'{col}__sq'] = values[col] ** 2
+        spec.update({
+            f'{col}_mean': (col, 'mean'),
+            f'{col}_max': (col, 'max'),
+            f'{col}_min': (col, 'min'),
+            f'{col}_std': (col, 'std'),
+            f'{col}_count': (col, 'count'),  # 非空值数量
+            f'{col}_sum': (col, 'sum'),
+            f'{col}_sumsq': (f'{col}__sq', 'sum'),
+        })
+    agg = values.groupby(group_keys).agg(**spec).reset_index()
+
+    stats = {}
+    if 'region_id' in group_keys:
+        stats['region_id'] = agg['region_id'].astype('int64')
+    stats['province'] = agg['province']
+    stats['city'] = agg['city']
+    stats['year'] = int(year)
+    stats['month'] = int(month)
+    stats['total_days'] = agg['total_days'].astype('int64')
+    stats['total_records'] = agg['total_records'].astype('int64')
+    for col in columns:
+        count = agg[f'{col}_count'].astype('int64')
+        has = count > 0
+        stats[f'{col}_mean'] = agg[f'{col}_mean'].round(6)
+        stats[f'{col}_max'] = agg[f'{col}_max'].round(6)
+        stats[f'{col}_min'] = agg[f'{col}_min'].round(6)
+        # 只有一个值时标准差记为 0，没有值时为空
+        stats[f'{col}_std'] = agg[f'{col}_std'].round(6).where(count > 1, 0.0).where(has)
+        stats[f'{col}_count'] = count
+        stats[f'{col}_missing'] = stats['total_records'] - count  # 缺失值数量
+        # 可合并的矩：年度等更粗粒度的汇总直接相加即可得到精确的均值/标准差
+        stats[f'{col}_sum'] = agg[f'{col}_sum'].round(6).where(has)
+        stats[f'{col}_sumsq'] = agg[f'{col}_sumsq'].round(6).where(has)
+
+    return pd.DataFrame(stats)
+
+# 可合并矩（count, sum, sumsq, min, max）的合并与还原，供 yearly_aggregation.py 使用。
+# 与 processing/src/moments.py 中的同名函数保持一致（前端脚本独立运行，不依赖 processing 包）
+MOMENT_STATS = ('count', 'sum', 'sumsq', 'min', 'max')
+
+def moment_columns(variables):
+    return [f'{v}_{s}' for v in variables for s in MOMENT_STATS]
+
+def merge_moments(df, keys, variables):
+    """
+    把已有的矩按 keys 合并（count/sum/sumsq 相加，min/max 取极值），O(行数)
+    """
+    variables = [v for v in variables if f'{v}_count' in df.columns]
+    cols = [c for c in moment_columns(variables) if c in df.columns]
+    frame = df[list(keys) + cols].copy()
+    for c in cols:
+        frame[c] = pd.to_numeric(frame[c], errors='coerce')
+    grouped = frame.groupby(list(keys), sort=True)
+    out = {}
+    for v in variables:
+        out[f'{v}_count'] = grouped[f'{v}_count'].sum().astype('int64')
+        out[f'{v}_sum'] = grouped[f'{v}_sum'].sum(min_count=1)
+        out[f'{v}_sumsq'] = grouped[f'{v}_sumsq'].sum(min_count=1)
+        out[f'{v}_min'] = grouped[f'{v}_min'].min()
+        out[f'{v}_max'] = grouped[f'{v}_max'].max()
+    if not out:
+        return frame[list(keys)].drop_duplicates().reset_index(drop=True)
+    return pd.DataFrame(out).reset_index()
+
+def moments_from_summary(df, variables, ddof=1):
+    """
+    由 {var}_mean/_std/_count 还原 sum/sumsq（旧的月度文件没有 sum/sumsq 时使用）
+    sum = mean * n，sumsq = std^2 * (n - ddof) + n * mean^2
+    """
+    out = df.copy()
+    for v in variables:
+        mean_col, std_col, n_col = f'{v}_mean', f'{v}_std', f'{v}_count'
+        if mean_col not in out.columns or n_col not in out.columns:
+            continue
+        n = pd.to_numeric(out[n_col], errors='coerce').fillna(0)
+        mean = pd.to_numeric(out[mean_col], errors='coerce')
+        std = pd.to_numeric(out[std_col], errors='coerce').fillna(0) if std_col in out.columns else 0.0
+        sum_ = mean * n
+        sumsq = std ** 2 * (n - ddof).clip(lower=0) + n * mean ** 2
+        if f'{v}_sum' in out.columns:
+            out[f'{v}_sum'] = pd.to_numeric(out[f'{v}_sum'], errors='coerce').fillna(sum_)
+        else:
+            out[f'{v}_sum'] = sum_
+        if f'{v}_sumsq' in out.columns:
+            out[f'{v}_sumsq'] = pd.to_numeric(out[f'{v}_sumsq'], errors='coerce').fillna(sumsq)
+        else:
+            out[f'{v}_sumsq'] = sumsq
+    return out
 
-    # 按province和city分组计算统计指标
-    grouped_stats = []
-
-    for (province, city), group in month_df.groupby(['province', 'city']):
-        stat_record = {
-            'province': province,
-            'city': city,
-            'year': int(year),
-            'month': int(month),
-            'total_days': len(group['date'].unique()),  # 该月有多少天有数据
-            'total_records': len(group)  # 该月的总记录数
-        }
-
-        # 计算每个数值字段的统计指标
-        for col in numeric_columns:
-            if col in group.columns:
-                values = group[col].dropna()
-                if not values.empty:
-                    stat_record.update({
-                        f'{col}_mean': round(float(values.mean()), 6),
-                        f'{col}_max': round(float(values.max()), 6),
-                        f'{col}_min': round(float(values.min()), 6),
-                        f'{col}_std': round(float(values.std()), 6) if len(values) > 1 else 0,
-                        f'{col}_count': len(values),  # 非空值数量
-                        f'{col}_missing': len(group) - len(values)  # 缺失值数量
-                    })
-                else:
-                    stat_record.update({
-                        f'{col}_mean': None,
-                        f'{col}_max': None,
-                        f'{col}_min': None,
-                        f'{col}_std': None,
-                        f'{col}_count': 0,
-                        f'{col}_missing': len(group)
-                    })
-
-        grouped_stats.append(stat_record)
-
-    return pd.DataFrame(grouped_stats)
-
-def process_year_monthly(year_path):
-    """
-    处理指定年份的所有月份数据
+def finalize_moments(df, variables, ddof=1):
     """
-    year = os.path.basename(year_path)
-    print(f"Processing monthly aggregation for year: {year}")
+    由矩计算 {var}_mean 与 {var}_std（n <= ddof 时 std 为 0，与单值时写 0 一致）
+    """
+    out = df.copy()
+    for v in variables:
+        if f'{v}_count' not in out.columns:
+            continue
+        n = out[f'{v}_count'].astype('float64')
+        s = out[f'{v}_sum'].astype('float64')
+        ss = out[f'{v}_sumsq'].astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s / n
+            var = (ss - s * mean) / (n - ddof)
+        var = var.clip(lower=0)
+        out[f'{v}_mean'] = mean.where(n > 0)
+        out[f'{v}_std'] = np.sqrt(var).where(n > ddof, 0.0).where(n > 0)
+    return out
+
+# 箱线图五数概括的分位点（min, Q1, median, Q3, max）与离群值判定系数
+BOX_PERCENTILES = [0, 25, 50, 75, 100]
+BOX_STATS = ['min', 'q1', 'median', 'q3', 'max']
+BOX_WHISKER = 1.5
+
+def _box_summary(matrix):
+    """
+    matrix: (变量, 组, 样本) 数组，NaN 为缺测。沿最后一维一次求分位数得到五数概括，
+    返回 (box[变量, 组, 5], count[变量, 组], 离群值 {(变量, 组): [值...]})；
+    离群值为落在 [Q1 - 1.5*IQR, Q3 + 1.5*IQR] 之外的样本
+    """
+    count = np.isfinite(matrix).sum(axis=-1)
+    with warnings.catch_warnings():
+        # 全部缺测的 (变量, 组) 结果为 NaN，忽略 All-NaN slice 警告
+        warnings.simplefilter('ignore', RuntimeWarning)
+        box = np.moveaxis(np.nanpercentile(matrix, BOX_PERCENTILES, axis=-1, method='linear'), 0, -1)
+    iqr = box[..., 3] - box[..., 1]
+    lower = (box[..., 1] - BOX_WHISKER * iqr)[..., None]
+    upper = (box[..., 3] + BOX_WHISKER * iqr)[..., None]
+    with np.errstate(invalid='ignore'):
+        mask = (matrix < lower) | (matrix > upper)
+    vi, gi, si = np.nonzero(mask)
+    outliers = defaultdict(list)
+    for v, g, value in zip(vi.tolist(), gi.tolist(), matrix[vi, gi, si].round(6).tolist()):
+        outliers[(v, g)].append(value)
+    return box, count, outliers
+
+def _box_entry(box, count, outliers):
+    if not count:
+        return {'box': None, 'outliers': [], 'count': 0}
+    return {'box': [round(float(x), 6) for x in box], 'outliers': sorted(outliers), 'count': int(count)}
+
+def calculate_monthly_box(month_df, year, month):
+    """
+    计算每个区域、每个变量在该月的箱线图数据：先按 (区域, 日期) 排成 (变量, 区域, 日) 矩阵
+    （同一区域同一天多条记录取均值），再沿“日”一维做 np.nanpercentile；
+    'all' 为该月全部区域-日样本的整体五数概括（对应前端 computeMonthlyBoxData 的口径）。
 
-    # 创建月度聚合数据目录
-    monthly_dir = os.path.join(year_path, 'monthly')
-    os.makedirs(monthly_dir, exist_ok=True)
+    分位数用 numpy 默认的线性插值，与前端按下标取值的写法在样本少时略有差异
+    """
+    if month_df.empty:
+        return {}
+    columns = [col for col in NUMERIC_COLUMNS if col in month_df.columns]
+    group_keys = region_group_keys(month_df)
+    if 'region_id' in group_keys:
+        group_codes, groups = pd.factorize(month_df['region_id'].astype('int64'), sort=True)
+    else:
+        group_codes, groups = pd.factorize(pd.MultiIndex.from_frame(month_df[['province', 'city']]), sort=True)
+    date_codes, dates = pd.factorize(month_df['date'], sort=True)
+    values = np.column_stack([pd.to_numeric(month_df[c], errors='coerce').to_numpy(dtype='float64') for c in columns])
+
+    shape = (len(groups), len(dates))
+    flat = group_codes * len(dates) + date_codes
+    valid = np.isfinite(values)
+    sums = np.zeros((len(columns), shape[0] * shape[1]))
+    counts = np.zeros_like(sums)
+    for i in range(len(columns)):
+        np.add.at(sums[i], flat[valid[:, i]], values[valid[:, i], i])
+        np.add.at(counts[i], flat[valid[:, i]], 1)
+    with np.errstate(invalid='ignore'):
+        matrix = (sums / counts).reshape(len(columns), *shape)
+    region_days = (counts.reshape(len(columns), *shape) > 0).any(axis=0).sum(axis=1)
+
+    box, count, outliers = _box_summary(matrix)
+    all_box, all_count, all_outliers = _box_summary(matrix.reshape(len(columns), 1, -1))
+
+    if 'region_id' in group_keys:
+        first = month_df.drop_duplicates('region_id')
+        names = dict(zip(first['region_id'].astype('int64'), zip(first['province'], first['city'])))
+    regions = []
+    for g, key in enumerate(groups):
+        province, city = names[key] if 'region_id' in group_keys else key
+        entry = {}
+        if 'region_id' in group_keys:
+            entry['region_id'] = int(key)
+        entry.update({'province': province, 'city': city, 'days': int(region_days[g])})
+        for i, col in enumerate(columns):
+            entry[col] = _box_entry(box[i, g], count[i, g], outliers.get((i, g), []))
+        regions.append(entry)
+
+    return {
+        'year': int(year),
+        'month': int(month),
+        'stats': BOX_STATS,
+        'all': {col: _box_entry(all_box[i, 0], all_count[i, 0], all_outliers.get((i, 0), [])) for i, col in enumerate(columns)},
+        'regions': regions,
+    }
+
+def list_year_months(year_path):
+    """
+    列出年份目录下的月份子目录（'01'...'12'）
+    """
+    return [m for m in sorted(os.listdir(year_path))
+            if os.path.isdir(os.path.join(year_path, m)) and m.isdigit() and m != 'monthly']
 
-    all_monthly_stats = []
-    processed_months = []
+def _file_signature(path, previous=None):
+    """
+    日文件签名：mtime/size 未变时沿用旧签名，否则重新计算 sha1
+    """
+    st = os.stat(path)
+    if previous and previous.get('mtime_ns') == st.st_mtime_ns and previous.get('size') == st.st_size:
+        return previous
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha1': digest}
+
+def registry_signature(regions):
+    """
+    注册表指纹（region_id/省/市 的 sha1）：缓存的日数据带有 region_id，注册表变化后必须完整重算
+    """
+    if regions is None or regions.empty:
+        return ''
+    rows = regions[['region_id', 'province', 'city']].astype(object).values.tolist()
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
 
-    # 处理每个月
-    for month in sorted(os.listdir(year_path)):
-        month_path = os.path.join(year_path, month)
+def _state_paths(year_path, month, state_dir=None):
+    """
+    增量状态：<state_dir>/<year>/YYYYMM.manifest.json（输入日文件签名与注册表指纹）与 YYYYMM.pkl（该月合并后的日数据）。
+    state_dir 默认见 default_state_dir；状态目录可以随时删除，下次运行会完整重算
+    """
+    year = os.path.basename(year_path)
+    state_dir = os.path.join(state_dir or default_state_dir(os.path.dirname(os.path.abspath(year_path))), year)
+    key = f"{year}{month.zfill(2)}"
+    return state_dir, os.path.join(state_dir, f"{key}.manifest.json"), os.path.join(state_dir, f"{key}.pkl")
 
-        if not os.path.isdir(month_path) or not month.isdigit() or month == 'monthly':
-            continue
+def _load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest if manifest.get('version') == MANIFEST_VERSION else None
+    except (OSError, ValueError):
+        return None
 
-        print(f"  Processing month: {month}")
+def process_month(year_path, month, regions=None, incremental=True, state_dir=None):
+    """
+    聚合并保存单个月份的统计，返回 (该月的记录列表, 状态)
 
+    状态：'full' 完整重算；'patched' 只重读变化的日文件（其余日数据来自 state_dir 下的缓存）；
+    'unchanged' 输入日文件未变化，直接跳过（记录列表为空）；'empty' 没有数据
+    """
+    year = os.path.basename(year_path)
+    monthly_dir = os.path.join(year_path, 'monthly')
+    os.makedirs(monthly_dir, exist_ok=True)
+    monthly_filename = f"{year}{month.zfill(2)}_monthly.json"
+    monthly_filepath = os.path.join(monthly_dir, monthly_filename)
+    box_filepath = os.path.join(monthly_dir, f"{year}{month.zfill(2)}_box.json")
+    state_dir, manifest_path, frame_path = _state_paths(year_path, month, state_dir)
+
+    day_files = list_month_day_files(year_path, month)
+    manifest = _load_manifest(manifest_path) if incremental else None
+    registry = registry_signature(regions)
+    if manifest and manifest.get('registry') != registry:
+        print(f"Region registry changed since last run, recomputing {year}-{month}")
+        manifest = None
+    old_days = manifest.get('days', {}) if manifest else {}
+    signatures = {day_key: _file_signature(path, old_days.get(day_key)) for day_key, path in day_files}
+
+    status = 'full'
+    month_df = None
+    if manifest and os.path.exists(frame_path) and os.path.exists(monthly_filepath) and os.path.exists(box_filepath):
+        changed = [d for d in signatures if old_days.get(d, {}).get('sha1') != signatures[d]['sha1']]
+        removed = [d for d in old_days if d not in signatures]
+        if not changed and not removed:
+            if signatures != old_days:
+                # 只有 mtime 变化（内容相同）：更新清单即可
+                _write_state(manifest_path, None, None, signatures, monthly_filename, registry)
+            return [], 'unchanged'
+        try:
+            cached = pd.read_pickle(frame_path)
+            cached = cached.astype({c: object for c in ('province', 'city', 'date') if c in cached.columns})
+            stale = {f"{d[:4]}-{d[4:6]}-{d[6:8]}" for d in changed + removed}
+            fresh = load_month_days([(d, p) for d, p in day_files if d in changed], regions)
+            month_df = pd.concat([cached[~cached['date'].isin(stale)], fresh], ignore_index=True)
+            month_df = month_df.sort_values('date', kind='stable').reset_index(drop=True)
+            status = 'patched'
+            print(f"Patching {year}-{month}: {len(changed)} changed, {len(removed)} removed day(s)")
+        except Exception as e:
+            print(f"Incremental state unusable for {year}-{month} ({e}), recomputing")
+            month_df = None
+
+    if month_df is None:
         # 聚合该月数据
-        month_df = aggregate_monthly_data(year_path, month)
+        month_df = aggregate_monthly_data(year_path, month, regions)
+    if month_df.empty:
+        return [], 'empty'
+    # 缓存前先转为数值，缩小缓存体积
+    for col in NUMERIC_COLUMNS:
+        if col in month_df.columns:
+            month_df[col] = pd.to_numeric(month_df[col], errors='coerce')
 
-        if not month_df.empty:
-            # 计算月度统计
-            monthly_stats = calculate_monthly_stats(month_df, year, month)
+    # 计算月度统计（传入副本，缓存的是未经修改的日数据）
+    monthly_stats = calculate_monthly_stats(month_df.copy(), year, month)
+    if monthly_stats.empty:
+        return [], 'empty'
+
+    # 转换为字典列表
+    stats_dict = monthly_stats.to_dict('records')
+
+    with open(monthly_filepath, 'w', encoding='utf-8') as f:
+        json.dump(stats_dict, f, ensure_ascii=False, indent=2)
+
+    # 箱线图五数概括（每个区域一条 + 全部区域-日样本），紧凑格式
+    with open(box_filepath, 'w', encoding='utf-8') as f:
+        json.dump(calculate_monthly_box(month_df, year, month), f, ensure_ascii=False, separators=(',', ':'))
+
+    _write_state(manifest_path, frame_path, month_df, signatures, monthly_filename, registry)
+    print(f"    Saved monthly stats: {monthly_filename} ({len(stats_dict)} cities, {status})")
+    return stats_dict, status
+
+def _write_state(manifest_path, frame_path, month_df, signatures, output_name, registry=''):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    if frame_path is not None:
+        # 名称列用 category 存储，缓存体积约为原来的 1/5
+        names = {c: 'category' for c in ('province', 'city', 'date') if c in month_df.columns}
+        month_df.astype(names).to_pickle(frame_path)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'output': output_name, 'registry': registry, 'days': signatures},
+                  f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def write_monthly_index(year_path, processed_months):
+    """
+    生成年度月度统计索引 monthly/index.json，并把各月 YYYYMM_box.json 的整体五数概括
+    合并为 monthly/boxplot.json（箱线图只需加载这一个文件）
+    """
+    year = os.path.basename(year_path)
+    monthly_index = {"months": sorted(processed_months)}
+    index_filepath = os.path.join(year_path, 'monthly', "index.json")
 
-            if not monthly_stats.empty:
-                # 保存月度统计数据
-                monthly_filename = f"{year}{month.zfill(2)}_monthly.json"
-                monthly_filepath = os.path.join(monthly_dir, monthly_filename)
+    with open(index_filepath, 'w', encoding='utf-8') as f:
+        json.dump(monthly_index, f, ensure_ascii=False, indent=2)
 
-                # 转换为字典列表
-                stats_dict = monthly_stats.to_dict('records')
+    write_box_summary(year_path, processed_months)
+    print(f"Generated monthly index for year {year} with {len(processed_months)} months")
 
-                with open(monthly_filepath, 'w', encoding='utf-8') as f:
-                    json.dump(stats_dict, f, ensure_ascii=False, indent=2)
+def write_box_summary(year_path, processed_months):
+    """
+    monthly/boxplot.json: {year, stats, months: [{month, <var>: {box, outliers, count}}]}
+    """
+    year = os.path.basename(year_path)
+    months = []
+    for ym in sorted(processed_months):
+        box_path = os.path.join(year_path, 'monthly', f"{ym.replace('-', '')}_box.json")
+        if not os.path.exists(box_path):
+            continue
+        with open(box_path, 'r', encoding='utf-8') as f:
+            box = json.load(f)
+        months.append({'month': box['month'], **box['all']})
+    summary = {'year': int(year), 'stats': BOX_STATS, 'months': months}
+    with open(os.path.join(year_path, 'monthly', 'boxplot.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, separators=(',', ':'))
+
+def process_year_monthly(year_path, incremental=True, state_dir=None):
+    """
+    处理指定年份的所有月份数据；incremental=True 时输入未变化的月份直接跳过（增量状态位于 state_dir）
+    """
+    year = os.path.basename(year_path)
+    print(f"Processing monthly aggregation for year: {year}")
 
-                print(f"    Saved monthly stats: {monthly_filename} ({len(stats_dict)} cities)")
+    all_monthly_stats = []
+    processed_months = []
+    regions = load_region_registry(os.path.dirname(year_path))
 
-                all_monthly_stats.extend(stats_dict)
-                processed_months.append(f"{year}-{month.zfill(2)}")
+    # 处理每个月
+    for month in list_year_months(year_path):
+        print(f"  Processing month: {month}")
+        stats_dict, status = process_month(year_path, month, regions, incremental, state_dir)
+        if status != 'empty':
+            all_monthly_stats.extend(stats_dict)
+            processed_months.append(f"{year}-{month.zfill(2)}")
 
     # 生成年度月度统计索引
     if processed_months:
-        monthly_index = {"months": processed_months}
-        index_filepath = os.path.join(monthly_dir, "index.json")
-
-        with open(index_filepath, 'w', encoding='utf-8') as f:
-            json.dump(monthly_index, f, ensure_ascii=False, indent=2)
-
-        print(f"Generated monthly index for year {year} with {len(processed_months)} months")
+        write_monthly_index(year_path, processed_months)
 
     return len(processed_months), len(all_monthly_stats)
 
@@ -187,8 +566,8 @@ def main():
     """
     data_dir = os.path.dirname(os.path.abspath(__file__))
 
-    # 需要处理的年份
-    years_to_process = [ '2015']
+    # 需要处理的年份（可在命令行传入，如 python monthly_aggregation.py 2013 2014；多年并行见 run_aggregation.py）
+    years_to_process = sys.argv[1:] or ['2015']
 
     total_months = 0
     total_records = 0
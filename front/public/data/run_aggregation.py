@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多年份并行聚合：月度统计按 (年, 月) 分发到进程池，某一年的全部月份完成后立即生成该年的
+monthly/index.json 与年度统计，最后输出吞吐量汇总
+
+用法：
+  python run_aggregation.py 2013-2019            # 年份范围
+  python run_aggregation.py 2013 2015 --workers 8
+  python run_aggregation.py 2016 --skip-yearly
+  python run_aggregation.py 2013-2019 --full     # 忽略增量状态，全部重算
+
+默认增量：输入日文件未变化的月份跳过，只有部分日文件变化的月份只重读这些日文件
+（见 monthly_aggregation.process_month）。增量状态写在 --state-dir（默认仓库 resources/cache/monthly_aggregation），
+不放在 front/public 下，避免被打包进站点；某年没有任何月份变化且年度文件已存在时不重建年度统计
+
+总耗时约等于最慢那一年（受限于进程数），而不是各年份耗时之和
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from monthly_aggregation import default_state_dir, load_region_registry, list_year_months, process_month, write_monthly_index
+from yearly_aggregation import process_year_yearly
+
+def parse_years(tokens):
+    """
+    解析 '2013-2019' / '2013' 形式的年份参数
+    """
+    years = []
+    for token in tokens:
+        if '-' in token:
+            start, end = token.split('-', 1)
+            years.extend(str(y) for y in range(int(start), int(end) + 1))
+        else:
+            years.append(str(int(token)))
+    return sorted(set(years))
+
+def _month_task(year_path, month, regions, incremental=True, state_dir=None):
+    """
+    子进程中执行的单月任务，返回 (year, month, 城市记录数, 日文件数, 状态, 耗时)
+    """
+    t0 = time.perf_counter()
+    month_path = os.path.join(year_path, month)
+    day_count = sum(1 for d in os.listdir(month_path) if d.isdigit())
+    stats, status = process_month(year_path, month, regions, incremental, state_dir)
+    return os.path.basename(year_path), month, len(stats), day_count, status, time.perf_counter() - t0
+
+def _year_task(year_path):
+    t0 = time.perf_counter()
+    records = process_year_yearly(year_path)
+    return os.path.basename(year_path), records, time.perf_counter() - t0
+
+def run(data_dir, years, workers=None, yearly=True, incremental=True, state_dir=None):
+    t_start = time.perf_counter()
+    state_dir = state_dir or default_state_dir(data_dir)
+    regions = load_region_registry(data_dir)
+
+    pending = {}      # year -> 尚未完成的月份集合
+    done_months = {}  # year -> 已生成的 'YYYY-MM'
+    year_paths = {}
+    summary = {'months': 0, 'unchanged': 0, 'patched': 0, 'days': 0, 'records': 0, 'years': 0, 'month_seconds': 0.0}
+    year_changed = {}  # year -> 是否有月份被重算
+    year_started = {}
+    year_finished = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for year in years:
+            year_path = os.path.join(data_dir, year)
+            if not os.path.isdir(year_path):
+                print(f"Year directory not found: {year_path}")
+                continue
+            months = list_year_months(year_path)
+            if not months:
+                print(f"No month directories under {year_path}")
+                continue
+            year_paths[year] = year_path
+            pending[year] = set(months)
+            done_months[year] = []
+            year_started[year] = time.perf_counter()
+            year_changed[year] = False
+            for month in months:
+                fut = pool.submit(_month_task, year_path, month, regions, incremental, state_dir)
+                futures[fut] = ('month', year, month)
+
+        while futures:
+            fut = next(as_completed(futures))
+            kind, year, month = futures.pop(fut)
+            try:
+                result = fut.result()
+            except Exception as e:
+                print(f"error aggregating {year} {kind} {month or ''}: {e}")
+                result = None
+
+            if kind == 'month':
+                pending[year].discard(month)
+                if result is not None:
+                    _, _, records, days, status, seconds = result
+                    summary['month_seconds'] += seconds
+                    if status == 'unchanged':
+                        summary['unchanged'] += 1
+                    elif status != 'empty':
+                        summary['months'] += 1
+                        summary['patched'] += status == 'patched'
+                        summary['days'] += days
+                        summary['records'] += records
+                        year_changed[year] = True
+                    if status != 'empty':
+                        done_months[year].append(f"{year}-{month.zfill(2)}")
+                if not pending[year]:
+                    # 该年全部月份完成：写月度索引并立即提交年度聚合
+                    if done_months[year]:
+                        write_monthly_index(year_paths[year], done_months[year])
+                        yearly_file = os.path.join(year_paths[year], 'yearly', f"{year}_yearly.json")
+                        if yearly and (year_changed[year] or not os.path.exists(yearly_file)):
+                            yf = pool.submit(_year_task, year_paths[year])
+                            futures[yf] = ('year', year, None)
+                            continue
+                    year_finished[year] = time.perf_counter()
+            else:
+                if result is not None:
+                    summary['years'] += 1
+                year_finished[year] = time.perf_counter()
+
+    elapsed = time.perf_counter() - t_start
+    print()
+    print("=" * 50)
+    print("Aggregation summary")
+    for year in sorted(year_finished):
+        print(f"  {year}: {len(done_months.get(year, []))} months, finished at {year_finished[year] - t_start:.1f}s")
+    print(f"  months rebuilt: {summary['months']} (patched {summary['patched']}, unchanged {summary['unchanged']})  "
+          f"yearly files: {summary['years']}  day files: {summary['days']}  city-month records: {summary['records']}")
+    if elapsed > 0:
+        print(f"  wall time: {elapsed:.1f}s  (sum of month task time {summary['month_seconds']:.1f}s, "
+              f"speed-up {summary['month_seconds'] / elapsed:.1f}x)")
+        print(f"  throughput: {summary['days'] / elapsed:.1f} day files/s, {summary['months'] / elapsed * 60:.1f} months/min")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='parallel monthly + yearly aggregation over a year range')
+    parser.add_argument('years', nargs='+', help="years or ranges, e.g. 2013-2019 or 2013 2015")
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: CPU count)')
+    parser.add_argument('--skip-yearly', action='store_true', help='only build monthly files')
+    parser.add_argument('--full', action='store_true', help='ignore incremental state and recompute every month')
+    parser.add_argument('--data-dir', default=os.path.dirname(os.path.abspath(__file__)),
+                        help='directory containing <year>/<mm>/<dd>/YYYYMMDD.json (default: this folder)')
+    parser.add_argument('--state-dir', help='incremental state cache, kept out of front/public '
+                                            '(default: <repo>/resources/cache/monthly_aggregation)')
+    args = parser.parse_args()
+
+    years = parse_years(args.years)
+    print(f"Aggregating years {', '.join(years)} with {args.workers or os.cpu_count()} workers")
+    summary = run(args.data_dir, years, workers=args.workers, yearly=not args.skip_yearly, incremental=not args.full,
+                  state_dir=args.state_dir)
+    sys.exit(0 if summary['months'] or summary['unchanged'] else 1)
+
+if __name__ == "__main__":
+    main()
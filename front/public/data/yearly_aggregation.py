@@ -5,12 +5,12 @@
 """
 
 import os
+import sys
 import json
 import pandas as pd
-from datetime import datetime
-import glob
-from collections import defaultdict
-import numpy as np
+
+from monthly_aggregation import (load_region_registry, attach_region_ids, region_group_keys,
+                                 merge_moments, moments_from_summary, finalize_moments)
 
 def load_monthly_data(json_file_path):
     """
@@ -24,7 +24,7 @@ def load_monthly_data(json_file_path):
         print(f"Error loading {json_file_path}: {e}")
         return pd.DataFrame()
 
-def aggregate_yearly_data(year_path):
+def aggregate_yearly_data(year_path, regions=None):
     """
     聚合指定年份的所有月度数据
     """
@@ -76,73 +76,70 @@ def aggregate_yearly_data(year_path):
 
     # 合并该年的所有月度数据
     year_df = pd.concat(yearly_data, ignore_index=True)
+    if regions is not None:
+        # 旧的月度文件没有 region_id，按省市名称补齐；新文件已带 region_id，直接沿用
+        year_df = attach_region_ids(year_df, regions)
     print(f"Combined {len(yearly_data)} months of data, total {len(year_df)} records")
 
     return year_df
 
 def calculate_yearly_stats(year_df, year):
     """
-    计算年度统计指标
+    计算年度统计指标：合并各月的可合并矩（count/sum/sumsq/min/max），
+    年度均值、标准差为所有日值上的精确结果（不是月均值的均值/标准差）。
+    旧的月度文件没有 _sum/_sumsq 时由 _mean/_std/_count 还原
     """
     if year_df.empty:
         return pd.DataFrame()
 
-    # 数值统计字段
-    stat_columns = ['mean', 'max', 'min', 'std', 'count', 'missing']
     # 基础指标
     base_metrics = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+    metrics = [m for m in base_metrics if f'{m}_mean' in year_df.columns]
+
+    group_keys = region_group_keys(year_df)
+    year_df = moments_from_summary(year_df, metrics)
+    for metric in metrics:
+        year_df[f'{metric}_count'] = pd.to_numeric(year_df[f'{metric}_count'], errors='coerce').fillna(0)
+        year_df[f'{metric}_missing'] = pd.to_numeric(year_df.get(f'{metric}_missing', 0), errors='coerce').fillna(0)
+
+    # 按region_id（或province和city）合并矩，O(行数)
+    merged = finalize_moments(merge_moments(year_df, group_keys, metrics), metrics)
+    grouped = year_df.groupby(group_keys, sort=True)
+    info = grouped.agg(province=('province', 'first'), city=('city', 'first'),
+                       total_months=('month', 'nunique'), total_records=('month', 'size')).reset_index()
+    missing = grouped[[f'{m}_missing' for m in metrics]].sum().reset_index()
+    merged = info.merge(merged, on=group_keys).merge(missing, on=group_keys)
 
-    # 按province和city分组计算年度统计
     grouped_stats = []
-
-    for (province, city), group in year_df.groupby(['province', 'city']):
-        stat_record = {
-            'province': province,
-            'city': city,
+    for row in merged.to_dict('records'):
+        stat_record = {}
+        if 'region_id' in group_keys:
+            stat_record['region_id'] = int(row['region_id'])
+        stat_record.update({
+            'province': row['province'],
+            'city': row['city'],
             'year': int(year),
-            'total_months': len(group['month'].unique()),  # 该年有多少个月有数据
-            'total_records': len(group),  # 该年的总记录数
-            'data_completeness': round(len(group['month'].unique()) / 12 * 100, 2)  # 数据完整性百分比
-        }
+            'total_months': int(row['total_months']),  # 该年有多少个月有数据
+            'total_records': int(row['total_records']),  # 该年的总记录数
+            'data_completeness': round(int(row['total_months']) / 12 * 100, 2)  # 数据完整性百分比
+        })
 
-        # 计算每个基础指标的年度统计
         for metric in base_metrics:
-            # 收集该指标的月度统计值
-            monthly_values = {}
-
-            for stat in stat_columns:
-                col_name = f'{metric}_{stat}'
-                if col_name in group.columns:
-                    values = group[col_name].dropna()
-                    if not values.empty:
-                        monthly_values[stat] = values.tolist()
-                    else:
-                        monthly_values[stat] = []
-
-            # 计算年度统计
-            if monthly_values.get('mean'):
-                # 年度平均值：各月平均值的平均
-                stat_record[f'{metric}_yearly_mean'] = round(float(np.mean(monthly_values['mean'])), 6)
-
-                # 年度最大值：各月最大值中的最大值
-                if monthly_values.get('max'):
-                    stat_record[f'{metric}_yearly_max'] = round(float(np.max(monthly_values['max'])), 6)
-
-                # 年度最小值：各月最小值中的最小值
-                if monthly_values.get('min'):
-                    stat_record[f'{metric}_yearly_min'] = round(float(np.min(monthly_values['min'])), 6)
-
-                # 年度标准差：基于月度平均值的标准差
-                if len(monthly_values['mean']) > 1:
-                    stat_record[f'{metric}_yearly_std'] = round(float(np.std(monthly_values['mean'])), 6)
-                else:
-                    stat_record[f'{metric}_yearly_std'] = 0
-
-                # 数据质量统计
-                stat_record[f'{metric}_total_count'] = int(np.sum(monthly_values.get('count', [0])))
-                stat_record[f'{metric}_total_missing'] = int(np.sum(monthly_values.get('missing', [0])))
-                stat_record[f'{metric}_data_quality'] = round(stat_record[f'{metric}_total_count'] /
-                    (stat_record[f'{metric}_total_count'] + stat_record[f'{metric}_total_missing']) * 100, 2)
+            count = int(row.get(f'{metric}_count', 0) or 0)
+            if count > 0:
+                total_missing = int(row[f'{metric}_missing'])
+                stat_record.update({
+                    f'{metric}_yearly_mean': round(float(row[f'{metric}_mean']), 6),
+                    f'{metric}_yearly_max': round(float(row[f'{metric}_max']), 6),
+                    f'{metric}_yearly_min': round(float(row[f'{metric}_min']), 6),
+                    f'{metric}_yearly_std': round(float(row[f'{metric}_std']), 6),
+                    f'{metric}_total_count': count,
+                    f'{metric}_total_missing': total_missing,
+                    f'{metric}_data_quality': round(count / (count + total_missing) * 100, 2),
+                    # 可合并的矩，供多年汇总使用
+                    f'{metric}_yearly_sum': round(float(row[f'{metric}_sum']), 6),
+                    f'{metric}_yearly_sumsq': round(float(row[f'{metric}_sumsq']), 6)
+                })
             else:
                 # 如果没有数据，设置为空值
                 stat_record.update({
@@ -151,8 +148,10 @@ def calculate_yearly_stats(year_df, year):
                     f'{metric}_yearly_min': None,
                     f'{metric}_yearly_std': None,
                     f'{metric}_total_count': 0,
-                    f'{metric}_total_missing': len(group) * 31,  # 假设每月31天
-                    f'{metric}_data_quality': 0
+                    f'{metric}_total_missing': int(row['total_records']) * 31,  # 假设每月31天
+                    f'{metric}_data_quality': 0,
+                    f'{metric}_yearly_sum': None,
+                    f'{metric}_yearly_sumsq': None
                 })
 
         grouped_stats.append(stat_record)
@@ -167,7 +166,8 @@ def process_year_yearly(year_path):
     print(f"Processing yearly aggregation for year: {year}")
 
     # 聚合该年所有月度数据
-    year_df = aggregate_yearly_data(year_path)
+    regions = load_region_registry(os.path.dirname(year_path))
+    year_df = aggregate_yearly_data(year_path, regions)
 
     if year_df.empty:
         print(f"No data to aggregate for year {year}")
@@ -204,8 +204,8 @@ def main():
     """
     data_dir = os.path.dirname(os.path.abspath(__file__))
 
-    # 需要处理的年份
-    years_to_process = [ '2015']
+    # 需要处理的年份（可在命令行传入，如 python yearly_aggregation.py 2013 2014；多年并行见 run_aggregation.py）
+    years_to_process = sys.argv[1:] or ['2015']
 
     total_records = 0
 
@@ -630,6 +630,60 @@ export async function loadMonthlyIndex(year) {
   }
 }
 
+// 加载月度箱线图五数概括（monthly/boxplot.json，由 monthly_aggregation.py 生成）
+// 返回 { year, stats: ['min','q1','median','q3','max'], months: [{ month, pm25: { box, outliers, count }, ... }] }
+export async function loadMonthlyBoxSummary(year) {
+  try {
+    const res = await fetch(`/data/${year}/monthly/boxplot.json`);
+    if (!res.ok) throw new Error(`Failed to load box summary for ${year}`);
+    return await res.json();
+  } catch (err) {
+    console.warn(`Monthly box summary missing for ${year}:`, err);
+    return null;
+  }
+}
+
+// 从 boxplot.json 中取某个指标的逐月五数概括，供 MonthlyBoxPlot 直接绘制
+// 返回 [{ month, box: [min, q1, median, q3, max] | null, outliers: [...], count }]
+export function monthlyBoxSeries(summary, metric = "pm25") {
+  if (!summary || !Array.isArray(summary.months)) return [];
+  return summary.months
+    .filter((entry) => entry[metric])
+    .map((entry) => ({ month: entry.month, ...entry[metric] }));
+}
+
+// boxplot.json 缺失时（旧数据未重新运行 monthly_aggregation.py）的回退：
+// 用 12 个月的城市月均值在前端计算五数概括与离群值，返回与 monthlyBoxSeries 相同的结构
+// 分位数按下标取值（与原 MonthlyBoxPlot 的算法一致），离群值为 [Q1 - 1.5*IQR, Q3 + 1.5*IQR] 之外的值
+export function computeMonthlyBoxSeries(monthlyEntries, metric = "pm25") {
+  const monthlyValues = Array.from({ length: 12 }, () => []);
+  for (const item of computeMonthlyBoxDataForView(monthlyEntries, metric)) {
+    const month = item.month - 1;
+    if (month >= 0 && month < 12) monthlyValues[month].push(item[metric]);
+  }
+
+  const result = [];
+  monthlyValues.forEach((values, index) => {
+    if (values.length === 0) return;
+    const sorted = [...values].sort((a, b) => a - b);
+    const min = sorted[0];
+    const max = sorted[sorted.length - 1];
+    const median = sorted[Math.floor(sorted.length / 2)];
+    const q1 = sorted[Math.floor(sorted.length / 4)];
+    const q3 = sorted[Math.floor((3 * sorted.length) / 4)];
+    const iqr = q3 - q1;
+    const lowerFence = q1 - 1.5 * iqr;
+    const upperFence = q3 + 1.5 * iqr;
+    result.push({
+      month: index + 1,
+      box: [min, q1, median, q3, max],
+      outliers: values.filter((v) => v < lowerFence || v > upperFence),
+      count: values.length,
+    });
+  });
+  return result;
+}
+
 export function classifyLevels(rows, field) {
   const buckets = [
     { name: "优", min: 0, max: 35 },
@@ -701,55 +755,6 @@ export function computeRadialVectorByMonthly(monthlyRows) {
   return values;
 }
 
-// 月视图箱线图数据计算函数
-// export function computeMonthlyBoxDataForView(monthlyEntries, metric = "pm25") {
-//   const result = [];
-
-//   // monthlyEntries: [{ month: 1, data: [...] }, ...]
-//   for (let month = 1; month <= 12; month++) {
-//     const monthEntry = monthlyEntries.find(entry => entry.month === month);
-//     const values = [];
-
-//     if (monthEntry && monthEntry.data) {
-//       // 从月聚合数据中收集该月的指标值
-//       for (const row of monthEntry.data) {
-//         const value = Number(row[`${metric}_mean`] ?? 0);
-//         if (!Number.isNaN(value) && value > 0) {
-//           values.push(value);
-//         }
-//       }
-//     }
-
-//     if (values.length === 0) {
-//       result.push({
-//         month,
-//         [metric]: 0,
-//         [`${metric}_mean`]: 0
-//       });
-//       continue;
-//     }
-
-//     // 计算箱线图统计值
-//     const sorted = values.sort((a, b) => a - b);
-//     const min = sorted[0];
-//     const max = sorted[sorted.length - 1];
-//     const median = sorted[Math.floor(sorted.length / 2)];
-
-//     const q1Index = Math.floor(sorted.length / 4);
-//     const q3Index = Math.floor((3 * sorted.length) / 4);
-//     const q1 = sorted[q1Index];
-//     const q3 = sorted[q3Index];
-
-//     result.push({
-//       month,
-//       [metric]: median, // MonthlyBoxPlot组件会使用这个字段
-//       [`${metric}_mean`]: median
-//     });
-//   }
-
-//   return result;
-// }
-
 export function computeTrendSeries(dayEntries, field) {
   // dayEntries: [{ date, data }]
   return dayEntries.map((entry) => ({
@@ -1389,72 +1394,6 @@ export function computeMonthlyRingMonthly(monthlyEntries) {
   return out;
 }
 
-// 计算月度箱线图数据
-export function computeMonthlyBoxData(dayEntries, metric = "pm25") {
-  // 按月份分组数据
-  const monthlyData = new Map();
-
-  for (const entry of dayEntries) {
-    const parts = parseDateParts(entry.date);
-    if (!parts) continue;
-
-    const month = parts.month;
-    if (!monthlyData.has(month)) {
-      monthlyData.set(month, []);
-    }
-
-    // 收集该月的指标数据
-    for (const row of entry.data) {
-      const value = getValueFromRow(row, metric, "day");
-      if (Number.isFinite(value) && value > 0) {
-        monthlyData.get(month).push(value);
-      }
-    }
-  }
-
-  // 计算每个月的箱线图数据
-  const result = [];
-  const months = Array.from(monthlyData.keys()).sort((a, b) => a - b);
-
-  for (const month of months) {
-    const values = monthlyData.get(month);
-    if (values.length === 0) {
-      result.push({
-        month,
-        min: 0,
-        q1: 0,
-        median: 0,
-        q3: 0,
-        max: 0,
-        count: 0
-      });
-      continue;
-    }
-
-    const sorted = values.sort((a, b) => a - b);
-    const min = sorted[0];
-    const max = sorted[sorted.length - 1];
-    const median = sorted[Math.floor(sorted.length / 2)];
-
-    const q1Index = Math.floor(sorted.length / 4);
-    const q3Index = Math.floor((3 * sorted.length) / 4);
-    const q1 = sorted[q1Index];
-    const q3 = sorted[q3Index];
-
-    result.push({
-      month,
-      min: Number(min.toFixed(2)),
-      q1: Number(q1.toFixed(2)),
-      median: Number(median.toFixed(2)),
-      q3: Number(q3.toFixed(2)),
-      max: Number(max.toFixed(2)),
-      count: values.length
-    });
-  }
-
-  return result;
-}
-
 // Province-level monthly pollutant grid for ring view.
 export function computeMonthlyRingGrid(dayEntries, pollutant = "pm25", orderNames = [], topN = 12) {
   const months = Array.from({ length: 12 }, (_, i) => i + 1);
@@ -2001,9 +1940,9 @@ export function matchGeoName(dataName, geoNames) {
 
 
 // ==========================================
-// 【新增】: 月度视图专用 - 箱线图数据计算
+// 【新增】: 月度视图专用 - 箱线图原始数据
 // 说明：返回该月所有城市的具体数值列表，而不是计算好的均值/中位数。
-// 组件 MonthlyBoxPlot 会接收这些原始数据并在前端计算 min/Q1/median/Q3/max。
+// boxplot.json 缺失时由 computeMonthlyBoxSeries 在前端计算 min/Q1/median/Q3/max。
 // ==========================================
 export function computeMonthlyBoxDataForView(monthlyEntries, metric = "pm25") {
   const result = [];
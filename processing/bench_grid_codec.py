@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+qgrid 编码的往返误差检查与体积/耗时基准
+
+用法（在 processing/ 下运行）：
+  python bench_grid_codec.py                 # 339x432 合成网格
+  python bench_grid_codec.py --file <day.json> # 使用一份 --no-mapping 输出的网格 JSON
+
+检查每个变量解码后的最大绝对误差不超过头中记录的 max_error（scale / 2），
+并对比与现有 JSON（数值转字符串）输出的体积和读写耗时。误差超限时返回非零退出码。
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from src.config import VAR_BOUNDS
+from src.gridcodec import write_qgrid, read_qgrid
+
+GRID_SHAPE = (339, 432)
+VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+
+
+def synthetic_grid(shape=GRID_SHAPE, seed=0, nan_frac=0.02):
+    """生成落在 VAR_BOUNDS 内、带少量缺测的平滑随机场"""
+    rng = np.random.default_rng(seed)
+    ny, nx = shape
+    lat, lon = np.meshgrid(np.linspace(15, 55, ny), np.linspace(70, 140, nx), indexing='ij')
+    df = pd.DataFrame({'lat': lat.ravel(), 'lon': lon.ravel()})
+    for v in VARS:
+        lo, hi = VAR_BOUNDS.get(v, (-20.0, 20.0))
+        field = np.sin(lat / 7.0) * np.cos(lon / 11.0) + 0.3 * rng.standard_normal(lat.shape)
+        field = lo + (field - field.min()) / (field.max() - field.min()) * (hi - lo) * 0.6
+        field[rng.random(lat.shape) < nan_frac] = np.nan
+        df[v] = field.ravel().astype(np.float32)
+    return df
+
+
+def legacy_json_bytes(df):
+    """与 _save_df_by_year_granularity 相同的 JSON 写法（数值转字符串，每行一个对象）"""
+    save_df = df.copy()
+    for col in save_df.columns:
+        save_df[col] = save_df[col].astype(str)
+    records = save_df.to_dict('records')
+    lines = [json.dumps(r, ensure_ascii=False) for r in records]
+    return ('[\n  ' + ',\n  '.join(lines) + '\n]\n').encode('utf-8')
+
+
+def run(df, shape):
+    values = {c: df[c].to_numpy(dtype=float) for c in df.columns if c not in ('lat', 'lon')}
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        header_path = write_qgrid(os.path.join(tmp, 'day', '20130101'), values, shape,
+                                  coords=(df['lat'].to_numpy(), df['lon'].to_numpy()), dataset_dir=tmp)
+        t_write = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        decoded, header = read_qgrid(header_path)
+        t_read = time.perf_counter() - t0
+        day_bytes = os.path.getsize(header_path) + os.path.getsize(os.path.join(os.path.dirname(header_path), header['bin']))
+        coords_bytes = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp) if f.startswith('coords'))
+        with open(os.path.join(os.path.dirname(header_path), header['bin']), 'rb') as f:
+            day_gz = len(gzip.compress(f.read()))
+
+    ok = True
+    print(f"{'var':<6}{'max_err':>14}{'bound':>14}{'valid':>9}")
+    for name, arr in values.items():
+        meta = header['vars'][name]
+        orig_valid = np.isfinite(arr)
+        dec_valid = np.isfinite(decoded[name])
+        err = np.abs(decoded[name][orig_valid].astype(np.float64) - arr[orig_valid]) if orig_valid.any() else np.array([0.0])
+        max_err = float(err.max()) if err.size else 0.0
+        # 解码为 float64，只允许 float64 运算本身的舍入余量
+        tol = meta['max_error'] + 4 * np.spacing(max(abs(meta['offset']), abs(meta['offset'] + meta['scale'] * 65535)))
+        status = max_err <= tol and np.array_equal(orig_valid, dec_valid)
+        ok &= bool(status)
+        print(f"{name:<6}{max_err:>14.6g}{meta['max_error']:>14.6g}{int(dec_valid.sum()):>9}{'' if status else '  FAIL'}")
+
+    t0 = time.perf_counter()
+    legacy = legacy_json_bytes(df)
+    t_json = time.perf_counter() - t0
+    legacy_gz = len(gzip.compress(legacy))
+    print()
+    print(f"cells={len(df)} vars={len(values)}")
+    print(f"legacy JSON : {len(legacy) / 1e6:8.2f} MB  (gzip {legacy_gz / 1e6:.2f} MB)  write {t_json:.2f}s")
+    print(f"qgrid day   : {day_bytes / 1e6:8.2f} MB  (gzip {day_gz / 1e6:.2f} MB)  write {t_write:.3f}s  read {t_read:.3f}s")
+    print(f"qgrid coords: {coords_bytes / 1e6:8.2f} MB  (stored once per dataset)")
+    print(f"ratio       : {len(legacy) / day_bytes:8.1f}x smaller per day")
+    return ok
+
+
+def main():
+    p = argparse.ArgumentParser(description='qgrid round-trip error check and size benchmark')
+    p.add_argument('--file', help='grid-level day JSON produced by extract --no-mapping')
+    p.add_argument('--shape', type=int, nargs=2, default=list(GRID_SHAPE), help='grid shape (ny nx) for --file or synthetic data')
+    args = p.parse_args()
+
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            df = pd.DataFrame(json.load(f)).apply(pd.to_numeric, errors='coerce')
+        shape = tuple(args.shape) if args.shape[0] * args.shape[1] == len(df) else (len(df),)
+    else:
+        shape = tuple(args.shape)
+        df = synthetic_grid(shape)
+
+    ok = run(df, shape)
+    print('\nround-trip: ' + ('OK' if ok else 'FAILED'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,23 +2,58 @@
 
 命令：
   extract   - 读取 ZIP 并生成每天处理的文件
-  aggregate - 将保存的日文件汇总到每月摘要中
+  aggregate - 将保存的日文件汇总到每月摘要中（按月清单增量：输入未变化的月份跳过）
   export    - 将聚合帧转换为 ECharts JSON
+  regions   - 从已有日文件生成/更新行政区注册表（稳定的整数 region_id）
+  store     - 把城市日文件批量导入本地 SQLite 分析库（按 region_id/date 建索引；rolling / rollup / build-products 等在库与日文件一致时直接查库）
+  rollup    - 一次读取日数据，输出周/月/季节/采暖季/年等多粒度汇总
+  rolling   - 按年计算 7/30 天滑动均值、滑动最大值与超标天数
+  climatology - 多年 day-of-year / 月气候态（均值、标准差、百分位）及逐日距平、z 分数
+  build-products - 每年只读一次日数据，生成日历 / 风玫瑰 / 趋势 / 热力图 / 相关矩阵 / 排名与污染类型等可视化产品
+  trends    - 多年城市/省份逐日、逐月趋势写成每层级一个列式文件（按区域、日期排序，附区域偏移索引）
+  centroids - 由行政区多边形计算质心与面积，写入质心表（extract 会补充映射格点的质心与格点数）
+  pyramid   - 由网格级日文件生成多分辨率瓦片金字塔（2x/4x/8x 块平均，量化二进制）
 
 该脚本调用现有的“src”模块，因此逻辑仍然存在
 在库代码中实现，“run_pipeline.py”充当瘦运行器。
 """
 import argparse
 import os
+import time
 import glob
 import pandas as pd
 
-from src.config import BASE_PATH, PROCESSED_DIR, AGGREGATED_DIR, OUTPUT_DIR, RESOURCE_DIR
+from src.config import CENTROID_TABLE_PATH, CLIMATOLOGY_DOY_WINDOW, TRENDS_DIR, ROLLING_WINDOWS, BASE_PATH, PROCESSED_DIR, AGGREGATED_DIR, OUTPUT_DIR, RESOURCE_DIR, DAY_ROOTS
 from src.preprocess import process_zips_parallel
-from src.aggregate import aggregate_month_from_saved_days
+from src.regions import build_registry_from_frames
+from src.centroids import load_centroids, polygon_centroids, update_centroids
+from src.store import load_days, connect as connect_store
+from src.rollup import DEFAULT_GRANULARITIES, PERIOD_LABELERS, load_days_for_rollup, rollup, write_rollups
+from src.rolling import build_year_rolling, load_year_days
+from src.climatology import build_climatology
+from src.products import PRODUCT_BUILDERS, build_products
+from src.trendstore import TREND_FREQS, TREND_LEVELS, TrendStore, benchmark_lookup, build_trend_stores
+from src.pyramid import build_year_pyramid, DEFAULT_TILE_SIZE
+from src.aggregate import (aggregate_month_diurnal, aggregate_month_from_saved_days, month_is_current,
+                           month_manifest, save_month_manifest)
+from src.dayreader import discover_days
 from src.visualize import convert_to_echarts_format
 
 
+def _default_admin_geojson():
+    # 如果用户未指定 admin geojson，则优先使用中国_市.pretty.json，其次尝试 GADM 文件
+    candidate1 = os.path.join(RESOURCE_DIR, '中国_市.pretty.json')
+    if os.path.exists(candidate1):
+        print(f"Using default admin geojson: {candidate1}")
+        return candidate1
+    # 回退到 GADM 文件（保持兼容性）
+    candidate2 = os.path.join(RESOURCE_DIR, 'GADM', 'gadm41_CHN_2.json')
+    if os.path.exists(candidate2):
+        print(f"Using fallback admin geojson: {candidate2}")
+        return candidate2
+    return None
+
+
 def cmd_extract(args):
     # 智能选择 base path：优先使用命令行传入的 --base-path；
     # 否则，如果存在 BASE_PATH/<year> 且包含 zip，则优先使用该目录；
@@ -39,27 +74,23 @@ def cmd_extract(args):
                 print(f"Found zip(s) for year {args.year} under {BASE_PATH}; using base={base}")
 
     print(f"Extracting zips from {base} for year {args.year} -> granularity={args.granularity}")
-    print(f"Output format: JSON (no_mapping={getattr(args, 'no_mapping', False)})")
+    out_format = 'qgrid' if getattr(args, 'no_mapping', False) and getattr(args, 'grid_format', 'json') == 'qgrid' else 'JSON'
+    print(f"Output format: {out_format} (no_mapping={getattr(args, 'no_mapping', False)})")
 
-    # 如果用户未指定 admin geojson，则优先使用中国_市.pretty.json，其次尝试 GADM 文件
     admin_geo = args.admin_geojson
     if not admin_geo and not getattr(args, 'no_mapping', False):
-        # 优先使用中国_市.pretty.json
-        candidate1 = os.path.join(RESOURCE_DIR, '中国_市.pretty.json')
-        if os.path.exists(candidate1):
-            admin_geo = candidate1
-            print(f"Using default admin geojson: {admin_geo}")
-        else:
-            # 回退到 GADM 文件（保持兼容性）
-            candidate2 = os.path.join(RESOURCE_DIR, 'GADM', 'gadm41_CHN_2.json')
-            if os.path.exists(candidate2):
-                admin_geo = candidate2
-                print(f"Using fallback admin geojson: {admin_geo}")
+        admin_geo = _default_admin_geojson()
 
     saved, failed = process_zips_parallel(base, args.year, granularity=args.granularity,
                                           admin_geojson=admin_geo, workers=args.workers,
                                           aggregate_mean=args.aggregate_mean,
-                                          no_mapping=getattr(args, 'no_mapping', False))
+                                          no_mapping=getattr(args, 'no_mapping', False),
+                                          region_ids_only=getattr(args, 'region_ids_only', False),
+                                          grid_format=getattr(args, 'grid_format', 'json'),
+                                          with_aqi=getattr(args, 'with_aqi', False),
+                                          extremes=getattr(args, 'extremes', False),
+                                          diurnal=getattr(args, 'diurnal', False),
+                                          wind_rose=getattr(args, 'wind_rose', False))
     print(f"done: saved={len(saved)} failed={len(failed)}")
 
 
@@ -69,27 +100,32 @@ def cmd_aggregate(args):
     os.makedirs(outdir, exist_ok=True)
     print(f"Aggregating from {processed_root} year={args.year} -> {outdir}")
 
-    # 快速检查：processed_root 下是否有今年处理日的 CSV？
-    # 使用递归 glob，因此我们接受多个目录约定（例如processed/<粒度>/2013/...）
-    pattern = os.path.join(processed_root, '**', str(args.year), '**', '*.csv')
-    matches = glob.glob(pattern, recursive=True)
-    if not matches:
-        print(f"No processed-day CSVs found for year {args.year} under {processed_root}.")
+    # 快速检查：processed_root 下是否有今年处理日的文件（任意格式，见 src/dayreader.py）
+    if not discover_days(processed_root, args.year):
+        print(f"No processed-day files found for year {args.year} under {processed_root}.")
         print("Skipping monthly aggregation. If you have day files elsewhere, pass --processed-root to point to them.")
         return
 
     monthly = []
+    unchanged = 0
     for month in range(1, 13):
         month_dir = os.path.join(processed_root, str(args.year), f"{month:02d}")
+        # 输入日文件（及注册表）与上次一致的月份直接跳过，不再重读日文件
+        manifest = month_manifest(args.year, month, month_dir) if os.path.isdir(month_dir) else None
+        if manifest and not args.force and month_is_current(args.year, month, outdir, manifest):
+            unchanged += 1
+            continue
         try:
             month_df = aggregate_month_from_saved_days(args.year, month, month_dir, output_dir=outdir)
             monthly.append(month_df)
+            aggregate_month_diurnal(args.year, month, month_dir, output_dir=outdir)
+            save_month_manifest(args.year, month, outdir, manifest)
         except FileNotFoundError:
             # 月份没有文件；默默地继续（我们已经检查了一些文件总体是否存在）
             continue
         except Exception as e:
             print(f"error aggregating month {month:02d}: {e}")
-    print(f"aggregated months: {len(monthly)}")
+    print(f"aggregated months: {len(monthly)} (unchanged, skipped: {unchanged})")
 
 
 def cmd_export(args):
@@ -136,6 +172,151 @@ def cmd_export(args):
     convert_to_echarts_format(combined, output_dir=out)
 
 
+def _iter_day_name_frames(roots, years=None):
+    """逐个读取日文件中的省市名称列（只保留 province/city，用于构建注册表）。"""
+    for root in roots:
+        year_dirs = [os.path.join(root, str(y)) for y in years] if years else sorted(glob.glob(os.path.join(root, '[0-9]' * 4)))
+        for yd in year_dirs:
+            files = sorted(glob.glob(os.path.join(yd, '**', '[0-9]' * 8 + '.*'), recursive=True))
+            for f in files:
+                try:
+                    if f.endswith('.json'):
+                        df = pd.read_json(f, dtype=False)
+                    elif f.endswith('.parquet'):
+                        df = pd.read_parquet(f, columns=['province', 'city'])
+                    elif f.endswith('.csv'):
+                        df = pd.read_csv(f, usecols=['province', 'city'], dtype=str)
+                    else:
+                        continue
+                except Exception as e:
+                    print(f"warning: failed reading {f}: {e}")
+                    continue
+                yield df[[c for c in ('province', 'city') if c in df.columns]]
+
+
+def cmd_regions(args):
+    roots = args.data_root or DAY_ROOTS
+    roots = [r for r in roots if os.path.isdir(r)]
+    print(f"Building region registry from {roots} years={args.years or 'all'}")
+    registry = build_registry_from_frames(_iter_day_name_frames(roots, args.years), path=args.output)
+    missing = int(registry.to_frame()['lon'].isna().sum())
+    path = registry.save()
+    print(f"region registry: {len(registry)} regions -> {path} (without centroid: {missing})")
+
+
+def cmd_store(args):
+    roots = args.data_root or DAY_ROOTS
+    print(f"Loading city-day files from {roots} years={args.years or 'all'} into analytical store")
+    t0 = time.time()
+    stats = load_days(roots, years=args.years, db_path=args.db, force=args.force, register_new=args.register_new)
+    conn = connect_store(args.db)
+    total, days = conn.execute('SELECT COUNT(*), COUNT(DISTINCT date) FROM city_days').fetchone()
+    conn.close()
+    print(f"store: loaded files={stats['files']} rows={stats['rows']} skipped={stats['skipped']} "
+          f"removed days={stats['removed']} "
+          f"elapsed={time.time() - t0:.1f}s; total rows={total} days={days}")
+
+
+def cmd_rollup(args):
+    roots = args.data_root or DAY_ROOTS
+    out_dir = args.output_dir
+    print(f"Rolling up {roots} years={args.years} -> {', '.join(args.granularities)}")
+    t0 = time.time()
+    days = load_days_for_rollup(args.years, roots)
+    if days.empty:
+        print("No day files found; nothing to roll up.")
+        return
+    t_read = time.time() - t0
+    results = rollup(days, args.granularities)
+    t_agg = time.time() - t0 - t_read
+    index = write_rollups(results, out_dir)
+    counts = ', '.join(f"{g}={len(index.get(g, []))}" for g in args.granularities)
+    print(f"rollup done: rows={len(days)} periods: {counts} "
+          f"(read {t_read:.1f}s, aggregate {t_agg:.2f}s, total {time.time() - t0:.1f}s)")
+
+
+def cmd_rolling(args):
+    windows = sorted(set(args.windows))
+    for year in args.years:
+        t0 = time.time()
+        days = load_year_days(year, lead_days=windows[-1] - 1, roots=args.data_root)
+        if days.empty:
+            print(f"{year}: no day files found, skipped")
+            continue
+        path = build_year_rolling(year, days, windows, out_dir=args.output_dir, region_json=args.region_json)
+        print(f"{year}: rolling windows {windows} -> {path} ({time.time() - t0:.1f}s)")
+
+
+def cmd_climatology(args):
+    years = sorted(set(args.years))
+    print(f"Building climatology over {years[0]}-{years[-1]} ({len(years)} years)")
+    t0 = time.time()
+    result = build_climatology(years, roots=args.data_root, out_dir=args.output_dir,
+                               anomaly_years=args.anomaly_years, window=args.window, force=args.force)
+    built = [y for y, s in result['years'].items() if s == 'built']
+    cached = [y for y, s in result['years'].items() if s == 'cached']
+    print(f"climatology done: rebuilt years {built or '-'}, cached {cached or '-'}, "
+          f"anomaly days {result['anomaly_days']} ({time.time() - t0:.1f}s)")
+
+
+def cmd_build_products(args):
+    roots = args.data_root or DAY_ROOTS
+    out = args.output_dir or OUTPUT_DIR
+    products = args.products or list(PRODUCT_BUILDERS)
+    print(f"Building products {products} for years {args.years} -> {out}")
+    t0 = time.time()
+    options = {}
+    if args.corr_lags:
+        options['correlation'] = {'lags': args.corr_lags}
+    if args.heatmap_binary:
+        options['heatmap'] = {'binary_periods': ('day',)}
+    totals = build_products(args.years, products, roots=roots, out_dir=out, options=options)
+    print(f"build-products done: {totals} ({time.time() - t0:.1f}s)")
+
+
+def cmd_trends(args):
+    roots = args.data_root or DAY_ROOTS
+    out = args.output_dir or TRENDS_DIR
+    print(f"Building trend stores for years {args.years} -> {out}")
+    t0 = time.time()
+    written = build_trend_stores(args.years, roots=roots, out_dir=out, levels=args.levels or TREND_LEVELS,
+                                 freqs=args.freqs or TREND_FREQS)
+    print(f"trends: {len(written)} stores ({time.time() - t0:.1f}s)")
+    for name, path in written.items():
+        t1 = time.perf_counter()
+        store = TrendStore(path)
+        opened = (time.perf_counter() - t1) * 1e3
+        line = f"  {name}: regions={len(store)} rows={store.index['rows']} open={opened:.1f}ms"
+        if args.benchmark:
+            bench = benchmark_lookup(store, n=args.benchmark)
+            line += (f" lookup n={bench['lookups']} slice mean={bench['slice_mean_ms']:.3f}ms"
+                     f" series mean={bench['series_mean_ms']:.3f}ms max={bench['series_max_ms']:.3f}ms")
+        print(line + f" -> {path}")
+
+
+def cmd_centroids(args):
+    admin_geo = args.admin_geojson or _default_admin_geojson()
+    if not admin_geo or not os.path.exists(admin_geo):
+        print("No admin geojson found; pass --admin-geojson")
+        return
+    t0 = time.time()
+    polygons = polygon_centroids(admin_geo)
+    path = update_centroids(polygons, args.output) or (args.output or CENTROID_TABLE_PATH)
+    table = load_centroids(path)
+    print(f"centroids: {len(polygons)} regions from polygons ({time.time() - t0:.1f}s) -> {path}; "
+          f"table rows={len(table)} by source={table['source'].value_counts().to_dict()}")
+
+
+def cmd_pyramid(args):
+    grid_root = args.grid_root or os.path.join(PROCESSED_DIR, 'grid')
+    out_root = args.output_dir or os.path.join(OUTPUT_DIR, 'pyramid')
+    print(f"Building tile pyramid from {grid_root} year={args.year} -> {out_root}")
+    t0 = time.time()
+    n = build_year_pyramid(args.year, grid_root=grid_root, out_root=out_root, variables=args.vars,
+                           factors=args.factors, tile_size=args.tile_size, batch_days=args.batch_days)
+    print(f"pyramid done: days={n} elapsed={time.time() - t0:.1f}s")
+
+
 def main():
     p = argparse.ArgumentParser(prog='run_pipeline', description='Run pipeline steps: extract, aggregate, export')
     sp = p.add_subparsers(dest='cmd')
@@ -148,12 +329,19 @@ def main():
     e.add_argument('--workers', type=int, default=4)
     e.add_argument('--aggregate-mean', action='store_true', help='use quick aggregate_mean in preprocessing')
     e.add_argument('--no-mapping', action='store_true', help='skip admin mapping and save raw grid data (filtered to China bounds)')
+    e.add_argument('--region-ids-only', action='store_true', help='write integer region_id instead of province/city names in day files')
+    e.add_argument('--grid-format', choices=['json', 'qgrid'], default='json', help='grid-level (--no-mapping) output format; qgrid = quantized uint16 binary + JSON header')
+    e.add_argument('--with-aqi', action='store_true', help='add precomputed aqi / aqi_level / primary_pollutant columns to city/province day files')
+    e.add_argument('--extremes', action='store_true', help='also derive daily max/min/peak hour and O3 MDA8 from the hourly grids (with --aggregate-mean)')
+    e.add_argument('--diurnal', action='store_true', help='also write per-region hour-of-day sums/counts (YYYYMMDD_diurnal.npz) for monthly diurnal profiles (with --aggregate-mean)')
+    e.add_argument('--wind-rose', action='store_true', help='also bin hourly u/v into per-region sector x speed-class counts with PM2.5 sums (YYYYMMDD_windrose.npz, with --aggregate-mean)')
     e.set_defaults(func=cmd_extract)
 
     a = sp.add_parser('aggregate', help='aggregate saved daily files into monthly summaries')
     a.add_argument('--year', type=int, required=True)
     a.add_argument('--processed-root', help='root directory where day files are saved (overrides PROCESSED_DIR)')
     a.add_argument('--output-dir', help='where to save monthly aggregates (overrides AGGREGATED_DIR/processed_months)')
+    a.add_argument('--force', action='store_true', help='re-aggregate every month even if its day files are unchanged')
     a.set_defaults(func=cmd_aggregate)
 
     x = sp.add_parser('export', help='combine aggregated frames and export ECharts JSONs')
@@ -162,6 +350,80 @@ def main():
     x.add_argument('--output-dir', help='output directory for echarts JSONs')
     x.set_defaults(func=cmd_export)
 
+    r = sp.add_parser('regions', help='build/update the integer region registry from saved day files')
+    r.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    r.add_argument('--years', type=int, nargs='*', help='restrict scan to these years')
+    r.add_argument('--output', help='registry path (overrides REGION_REGISTRY_PATH)')
+    r.set_defaults(func=cmd_regions)
+
+    s = sp.add_parser('store', help='bulk-load city-day files into the local SQLite analytical store')
+    s.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    s.add_argument('--years', type=int, nargs='*', help='restrict load to these years')
+    s.add_argument('--db', help='database path (overrides ANALYTICS_DB_PATH)')
+    s.add_argument('--force', action='store_true', help='reload files even if unchanged since last load')
+    s.add_argument('--register-new', action='store_true',
+                   help='assign region_ids to unknown province/city names and save regions.json (default: skip those rows)')
+    s.set_defaults(func=cmd_store)
+
+    u = sp.add_parser('rollup', help='single-pass week/month/season/heating/year rollups from day files')
+    u.add_argument('--years', type=int, nargs='+', required=True)
+    u.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    u.add_argument('--granularities', nargs='+', default=list(DEFAULT_GRANULARITIES), choices=sorted(PERIOD_LABELERS))
+    u.add_argument('--output-dir', help='output root (overrides ROLLUP_DIR)')
+    u.set_defaults(func=cmd_rollup)
+
+    w = sp.add_parser('rolling', help='per-year rolling means / max / exceedance counts over city days')
+    w.add_argument('--years', type=int, nargs='+', required=True)
+    w.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    w.add_argument('--windows', type=int, nargs='+', default=list(ROLLING_WINDOWS))
+    w.add_argument('--output-dir', help='output root (overrides ROLLING_DIR)')
+    w.add_argument('--region-json', action='store_true', help='also write one columnar JSON per region')
+    w.set_defaults(func=cmd_rolling)
+
+    c = sp.add_parser('climatology', help='multi-year day-of-year / monthly climatology and daily anomalies')
+    c.add_argument('--years', type=int, nargs='+', required=True)
+    c.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    c.add_argument('--output-dir', help='output root (overrides CLIMATOLOGY_DIR)')
+    c.add_argument('--anomaly-years', type=int, nargs='+', help='only write anomaly files for these years (default: all)')
+    c.add_argument('--window', type=int, default=CLIMATOLOGY_DOY_WINDOW, help='day-of-year smoothing window in days')
+    c.add_argument('--force', action='store_true', help='rebuild every cached year cube')
+    c.set_defaults(func=cmd_climatology)
+
+    b = sp.add_parser('build-products', help='load each year once and build calendar / wind rose / trends / heatmap / correlation / ranking products')
+    b.add_argument('--years', type=int, nargs='+', required=True)
+    b.add_argument('--products', nargs='+', choices=sorted(PRODUCT_BUILDERS), help='subset of products (default: all)')
+    b.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    b.add_argument('--output-dir', help='products output root (overrides OUTPUT_DIR)')
+    b.add_argument('--corr-lags', type=int, nargs='+', help='correlation lags in days (default: CORR_LAGS)')
+    b.add_argument('--heatmap-binary', action='store_true',
+                   help='store the day heatmap values as float32 day.bin next to a day.json header')
+    b.set_defaults(func=cmd_build_products)
+
+    tr = sp.add_parser('trends', help='write one columnar trend file per level/frequency with a region offset index')
+    tr.add_argument('--years', type=int, nargs='+', required=True)
+    tr.add_argument('--levels', nargs='+', choices=TREND_LEVELS, help='default: city province')
+    tr.add_argument('--freqs', nargs='+', choices=TREND_FREQS, help='default: daily monthly')
+    tr.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    tr.add_argument('--output-dir', help='output directory (overrides TRENDS_DIR)')
+    tr.add_argument('--benchmark', type=int, nargs='?', const=1000, default=0,
+                    help='time N random region lookups per store (default N=1000)')
+    tr.set_defaults(func=cmd_trends)
+
+    g = sp.add_parser('centroids', help='compute region centroids / areas from admin polygons into the centroid table')
+    g.add_argument('--admin-geojson', help='admin polygons (default: same lookup as extract)')
+    g.add_argument('--output', help='centroid table path (overrides CENTROID_TABLE_PATH)')
+    g.set_defaults(func=cmd_centroids)
+
+    t = sp.add_parser('pyramid', help='build multi-resolution tile pyramid from grid-level day files')
+    t.add_argument('--year', type=int, required=True)
+    t.add_argument('--grid-root', help='root of --no-mapping day files (overrides PROCESSED_DIR/grid)')
+    t.add_argument('--output-dir', help='pyramid output root (overrides OUTPUT_DIR/pyramid)')
+    t.add_argument('--vars', nargs='*', help='variables to include (default: all pollutants and met fields)')
+    t.add_argument('--factors', type=int, nargs='*', default=[1, 2, 4, 8], help='block-average factors, each dividing the next')
+    t.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE, help='tile edge in cells of each level')
+    t.add_argument('--batch-days', type=int, default=16, help='days block-averaged together per vectorized batch')
+    t.set_defaults(func=cmd_pyramid)
+
     args = p.parse_args()
     if not args.cmd:
         p.print_help()
@@ -1,15 +1,58 @@
 import os
 import glob
-import re
+import json
 import pandas as pd
 import numpy as np
 from .config import AGGREGATED_DIR
+from .dayreader import discover_days, read_days
+from .hourly import HOURS_PER_DAY, diurnal_profiles, merge_diurnal, write_diurnal
+from .regions import get_registry, registry_signature
+
+# 月度汇总的增量清单（<output_dir>/.state/YYYYMM.manifest.json）
+STATE_DIRNAME = '.state'
+MANIFEST_VERSION = 1
+
+
+def month_manifest(year: int, month: int, processed_days_dir: str) -> dict:
+    """某月输入的指纹：日文件与 _diurnal.npz 的 (mtime, 大小)，外加注册表指纹（日变化廓线按注册表还原名称）。"""
+    paths = [d.path for d in discover_days(processed_days_dir, year, month)]
+    paths += glob.glob(os.path.join(processed_days_dir, '**', f"{year}{month:02d}[0-9][0-9]_diurnal.npz"), recursive=True)
+    files = {}
+    for path in sorted(paths):
+        st = os.stat(path)
+        files[os.path.abspath(path)] = [st.st_mtime_ns, st.st_size]
+    return {'version': MANIFEST_VERSION, 'registry': registry_signature(), 'files': files}
+
+
+def _manifest_path(year: int, month: int, output_dir: str) -> str:
+    return os.path.join(output_dir, STATE_DIRNAME, f"{year}{month:02d}.manifest.json")
+
+
+def month_is_current(year: int, month: int, output_dir: str, manifest: dict) -> bool:
+    """清单与上次一致且月度汇总文件仍在时返回 True（该月可以跳过）。"""
+    outputs = [os.path.join(output_dir, f"{year}{month:02d}.{ext}") for ext in ('parquet', 'csv')]
+    if not any(os.path.exists(p) for p in outputs):
+        return False
+    try:
+        with open(_manifest_path(year, month, output_dir), 'r', encoding='utf-8') as f:
+            return json.load(f) == manifest
+    except (OSError, ValueError):
+        return False
+
+
+def save_month_manifest(year: int, month: int, output_dir: str, manifest: dict) -> None:
+    path = _manifest_path(year, month, output_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
 
 
 def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: str, output_dir: str = None) -> pd.DataFrame:
     """将保存的每日清理文件汇总到每月摘要中。
 
-    在processed_days_dir 下查找与{year}{month:02d}*.parquet/csv 匹配的parquet/csv 文件。
+    在processed_days_dir 下查找 {year}{month:02d}* 的日文件（json/csv/parquet/qgrid，见 dayreader）。
     如果 admin_name 存在，则按 admin_name+month 聚合数字列，否则按 lat/lon+month 聚合数字列。
     将结果保存到output_dir并返回聚合的DataFrame。
     """
@@ -17,49 +60,18 @@ def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: s
         output_dir = os.path.join(AGGREGATED_DIR, 'processed_months')
     os.makedirs(output_dir, exist_ok=True)
 
-    # 递归搜索嵌套年/月/日文件夹下保存的日期文件。
-    pattern_parquet = os.path.join(processed_days_dir, '**', f"{year}{month:02d}*.parquet")
-    pattern_csv = os.path.join(processed_days_dir, '**', f"{year}{month:02d}*.csv")
-    files = sorted(glob.glob(pattern_parquet, recursive=True) + glob.glob(pattern_csv, recursive=True))
+    # 递归搜索嵌套年/月/日文件夹下保存的日期文件（任意格式，见 dayreader）。
+    files = discover_days(processed_days_dir, year, month)
     if not files:
         raise FileNotFoundError(f"在 {processed_days_dir} 中未找到 {year}-{month:02d} 的日文件")
 
-    parts = []
-    for f in files:
-        try:
-            if f.endswith('.parquet'):
-                df = pd.read_parquet(f)
-            else:
-                # 读取 csv 而不强制 parse_dates 以避免“时间”丢失时出现错误
-                df = pd.read_csv(f)
-
-            # 如果“时间”列丢失，请尝试从文件名推断（基本名称中应为 YYYYMMDD）
-            if 'time' not in df.columns:
-                base = os.path.splitext(os.path.basename(f))[0]
-                m = re.match(r'(\d{8})', base)
-                if m:
-                    try:
-                        inferred = pd.to_datetime(m.group(1), format='%Y%m%d', errors='coerce')
-                        if not pd.isna(inferred):
-                            df['time'] = inferred
-                    except Exception:
-                        pass
-            else:
-                # normalize time column
-                try:
-                    df['time'] = pd.to_datetime(df['time'], errors='coerce')
-                except Exception:
-                    pass
-
-            parts.append(df)
-        except Exception:
-            # skip unreadable files
-            continue
-
-    if not parts:
+    month_df = read_days(files)
+    if month_df.empty:
         raise RuntimeError("未能读取任何日文件以进行月度聚合")
-
-    month_df = pd.concat(parts, ignore_index=True)
+    # 如果“时间”列丢失，使用文件名中的日期
+    if 'time' not in month_df.columns:
+        month_df['time'] = month_df['date']
+    month_df = month_df.drop(columns=['date'])
     # 确保“时间”是日期时间对象（如果存在）
     if 'time' in month_df.columns:
         try:
@@ -76,7 +88,7 @@ def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: s
         group_keys = ['lat', 'lon']
 
     # 仅聚合数字列
-    numeric_cols = month_df.select_dtypes(include=[np.number]).columns.tolist()
+    numeric_cols = [c for c in month_df.select_dtypes(include=[np.number]).columns if c != 'region_id']
     if not numeric_cols:
         raise RuntimeError('没有找到可聚合的数值列')
 
@@ -102,3 +114,49 @@ def aggregate_month_from_saved_days(year: int, month: int, processed_days_dir: s
     print(f"已保存月度聚合文件: {saved}")
 
     return month_agg
+
+
+def aggregate_month_diurnal(year: int, month: int, processed_days_dir: str, output_dir: str = None):
+    """把某月的 YYYYMMDD_diurnal.npz（extract --diurnal）合并为月度日变化廓线。
+
+    写出 {year}{month:02d}_diurnal.npz（合并后的 sums/counts，可继续跨月相加）与
+    {year}{month:02d}_diurnal.json::
+
+        {year, month, variables, hours, all: {var: [24]},
+         regions: [{region_id, province, city, days, var: [24] ...}]}
+
+    廓线为 sums / counts（无样本的时刻为 null）；all 为全部区域格点-小时样本的均值。
+    没有 diurnal 文件时返回 None。
+    """
+    if output_dir is None:
+        output_dir = os.path.join(AGGREGATED_DIR, 'processed_months')
+    pattern = os.path.join(processed_days_dir, '**', f"{year}{month:02d}[0-9][0-9]_diurnal.npz")
+    merged = merge_diurnal(sorted(glob.glob(pattern, recursive=True)))
+    if merged is None:
+        return None
+    region_ids, variables, sums, counts, days = merged
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"{year}{month:02d}_diurnal")
+    write_diurnal(base + '.npz', region_ids, variables, sums, counts)
+
+    def _rows(profile):
+        return [[None if np.isnan(x) else x for x in row] for row in np.round(profile, 3).tolist()]
+
+    profiles = diurnal_profiles(sums, counts)
+    overall = diurnal_profiles(sums.sum(axis=1), counts.sum(axis=1))
+    names = get_registry().decode(region_ids.tolist())
+    names = names.astype(object).where(names.notna(), None)
+    columns = {v: _rows(profiles[i]) for i, v in enumerate(variables)}
+    regions = []
+    for r, region_id in enumerate(region_ids.tolist()):
+        record = {'region_id': region_id, 'province': names['province'].iat[r], 'city': names['city'].iat[r],
+                  'days': int(days[r])}
+        for v in variables:
+            record[v] = columns[v][r]
+        regions.append(record)
+    result = {'year': int(year), 'month': int(month), 'variables': list(variables),
+              'hours': list(range(HOURS_PER_DAY)), 'all': dict(zip(variables, _rows(overall))), 'regions': regions}
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(result, ensure_ascii=False, separators=(',', ':')))
+    print(f"已保存月度日变化廓线: {base}.json ({len(region_ids)} 个区域)")
+    return result
@@ -0,0 +1,122 @@
+"""向量化的 AQI 计算（HJ 633-2012），六项污染物：pm25, pm10, so2, no2, co, o3。
+
+分段限值表与前端 dataLoader.js 的 AQI_BREAKPOINTS 一致（CO 单位 mg/m³，其余 μg/m³）。
+每项污染物的 IAQI 用 np.searchsorted 在限值数组里定位所在分段后整体线性插值，
+AQI 取各项 IAQI 的最大值，等级与颜色由 AQI 再做一次 searchsorted 得到。全部为整列数组运算，
+可直接用于整年的城市日数据、(区域, 日) 矩阵或网格。
+
+    >>> out = compute_aqi({'pm25': [30, 80], 'pm10': [40, 200]})
+    >>> out['aqi'], out['level'], out['primary']
+    (array([ 43., 125.]), array([0, 2], dtype=int8), array([0, 1], dtype=int8))
+
+缺测（NaN）或负值的污染物不参与比较；所有污染物都缺测时 AQI 为 NaN、level/primary 为 -1。
+超过表中最高限值的浓度 IAQI 记为 500。
+"""
+from typing import Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+AQI_POLLUTANTS = ('pm25', 'pm10', 'so2', 'no2', 'co', 'o3')
+
+# 污染物浓度限值（分段端点）；各分段对应的 IAQI 端点为 IAQI_POINTS
+AQI_BREAKPOINTS = {
+    'pm25': (0, 35, 75, 115, 150, 250, 350, 500),
+    'pm10': (0, 50, 150, 250, 350, 420, 500, 600),
+    'so2': (0, 50, 150, 475, 800, 1600, 2100, 2620),
+    'no2': (0, 40, 80, 180, 280, 565, 750, 940),
+    'co': (0, 2, 4, 14, 24, 36, 48, 60),
+    'o3': (0, 100, 160, 215, 265, 800, 1000, 1200),
+}
+IAQI_POINTS = (0, 50, 100, 150, 200, 300, 400, 500)
+
+# 空气质量等级（level 为下标）：AQI <= 50 为优，51-100 为良 ...
+AQI_LEVEL_BOUNDS = (50, 100, 150, 200, 300)
+AQI_LEVEL_NAMES = ('优', '良', '轻度污染', '中度污染', '重度污染', '严重污染')
+AQI_LEVEL_COLORS = ('#00E400', '#FFFF00', '#FF7E00', '#FF0000', '#99004C', '#7E0023')
+PRIMARY_NAMES = {'pm25': 'PM2.5', 'pm10': 'PM10', 'so2': 'SO2', 'no2': 'NO2', 'co': 'CO', 'o3': 'O3'}
+
+_BP = {p: np.asarray(bp, dtype='float64') for p, bp in AQI_BREAKPOINTS.items()}
+_IAQI = np.asarray(IAQI_POINTS, dtype='float64')
+
+
+def iaqi(values, pollutant: str) -> np.ndarray:
+    """单项污染物分指数 IAQI（浮点，不取整）；NaN 或负浓度返回 NaN。"""
+    bp = _BP[pollutant]
+    c = np.asarray(values, dtype='float64')
+    seg = np.clip(np.searchsorted(bp, c, side='right') - 1, 0, len(bp) - 2)
+    lo, hi = bp[seg], bp[seg + 1]
+    out = _IAQI[seg] + (_IAQI[seg + 1] - _IAQI[seg]) / (hi - lo) * (c - lo)
+    out = np.where(c > bp[-1], _IAQI[-1], out)
+    return np.where(np.isfinite(c) & (c >= 0), out, np.nan)
+
+
+def aqi_level(aqi) -> np.ndarray:
+    """AQI -> 等级下标（0 优 ... 5 严重污染），NaN 为 -1。"""
+    a = np.asarray(aqi, dtype='float64')
+    level = np.searchsorted(np.asarray(AQI_LEVEL_BOUNDS, dtype='float64'), a, side='left').astype(np.int8)
+    return np.where(np.isfinite(a), level, -1).astype(np.int8)
+
+
+def compute_aqi(data: Mapping[str, object], pollutants: Sequence[str] = AQI_POLLUTANTS,
+                round_iaqi: bool = True) -> Dict[str, np.ndarray]:
+    """对整列浓度计算 AQI。
+
+    data 可以是 DataFrame 或 {污染物: 数组}（形状一致，任意维度）；缺少的污染物跳过。
+    round_iaqi=True 时各项 IAQI 先四舍五入为整数（与原日历脚本一致）。
+    返回 {'aqi', 'level'(int8，同时是 AQI_LEVEL_COLORS 的颜色下标), 'primary'(int8，pollutants 中的下标),
+    'iaqi_<p>' ...}。
+    """
+    present = [p for p in pollutants if p in data]
+    if not present:
+        raise ValueError(f'no AQI pollutant columns found; expected any of {list(pollutants)}')
+    stack = np.stack([iaqi(pd.to_numeric(np.asarray(data[p]).ravel(), errors='coerce'), p)
+                      .reshape(np.shape(data[p])) for p in present])
+    if round_iaqi:
+        stack = np.round(stack)
+    valid = np.isfinite(stack)
+    any_valid = valid.any(axis=0)
+    primary_local = np.argmax(np.where(valid, stack, -np.inf), axis=0)
+    aqi = np.where(any_valid, np.take_along_axis(stack, primary_local[None], axis=0)[0], np.nan)
+    # primary 用 pollutants 中的下标，缺少的污染物也不会打乱编号
+    index = np.asarray([list(pollutants).index(p) for p in present], dtype=np.int8)
+    primary = np.where(any_valid, index[primary_local], -1).astype(np.int8)
+    level = aqi_level(aqi)
+    out = {'aqi': aqi, 'level': level, 'primary': primary}
+    for k, p in enumerate(present):
+        out[f'iaqi_{p}'] = stack[k]
+    return out
+
+
+def add_aqi_columns(df: pd.DataFrame, pollutants: Sequence[str] = AQI_POLLUTANTS, names: bool = True,
+                    iaqi_columns: bool = False) -> pd.DataFrame:
+    """在城市日表上追加 aqi / aqi_level / primary_pollutant 列（返回新表）。
+
+    names=True 时 aqi_level 为中文等级名、primary_pollutant 为 'PM2.5' 等显示名，
+    否则为整数下标（-1 表示缺测）；iaqi_columns=True 时再追加各项 iaqi_<p>。
+    """
+    out = df.copy()
+    if not any(p in out.columns for p in pollutants):
+        return out
+    res = compute_aqi(out, pollutants)
+    out['aqi'] = res['aqi']
+    if names:
+        level_names = np.asarray(AQI_LEVEL_NAMES + (None,), dtype=object)
+        primary_names = np.asarray([PRIMARY_NAMES.get(p, p) for p in pollutants] + [None], dtype=object)
+        out['aqi_level'] = level_names[res['level']]
+        out['primary_pollutant'] = primary_names[res['primary']]
+    else:
+        out['aqi_level'] = res['level']
+        out['primary_pollutant'] = res['primary']
+    if iaqi_columns:
+        for p in pollutants:
+            if f'iaqi_{p}' in res:
+                out[f'iaqi_{p}'] = res[f'iaqi_{p}']
+    return out
+
+
+def level_info(level: Optional[int]):
+    """单个等级下标 -> (等级名, 颜色)；-1/None 返回 (None, None)。"""
+    if level is None or level < 0:
+        return None, None
+    return AQI_LEVEL_NAMES[level], AQI_LEVEL_COLORS[level]
@@ -0,0 +1,168 @@
+"""行政区质心表：每个 region_id 一行的经纬度、格点数与面积，持久化为 CENTROID_TABLE_PATH。
+
+质心有三种来源，优先级从高到低：
+
+* ``polygon``   行政区多边形（admin geojson）在等积投影下的几何质心，同时给出面积（km²）；
+* ``cells``     extract 映射到该区域的网格格点的经纬度均值，同时给出格点数；
+* ``reference`` 注册表 regions.json 里由 region.json 参考表补齐的 lon/lat（仅作兜底，不写入质心表）。
+
+表文件为列式 JSON：
+
+    {"version": 1, "columns": {"region_id": [...], "province": [...], "city": [...], "lon": [...],
+                               "lat": [...], "cells": [...], "area_km2": [...], "source": [...]}}
+
+更新时高优先级来源的坐标不会被低优先级来源覆盖；cells / area_km2 各自只由对应来源更新。
+热力图等产品通过 region_centroids() 一次 merge 得到坐标，不再扫描日文件。
+"""
+import os
+import json
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import CENTROID_TABLE_PATH
+from .regions import RegionRegistry, attach_region_ids, get_registry
+
+CENTROID_TABLE_VERSION = 1
+CENTROID_COLUMNS = ['region_id', 'province', 'city', 'lon', 'lat', 'cells', 'area_km2', 'source']
+SOURCE_RANK = {'reference': 0, 'cells': 1, 'polygon': 2}
+# 中国区域等积投影（Albers，双标准纬线 25°N / 47°N），用于面积与多边形质心
+CHINA_EQUAL_AREA_CRS = '+proj=aea +lat_0=0 +lon_0=105 +lat_1=25 +lat_2=47 +datum=WGS84 +units=m +no_defs'
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame({c: pd.Series(dtype=object) for c in CENTROID_COLUMNS})
+
+
+def _finish(frame: pd.DataFrame) -> pd.DataFrame:
+    """补齐列、统一类型并按 region_id 排序。"""
+    frame = frame.copy()
+    for c in CENTROID_COLUMNS:
+        if c not in frame.columns:
+            frame[c] = np.nan
+    frame = frame[CENTROID_COLUMNS]
+    frame['region_id'] = pd.to_numeric(frame['region_id'], errors='coerce').astype('Int64')
+    frame = frame[frame['region_id'].notna()]
+    for c in ('lon', 'lat', 'area_km2'):
+        frame[c] = pd.to_numeric(frame[c], errors='coerce').astype('float64')
+    frame['cells'] = pd.to_numeric(frame['cells'], errors='coerce').astype('Int64')
+    return frame.sort_values('region_id').reset_index(drop=True)
+
+
+def cell_centroids(lat, lon, province, city, registry: Optional[RegionRegistry] = None) -> pd.DataFrame:
+    """格点经纬度 + 所属省市 -> 每个区域的格点均值质心与格点数（bincount 分组，source='cells'）。"""
+    names = pd.DataFrame({'province': np.asarray(province, dtype=object), 'city': np.asarray(city, dtype=object)})
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    ok = (names['province'].notna() & names['city'].notna()).to_numpy() & np.isfinite(lat) & np.isfinite(lon)
+    if not ok.any():
+        return _empty()
+    codes, uniques = pd.MultiIndex.from_frame(names[ok]).factorize()
+    counts = np.bincount(codes, minlength=len(uniques))
+    frame = pd.DataFrame({'province': uniques.get_level_values(0), 'city': uniques.get_level_values(1)})
+    frame['lon'] = np.bincount(codes, weights=lon[ok], minlength=len(uniques)) / counts
+    frame['lat'] = np.bincount(codes, weights=lat[ok], minlength=len(uniques)) / counts
+    frame['cells'] = counts
+    frame['source'] = 'cells'
+    frame = attach_region_ids(frame, registry or get_registry(), names=True)
+    return _finish(frame)
+
+
+def polygon_centroids(admin_geojson: str, registry: Optional[RegionRegistry] = None) -> pd.DataFrame:
+    """行政区多边形 -> 每个区域的质心与面积（source='polygon'）。
+
+    省市名称列的识别与 extract 相同（canonicalize_admin_mapping，中文优先）；
+    同一区域的多个多边形先合并；注册表里没有的区域不会新增 ID，直接跳过。
+    """
+    import geopandas as gpd
+    from .util.geo_utils import canonicalize_admin_mapping
+
+    gdf = gpd.read_file(admin_geojson)
+    try:
+        gdf = gdf.to_crs(epsg=4326)
+    except Exception:
+        pass
+    attrs, _ = canonicalize_admin_mapping(pd.DataFrame(gdf.drop(columns=gdf.geometry.name)),
+                                          fill_english_if_missing=True)
+    gdf = gdf.loc[attrs.index]
+    gdf['province'] = attrs['province'].to_numpy()
+    gdf['city'] = attrs['city'].to_numpy()
+    gdf = gdf[gdf['province'].notna() & gdf['city'].notna()]
+    if gdf.empty:
+        return _empty()
+    projected = gdf[['province', 'city', gdf.geometry.name]].to_crs(CHINA_EQUAL_AREA_CRS)
+    dissolved = projected.dissolve(by=['province', 'city'], as_index=False)
+    points = dissolved.geometry.centroid.to_crs(epsg=4326)
+    frame = pd.DataFrame({'province': dissolved['province'].to_numpy(), 'city': dissolved['city'].to_numpy(),
+                          'lon': points.x.to_numpy(), 'lat': points.y.to_numpy(),
+                          'area_km2': dissolved.geometry.area.to_numpy() / 1e6, 'source': 'polygon'})
+    frame = attach_region_ids(frame, registry or get_registry(), add=False, names=True)
+    return _finish(frame)
+
+
+def load_centroids(path: Optional[str] = None) -> pd.DataFrame:
+    """读取质心表；文件不存在时返回空表。"""
+    path = path or CENTROID_TABLE_PATH
+    if not os.path.exists(path):
+        return _empty()
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return _finish(pd.DataFrame(data.get('columns', {})))
+
+
+def save_centroids(frame: pd.DataFrame, path: Optional[str] = None) -> str:
+    path = path or CENTROID_TABLE_PATH
+    frame = _finish(frame)
+    columns = {}
+    for c in CENTROID_COLUMNS:
+        col = frame[c].astype(object).where(frame[c].notna(), None)
+        if c in ('lon', 'lat'):
+            col = col.map(lambda v: None if v is None else round(float(v), 4))
+        elif c == 'area_km2':
+            col = col.map(lambda v: None if v is None else round(float(v), 1))
+        elif c in ('region_id', 'cells'):
+            col = col.map(lambda v: None if v is None else int(v))
+        columns[c] = col.tolist()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'version': CENTROID_TABLE_VERSION, 'columns': columns}, ensure_ascii=False))
+    os.replace(tmp, path)
+    return path
+
+
+def merge_centroids(table: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """把 new 合并进 table（按 region_id 对齐）：坐标按来源优先级取高者，cells / area_km2 取 new 中的非空值。"""
+    table, new = _finish(table), _finish(new)
+    merged = table.merge(new, on='region_id', how='outer', suffixes=('', '_new'))
+    rank_old = merged['source'].map(SOURCE_RANK).fillna(-1).to_numpy()
+    rank_new = merged['source_new'].map(SOURCE_RANK).fillna(-1).to_numpy()
+    take = (rank_new >= rank_old) & merged['lon_new'].notna().to_numpy() & merged['lat_new'].notna().to_numpy()
+    for c in ('province', 'city', 'lon', 'lat', 'source'):
+        merged[c] = np.where(take, merged[f'{c}_new'].astype(object), merged[c].astype(object))
+    for c in ('cells', 'area_km2'):
+        merged[c] = merged[f'{c}_new'].where(merged[f'{c}_new'].notna(), merged[c])
+    return _finish(merged)
+
+
+def update_centroids(new: pd.DataFrame, path: Optional[str] = None) -> Optional[str]:
+    """合并并写回质心表；内容没有变化时不写文件，返回 None。"""
+    if new is None or new.empty:
+        return None
+    table = load_centroids(path)
+    merged = merge_centroids(table, new)
+    if merged.equals(table):
+        return None
+    return save_centroids(merged, path)
+
+
+def region_centroids(path: Optional[str] = None, registry: Optional[RegionRegistry] = None) -> pd.DataFrame:
+    """注册表全部区域的质心：质心表优先，缺失时退回注册表的参考坐标（source='reference'）。"""
+    frame = (registry or get_registry()).to_frame()[['region_id', 'province', 'city', 'lon', 'lat']]
+    frame = frame.assign(source=np.where(frame['lon'].notna() & frame['lat'].notna(), 'reference', None))
+    table = load_centroids(path)
+    out = merge_centroids(frame, table.drop(columns=['province', 'city']))
+    # 名称始终取注册表的规范名称
+    return out.drop(columns=['province', 'city']).merge(frame[['region_id', 'province', 'city']], on='region_id',
+                                                        how='left')[CENTROID_COLUMNS]
@@ -0,0 +1,298 @@
+"""多年气候态（day-of-year / month-of-year）与逐日距平层。
+
+每一年的城市日数据排成 (变量, 区域, 366) 的“年立方体”（日轴按闰年日历对齐：平年 2/29 为 NaN，
+3/1 起的日子始终落在同一个槽位），并缓存在状态目录里：
+
+    <state>/<year>.npz   cube(float32), region_ids, variables, signature（该年日文件 path/mtime/size 的 sha1）
+
+气候态的均值/标准差由各年立方体的可合并矩（count/sum/sumsq，见 moments.py）相加得到；
+新增一年或某年日文件变化时只重算那一年的立方体，其余年份直接复用缓存再合并。
+百分位无法由矩合并，用各年立方体在日轴上开窗（默认 ±7 天，config.CLIMATOLOGY_DOY_WINDOW）后的样本计算；
+day-of-year 的均值/标准差同样按窗口平滑，month 气候态为该月全部日样本。
+
+输出（默认 config.CLIMATOLOGY_DIR，位于前端数据目录下）::
+
+    climatology_doy.npz        region_ids, variables, years, percentiles, doy(MM-DD),
+                               {var}_mean/_std/_count (区域, 366), {var}_pct (区域, 366, 分位数)
+    climatology_month.json     {years, percentiles, records: [{region_id, province, city, month,
+                                                              {var}_mean/_std/_count/_p{q}}]}
+    anomaly/<year>/<YYYYMMDD>.json
+                               {date, region_ids: [...], {var}_anom: [...], {var}_z: [...]}（列式）
+"""
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .config import CLIMATOLOGY_DIR, CLIMATOLOGY_DOY_WINDOW, CLIMATOLOGY_PERCENTILES, DAY_ROOTS, OUTPUT_DIR
+from .dayreader import discover_days
+from .regions import get_registry
+from .rolling import day_matrix, load_year_days
+
+CLIMATOLOGY_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+CLIMATOLOGY_STATE_DIR = os.path.join(OUTPUT_DIR, 'climatology_state')
+
+# 闰年日历上的 366 个槽位：'MM-DD' 标签与所属月份
+_LEAP_DAYS = pd.date_range('2000-01-01', '2000-12-31', freq='D')
+DOY_LABELS = _LEAP_DAYS.strftime('%m-%d').to_numpy()
+DOY_MONTH = _LEAP_DAYS.month.to_numpy()
+
+
+def doy_slots(dates: pd.DatetimeIndex) -> np.ndarray:
+    """日期 -> 闰年日历槽位（0..365）；平年 3/1 之后的日子后移一位，使同一日历日对齐。"""
+    dates = pd.DatetimeIndex(dates)
+    slot = dates.dayofyear.to_numpy() - 1
+    shift = (~dates.is_leap_year) & (dates.month > 2)
+    return slot + shift.astype(int)
+
+
+def nan_percentiles(samples: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+    """沿最后一维的 NaN 感知百分位（线性插值，与 np.nanpercentile 相同），结果的最后一维为分位数。
+
+    排序一次后按各行有效样本数插值，避免 np.nanpercentile 在有 NaN 时逐行处理。
+    """
+    count = np.isfinite(samples).sum(axis=-1)
+    ordered = np.sort(samples, axis=-1)
+    n = np.maximum(count, 1)[..., None]
+    pos = (n - 1) * (np.asarray(percentiles, dtype='float64') / 100.0)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, n - 1)
+    lo_val = np.take_along_axis(ordered, lo, axis=-1)
+    hi_val = np.take_along_axis(ordered, hi, axis=-1)
+    out = lo_val + (hi_val - lo_val) * (pos - lo)
+    out[count == 0] = np.nan
+    return out
+
+
+def year_signature(year: int, roots: Sequence[str]) -> str:
+    """该年全部日文件的 (路径, mtime, 大小) 指纹，用于判断年立方体缓存是否可用。"""
+    h = hashlib.sha1()
+    for root in roots:
+        for day in discover_days(root, int(year)):
+            st = os.stat(day.path)
+            h.update(f'{os.path.abspath(day.path)}|{st.st_mtime_ns}|{st.st_size}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def year_cube(year: int, days: pd.DataFrame, variables: Sequence[str] = CLIMATOLOGY_VARS):
+    """一年的日数据 -> ((变量, 区域, 366) float32 立方体, region_ids, variables)。"""
+    matrix = day_matrix(days, variables, start=f'{year}-01-01', end=f'{year}-12-31')
+    cube = np.full(matrix.cube.shape[:2] + (len(DOY_LABELS),), np.nan, dtype=np.float32)
+    cube[..., doy_slots(matrix.dates)] = matrix.cube
+    return cube, matrix.region_ids, matrix.variables
+
+
+def update_year_states(years: Sequence[int], roots: Optional[Sequence[str]] = None,
+                       state_dir: Optional[str] = None, force: bool = False) -> Dict[int, str]:
+    """确保每一年都有最新的年立方体缓存，返回 {year: 'cached'|'built'|'empty'}。"""
+    roots = list(roots or DAY_ROOTS)
+    state_dir = state_dir or CLIMATOLOGY_STATE_DIR
+    os.makedirs(state_dir, exist_ok=True)
+    status = {}
+    for year in years:
+        path = os.path.join(state_dir, f'{year}.npz')
+        signature = year_signature(year, roots)
+        if not force and os.path.exists(path):
+            with np.load(path) as old:
+                if str(old['signature']) == signature:
+                    status[year] = 'cached'
+                    continue
+        days = load_year_days(year, roots=roots, variables=CLIMATOLOGY_VARS)
+        if days.empty:
+            status[year] = 'empty'
+            continue
+        cube, region_ids, variables = year_cube(year, days)
+        np.savez_compressed(path, cube=cube, region_ids=region_ids, variables=np.asarray(variables),
+                            signature=np.asarray(signature))
+        status[year] = 'built'
+    return status
+
+
+def load_year_states(years: Sequence[int], state_dir: Optional[str] = None,
+                     variables: Sequence[str] = CLIMATOLOGY_VARS) -> Tuple[np.ndarray, np.ndarray, List[int], List[str]]:
+    """读取各年立方体并对齐到区域并集，返回 (cubes[年, 变量, 区域, 366], region_ids, years, variables)。"""
+    state_dir = state_dir or CLIMATOLOGY_STATE_DIR
+    loaded = []
+    for year in years:
+        path = os.path.join(state_dir, f'{year}.npz')
+        if os.path.exists(path):
+            with np.load(path) as data:
+                loaded.append((int(year), data['cube'], data['region_ids'], [str(v) for v in data['variables']]))
+    if not loaded:
+        return np.empty((0, 0, 0, len(DOY_LABELS)), dtype=np.float32), np.empty(0, dtype=np.int64), [], []
+    variables = [v for v in variables if all(v in vs for _, _, _, vs in loaded)]
+    region_ids = np.unique(np.concatenate([ids for _, _, ids, _ in loaded]))
+    cubes = np.full((len(loaded), len(variables), len(region_ids), len(DOY_LABELS)), np.nan, dtype=np.float32)
+    for k, (_, cube, ids, vs) in enumerate(loaded):
+        rows = np.searchsorted(region_ids, ids)
+        cubes[k][:, rows] = cube[[vs.index(v) for v in variables]]
+    return cubes, region_ids, [y for y, _, _, _ in loaded], variables
+
+
+def year_moments(cube: np.ndarray) -> Dict[str, np.ndarray]:
+    """单个年立方体的可合并矩（count/sum/sumsq），形状与立方体相同。"""
+    valid = np.isfinite(cube)
+    values = np.where(valid, cube, 0.0).astype('float64')
+    return {'count': valid.astype('float64'), 'sum': values, 'sumsq': values ** 2}
+
+
+def merge_year_moments(cubes: np.ndarray) -> Dict[str, np.ndarray]:
+    """把各年的矩相加（count/sum/sumsq 可直接相加），得到多年合并矩 (变量, 区域, 366)。"""
+    merged = None
+    for cube in cubes:
+        m = year_moments(cube)
+        merged = m if merged is None else {k: merged[k] + m[k] for k in merged}
+    return merged
+
+
+def _circular_window_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """沿最后一维（日历槽位，首尾相接）的居中窗口和。"""
+    half = window // 2
+    padded = np.concatenate([x[..., -half:], x, x[..., :half]], axis=-1) if half else x
+    cs = np.cumsum(padded, axis=-1)
+    cs = np.concatenate([np.zeros(cs.shape[:-1] + (1,)), cs], axis=-1)
+    return cs[..., window:] - cs[..., :-window]
+
+
+def _finalize(count: np.ndarray, sum_: np.ndarray, sumsq: np.ndarray):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sum_ / count
+        var = (sumsq - sum_ * mean) / (count - 1)
+    mean[count == 0] = np.nan
+    # 只有一个样本时标准差记为 0，没有样本时为 NaN（与月度统计一致）
+    std = np.where(count > 1, np.sqrt(np.clip(var, 0, None)), np.where(count == 1, 0.0, np.nan))
+    return mean, std
+
+
+def doy_climatology(cubes: np.ndarray, window: int = CLIMATOLOGY_DOY_WINDOW,
+                    percentiles: Sequence[float] = CLIMATOLOGY_PERCENTILES) -> Dict[str, np.ndarray]:
+    """day-of-year 气候态：合并矩按居中窗口平滑后求 mean/std；百分位取窗口内全部年份样本。
+
+    返回 {'count','mean','std': (变量, 区域, 366), 'pct': (变量, 区域, 366, 分位数)}。
+    """
+    window = max(1, int(window) | 1)
+    merged = merge_year_moments(cubes)
+    count, sum_, sumsq = (_circular_window_sum(merged[k], window) for k in ('count', 'sum', 'sumsq'))
+    mean, std = _finalize(count, sum_, sumsq)
+    half = window // 2
+    pct = np.empty(mean.shape + (len(percentiles),), dtype=np.float32)
+    for v in range(cubes.shape[1]):
+        # (年, 区域, 366+2h) -> (年, 区域, 366, 窗口) -> (区域, 366, 年*窗口)
+        year_v = cubes[:, v]
+        padded = np.concatenate([year_v[..., -half:], year_v, year_v[..., :half]], axis=-1) if half else year_v
+        samples = sliding_window_view(padded, window, axis=-1)
+        samples = np.moveaxis(samples, 0, -2).reshape(samples.shape[1], samples.shape[2], -1)
+        pct[v] = nan_percentiles(samples, percentiles)
+    return {'count': count.astype(np.int32), 'mean': mean, 'std': std, 'pct': pct}
+
+
+def month_climatology(cubes: np.ndarray, percentiles: Sequence[float] = CLIMATOLOGY_PERCENTILES) -> Dict[str, np.ndarray]:
+    """month-of-year 气候态：该月全部年份全部日样本的 mean/std/百分位，形状 (变量, 区域, 12[, 分位数])。"""
+    merged = merge_year_moments(cubes)
+    month_idx = DOY_MONTH - 1
+    stats = {k: np.stack([merged[k][..., month_idx == m].sum(axis=-1) for m in range(12)], axis=-1)
+             for k in ('count', 'sum', 'sumsq')}
+    mean, std = _finalize(stats['count'], stats['sum'], stats['sumsq'])
+    pct = np.empty(mean.shape + (len(percentiles),), dtype=np.float32)
+    for m in range(12):
+        samples = np.moveaxis(cubes[..., month_idx == m], 0, -2)  # (变量, 区域, 年, 日)
+        pct[..., m, :] = nan_percentiles(samples.reshape(samples.shape[:2] + (-1,)), percentiles)
+    return {'count': stats['count'].astype(np.int32), 'mean': mean, 'std': std, 'pct': pct}
+
+
+def anomalies(cube: np.ndarray, clim: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """年立方体相对 day-of-year 气候态的距平与 z 分数（std 为 0 或缺失时 z 为 NaN）。"""
+    anom = cube - clim['mean']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = anom / np.where(clim['std'] > 0, clim['std'], np.nan)
+    return anom, z
+
+
+def _round_list(a: np.ndarray, digits: int = 3) -> list:
+    a = np.round(a.astype('float64'), digits)
+    return np.where(np.isfinite(a), a, None).tolist()
+
+
+def write_climatology(region_ids: np.ndarray, years: Sequence[int], variables: Sequence[str],
+                      doy: Dict[str, np.ndarray], month: Dict[str, np.ndarray],
+                      percentiles: Sequence[float] = CLIMATOLOGY_PERCENTILES, out_dir: Optional[str] = None) -> str:
+    out_dir = out_dir or CLIMATOLOGY_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {}
+    for i, v in enumerate(variables):
+        arrays[f'{v}_mean'] = doy['mean'][i].astype(np.float32)
+        arrays[f'{v}_std'] = doy['std'][i].astype(np.float32)
+        arrays[f'{v}_count'] = doy['count'][i]
+        arrays[f'{v}_pct'] = doy['pct'][i]
+    np.savez_compressed(os.path.join(out_dir, 'climatology_doy.npz'), region_ids=region_ids,
+                        variables=np.asarray(variables), years=np.asarray(years),
+                        percentiles=np.asarray(percentiles), doy=DOY_LABELS.astype('U5'), **arrays)
+
+    # 月气候态：(区域, 月) 展平为记录，整列取整后一次 to_dict
+    names = get_registry().decode(region_ids)
+    n_regions = len(region_ids)
+    table = {
+        'region_id': np.repeat(region_ids.astype(np.int64), 12),
+        'province': np.repeat(names['province'].to_numpy(), 12),
+        'city': np.repeat(names['city'].to_numpy(), 12),
+        'month': np.tile(np.arange(1, 13), n_regions),
+    }
+    for i, v in enumerate(variables):
+        table[f'{v}_mean'] = month['mean'][i].reshape(-1)
+        table[f'{v}_std'] = month['std'][i].reshape(-1)
+        table[f'{v}_count'] = month['count'][i].reshape(-1)
+        for k, q in enumerate(percentiles):
+            table[f'{v}_p{q:g}'] = month['pct'][i, :, :, k].reshape(-1).astype('float64')
+    frame = pd.DataFrame(table).round(6)
+    records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+    path = os.path.join(out_dir, 'climatology_month.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        # json.dumps 走 C 编码器，比 json.dump 的逐块写出快一个数量级
+        f.write(json.dumps({'years': [int(y) for y in years], 'percentiles': list(percentiles), 'records': records},
+                           ensure_ascii=False, indent=2))
+    return path
+
+
+def write_anomalies(year: int, cube: np.ndarray, region_ids: np.ndarray, variables: Sequence[str],
+                    clim: Dict[str, np.ndarray], out_dir: Optional[str] = None) -> int:
+    """写出某年每一天的距平/z 分数（列式 JSON），返回写出的天数。"""
+    out_dir = os.path.join(out_dir or CLIMATOLOGY_DIR, 'anomaly', str(year))
+    os.makedirs(out_dir, exist_ok=True)
+    anom, z = anomalies(cube, clim)
+    dates = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq='D')
+    written = 0
+    for date, slot in zip(dates, doy_slots(dates)):
+        has = np.isfinite(cube[..., slot]).any(axis=0)
+        if not has.any():
+            continue
+        rec = {'date': date.strftime('%Y-%m-%d'), 'region_ids': region_ids[has].tolist()}
+        for i, v in enumerate(variables):
+            rec[f'{v}_anom'] = _round_list(anom[i, has, slot])
+            rec[f'{v}_z'] = _round_list(z[i, has, slot])
+        with open(os.path.join(out_dir, f"{date.strftime('%Y%m%d')}.json"), 'w', encoding='utf-8') as f:
+            f.write(json.dumps(rec, ensure_ascii=False, separators=(',', ':')))
+        written += 1
+    return written
+
+
+def build_climatology(years: Sequence[int], roots: Optional[Sequence[str]] = None, out_dir: Optional[str] = None,
+                      state_dir: Optional[str] = None, anomaly_years: Optional[Sequence[int]] = None,
+                      window: int = CLIMATOLOGY_DOY_WINDOW, percentiles: Sequence[float] = CLIMATOLOGY_PERCENTILES,
+                      force: bool = False) -> dict:
+    """更新年立方体缓存 -> 合并气候态 -> 写出气候态与距平。anomaly_years 默认全部年份。"""
+    status = update_year_states(years, roots, state_dir, force)
+    cubes, region_ids, loaded_years, variables = load_year_states(years, state_dir)
+    if not loaded_years:
+        return {'years': status, 'anomaly_days': 0}
+    doy = doy_climatology(cubes, window, percentiles)
+    month = month_climatology(cubes, percentiles)
+    write_climatology(region_ids, loaded_years, variables, doy, month, percentiles, out_dir)
+    anomaly_days = 0
+    for k, year in enumerate(loaded_years):
+        if anomaly_years is None or year in anomaly_years:
+            anomaly_days += write_anomalies(year, cubes[k], region_ids, variables, doy, out_dir)
+    return {'years': status, 'anomaly_days': anomaly_days}
@@ -48,6 +48,60 @@ else:
 del _env_raw
 
 
+# 前端静态数据目录（front/public/data），行政区注册表等前后端共用的产物放在这里
+FRONT_DATA_DIR = os.path.join(_repo_root, 'front', 'public', 'data')
+# 行政区注册表：稳定的整数 region_id -> 规范中文省市名、所属省份与质心
+REGION_REGISTRY_PATH = os.path.join(FRONT_DATA_DIR, 'regions.json')
+# 行政区划参考表（省/市/县 + 经纬度），用于生成注册表中的质心
+REGION_REFERENCE_PATH = os.path.join(_repo_root, 'front', 'public', 'region.json')
+# 行政区质心表（多边形质心/面积、映射格点均值/格点数），由 extract 与 run_pipeline.py centroids 更新，见 src/centroids.py
+CENTROID_TABLE_PATH = os.path.join(FRONT_DATA_DIR, 'centroids.json')
+
+# 城市日数据分析库（SQLite 单文件），由 run_pipeline.py store 生成，见 src/store.py
+ANALYTICS_DB_PATH = os.path.join(RESOURCE_DIR, 'store', 'city_days.sqlite')
+# 城市日文件的默认查找根目录（前端数据目录 + extract 的城市级输出），各下游命令共用
+DAY_ROOTS = [FRONT_DATA_DIR, os.path.join(PROCESSED_DIR, 'city')]
+
+# 日文件读取缓存上限（字节），见 src/dayreader.py；可用环境变量 DAY_CACHE_MAX_MB 覆盖
+DAY_CACHE_MAX_BYTES = int(os.environ.get('DAY_CACHE_MAX_MB', '1024')) * 1024 * 1024
+
+# 多粒度汇总（src/rollup.py）输出目录
+ROLLUP_DIR = os.path.join(OUTPUT_DIR, 'rollups')
+
+# 滑动窗口统计（src/rolling.py）输出目录与默认窗口（天）
+ROLLING_DIR = os.path.join(OUTPUT_DIR, 'rolling')
+ROLLING_WINDOWS = (7, 30)
+# 列式趋势文件（src/trendstore.py）输出目录：每个 (层级, 频率) 一对 .trend.json/.trend.bin
+TRENDS_DIR = os.path.join(OUTPUT_DIR, 'trends')
+# 日均浓度二级限值（GB 3095-2012，HJ 633 达标评价用），超过即记为超标日；CO 为 mg/m³。
+# O3 的限值针对日最大 8 小时均值，日文件只有日均值时按日均值比较（结果偏少）
+DAILY_LIMITS = {
+    'pm25': 75.0,
+    'pm10': 150.0,
+    'so2': 150.0,
+    'no2': 80.0,
+    'co': 4.0,
+    'o3': 160.0,
+}
+
+# extract --extremes 时计算逐时日极值（{var}_max1h/_min1h/_peak_hour）的变量，O3 另有 o3_mda8（见 src/hourly.py）
+EXTREME_VARS = ('pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp')
+# extract --diurnal 时按 (区域, 时刻) 累加的变量；aggregate 合并为月度日变化廓线
+DIURNAL_VARS = ('pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh')
+# extract --wind-rose 的逐时风速分级（m/s，分级下界）：低于第一个值为静风，最后一级为 >= 最后一个值
+WIND_SPEED_BINS = (0.5, 2.0, 4.0, 6.0, 8.0, 10.0)
+
+# 多年气候态与距平（src/climatology.py）：输出到前端数据目录；day-of-year 平滑窗口（天，奇数）与百分位
+CLIMATOLOGY_DIR = os.path.join(FRONT_DATA_DIR, 'climatology')
+CLIMATOLOGY_DOY_WINDOW = 15
+CLIMATOLOGY_PERCENTILES = (10, 25, 50, 75, 90)
+
+# 污染物-气象相关矩阵（src/correlation.py，build-products --products correlation）：变量、最少样本数与默认滞后天数
+CORR_POLLUTANTS = ('pm25', 'pm10', 'so2', 'no2', 'co', 'o3')
+CORR_METEORS = ('temp', 'rh', 'psfc', 'u', 'v')
+CORR_MIN_SAMPLES = 10
+CORR_LAGS = (0,)
+
 # 临时清理清单 placed at repository root (if available) so processing and root runners share it
 TMP_CLEANUP_MANIFEST = os.path.join(_repo_root, 'tmp_dirs_to_cleanup.json')
 
@@ -61,6 +115,21 @@ AMAP_KEY = "a7335005d09683ee04c5e4e116c7d58e"
 # 缓存数据库（sqlite），用于存储经纬度->省市的映射，避免重复调用 API
 AMAP_CACHE_DB = os.path.join(RESOURCE_DIR, 'tmp', 'amap_cache.sqlite')
 
+# CN-Reanalysis 网格尺寸 (south-north, west-east)，见 util/readNC.py
+GRID_SHAPE = (339, 432)
+
+# 采暖季月份（与 util/generate_wind_rose.py 的 HEATING_MONTHS 一致），按先后顺序排列：
+# 采暖季跨年，按起始月（11 月）所在年份标记，'2015-heating' = 2015-11 ~ 2016-02
+HEATING_MONTHS = (11, 12, 1, 2)
+# 气象季节，每个季节的月份按先后顺序排列；季节按首月所在年份标记，
+# 跨年的冬季 'YYYY-winter' = YYYY 年 12 月 ~ 次年 2 月（见 rollup.season_labels）
+SEASON_MONTHS = {
+    'spring': (3, 4, 5),
+    'summer': (6, 7, 8),
+    'autumn': (9, 10, 11),
+    'winter': (12, 1, 2),
+}
+
 VAR_BOUNDS = {
     # 细颗粒物（μg/m³）——根据中国典型观测上限，极端污染不超过1000
     'pm25': (0.0, 800.0),
@@ -0,0 +1,176 @@
+"""污染物与气象要素的相关矩阵（替代前端 dataLoader.js 的 computeCorrMatrix）。
+
+样本为城市日：某一时段内某区域（或全部区域，即 global）的全部城市日记录。对每个分组
+（区域 × 时段）和每对 (污染物 x, 气象要素 y) 计算成对完整（两者都有效）的 Pearson 相关系数：
+
+    r = Σ(x - x̄)(y - ȳ) / sqrt(Σ(x - x̄)² Σ(y - ȳ)²)
+
+实现上不逐组、也不逐变量对循环：先减去每组各变量的均值（中心化，改善大数值如 psfc 的数值稳定性），
+再用按组补零的批量矩阵积一次求出所有组、所有变量对的 n / Σx / Σy / Σxy / Σx² / Σy²（见 pairwise_corr）。
+时段为 month / season（config.SEASON_MONTHS，按起始年份标记）/ year。
+
+滞后相关（lag = k 天）：污染物取当天，气象要素取同一区域 k 天前的值（在 (区域, 日) 稠密矩阵上平移，
+只在同一年内平移）。样本数少于 CORR_MIN_SAMPLES 的组合 value 记为 0（与前端 pearson 空样本时一致），
+同时输出 n 以便区分。
+"""
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from .config import CORR_METEORS, CORR_MIN_SAMPLES, CORR_POLLUTANTS, SEASON_MONTHS
+from .rollup import season_years
+
+SEASONS = tuple(SEASON_MONTHS)
+
+
+def _month_season(months: np.ndarray) -> np.ndarray:
+    """月份（1..12）-> 季节下标（SEASONS 中的位置）。"""
+    table = np.full(13, -1, dtype=np.int64)
+    for i, name in enumerate(SEASONS):
+        table[list(SEASON_MONTHS[name])] = i
+    return table[months]
+
+
+def pairwise_corr(groups: np.ndarray, n_groups: int, x: np.ndarray, y: np.ndarray,
+                  min_samples: int = CORR_MIN_SAMPLES) -> Tuple[np.ndarray, np.ndarray]:
+    """按分组的成对完整 Pearson 相关。
+
+    x 为 (样本, a)、y 为 (样本, b)，NaN 为缺测；groups 为每个样本的分组编码（< 0 忽略）。
+    返回 (r (n_groups, a, b)，样本数不足或方差为 0 时为 NaN；n (n_groups, a, b))。
+
+    不逐个变量对循环：每组各变量只中心化一次，缺测置 0 并配有效标记 m。样本按组排成
+    (组, 组内序号, 列) 的补零数组 L = [m_x, x, x²]、R = [m_y, y, y²]，一次批量矩阵积 Lᵀ R
+    即得每组、每对变量的成对完整 n / Σx / Σy / Σxy / Σx² / Σy²，再由
+    cov = Σxy - ΣxΣy/n、var = Σx² - (Σx)²/n 得到整组 (a, b) 矩阵。
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    a, b = x.shape[1], y.shape[1]
+    r = np.full((n_groups, a, b), np.nan)
+    n = np.zeros((n_groups, a, b), dtype=np.int64)
+    order = np.nonzero(groups >= 0)[0]
+    order = order[np.argsort(groups[order], kind='stable')]
+    if not len(order):
+        return r, n
+    g_sorted = groups[order]
+    starts = np.concatenate([[0], np.nonzero(np.diff(g_sorted))[0] + 1])
+    sizes = np.diff(np.append(starts, len(order)))
+    seg = np.repeat(np.arange(len(starts)), sizes)
+    width = int(sizes.max())
+    slot = seg * width + np.arange(len(order)) - starts[seg]
+
+    def stacked(v):
+        v = v[order]
+        m = np.isfinite(v)
+        v0 = np.where(m, v, 0.0)
+        # 按组中心化（只为数值稳定，成对完整样本的均值由下面的一阶和修正）
+        mean = np.add.reduceat(v0, starts, axis=0) / np.maximum(np.add.reduceat(m, starts, axis=0), 1)
+        vc = np.where(m, v0 - mean[seg], 0.0)
+        padded = np.zeros((len(starts) * width, 3 * v.shape[1]))
+        padded[slot] = np.concatenate([m, vc, vc * vc], axis=1)
+        return padded.reshape(len(starts), width, -1)
+
+    sums = np.matmul(stacked(x).transpose(0, 2, 1), stacked(y))
+    cnt, sx, sxx = sums[:, :a, :b], sums[:, a:2 * a, :b], sums[:, 2 * a:, :b]
+    sy, syy = sums[:, :a, b:2 * b], sums[:, :a, 2 * b:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sxy = sums[:, a:2 * a, b:2 * b] - sx * sy / cnt
+        vx = sxx - sx * sx / cnt
+        vy = syy - sy * sy / cnt
+        rij = sxy / np.sqrt(vx * vy)
+    # 常数序列的方差只剩舍入误差，按相对阈值视为 0
+    tol = 1e-12
+    ok = (cnt >= min_samples) & (vx > tol * sxx) & (vy > tol * syy)
+    present = g_sorted[starts]
+    n[present] = np.rint(cnt).astype(np.int64)
+    r[present] = np.where(ok, np.clip(rij, -1.0, 1.0), np.nan)
+    return r, n
+
+
+def lagged(values: np.ndarray, region: np.ndarray, day: np.ndarray, n_regions: int, n_days: int,
+           lag: int) -> np.ndarray:
+    """每行取同一区域 lag 天前的值（没有则 NaN）；values 为 (样本, 变量)。"""
+    if lag == 0:
+        return values
+    dense = np.full((n_regions, n_days, values.shape[1]), np.nan)
+    dense[region, day] = values
+    src = day - lag
+    ok = (src >= 0) & (src < n_days)
+    out = np.full(values.shape, np.nan)
+    out[ok] = dense[region[ok], src[ok]]
+    return out
+
+
+def _season_keys(months: np.ndarray, year: int) -> np.ndarray:
+    """月份 -> (季节起始年份 - (year - 1)) * 季节数 + 季节下标，按时间先后递增。"""
+    return (season_years(np.full(len(months), year), months) - (year - 1)) * len(SEASONS) + _month_season(months)
+
+
+def period_groups(months: np.ndarray, year: int):
+    """[(时段类型, 每行的时段编码, 时段标签)]：month / season / year。
+
+    季节按起始年份标记（同 rollup.season_labels）：一年的数据含 'Y-1-winter'（1、2 月）、
+    当年春夏秋与 'Y-winter'（12 月），跨年的冬季只含本年内的部分，样本数见记录中的 n。
+    """
+    months = np.asarray(months, dtype=np.int64)
+    keys = _season_keys(np.arange(1, 13), year)
+    uniq = np.unique(keys)
+    season_names = [f'{year - 1 + k // len(SEASONS)}-{SEASONS[k % len(SEASONS)]}' for k in uniq.tolist()]
+    return [
+        ('month', months - 1, [f'{year}-{m:02d}' for m in range(1, 13)]),
+        ('season', np.searchsorted(uniq, _season_keys(months, year)), season_names),
+        ('year', np.zeros(len(months), dtype=np.int64), [str(year)]),
+    ]
+
+
+def corr_records(r: np.ndarray, n: np.ndarray, pollutants: Sequence[str], meteors: Sequence[str]) -> list:
+    """一个 (a, b) 矩阵 -> CorrHeatmap.vue 的 [{pollutant, meteor, value, n}]（value 保留 2 位小数）。"""
+    pairs = [(p.upper(), m.upper()) for p in pollutants for m in meteors]
+    # + 0.0 把 -0.0 规整为 0.0
+    values = (np.round(np.where(np.isnan(r), 0.0, r), 2) + 0.0).ravel().tolist()
+    return [{'pollutant': p, 'meteor': m, 'value': v, 'n': c}
+            for (p, m), v, c in zip(pairs, values, n.ravel().tolist())]
+
+
+def correlation_tables(data, region: np.ndarray, day: np.ndarray, months: np.ndarray, n_regions: int, n_days: int,
+                       year: int, lags: Sequence[int] = (0,), pollutants: Sequence[str] = CORR_POLLUTANTS,
+                       meteors: Sequence[str] = CORR_METEORS) -> Dict[str, dict]:
+    """整年的城市日表 -> {'global': 文档, region 行号: 文档}。
+
+    文档格式：{'pollutants', 'meteors', 'lags', 'matrices': {lag: {时段类型: {时段标签: 记录列表}}}}。
+    """
+    pollutants = [p for p in pollutants if p in data.columns]
+    meteors = [m for m in meteors if m in data.columns]
+    region = np.asarray(region, dtype=np.int64)
+    day = np.asarray(day, dtype=np.int64)
+    x = data[pollutants].to_numpy(dtype='float64')
+    y_now = data[meteors].to_numpy(dtype='float64')
+
+    def doc():
+        return {'year': int(year), 'pollutants': [p.upper() for p in pollutants],
+                'meteors': [m.upper() for m in meteors], 'lags': [int(k) for k in lags], 'matrices': {}}
+
+    docs = {'global': doc()}
+    docs.update({g: doc() for g in np.unique(region).tolist()})
+    for lag in lags:
+        y = lagged(y_now, region, day, n_regions, n_days, int(lag))
+        for period, codes, labels in period_groups(months, year):
+            n_periods = len(labels)
+            # 两次 pairwise_corr：全局按时段分组，分区域按 区域 × 时段 分组；每次都是一次按组补零的批量矩阵积
+            r_g, n_g = pairwise_corr(codes, n_periods, x, y)
+            keys = np.where(codes >= 0, region * n_periods + codes, -1)
+            r_r, n_r = pairwise_corr(keys, n_regions * n_periods, x, y)
+            docs['global']['matrices'].setdefault(str(lag), {})[period] = {
+                label: corr_records(r_g[k], n_g[k], pollutants, meteors)
+                for k, label in enumerate(labels) if n_g[k].any()}
+            for g in docs:
+                if g == 'global':
+                    continue
+                block = {}
+                for k, label in enumerate(labels):
+                    idx = g * n_periods + k
+                    if n_r[idx].any():
+                        block[label] = corr_records(r_r[idx], n_r[idx], pollutants, meteors)
+                docs[g]['matrices'].setdefault(str(lag), {})[period] = block
+    return docs
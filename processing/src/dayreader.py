@@ -0,0 +1,211 @@
+"""统一的日文件读取层（带字节上限的 LRU 缓存）。
+
+提取步骤按输出选项会写出不同格式的日文件：``YYYYMMDD.json``（数值为字符串）、
+``YYYYMMDD.csv`` / ``.parquet``（旧流程）以及网格级的 ``YYYYMMDD.qgrid.json``。
+下游工具统一通过本模块读取：
+
+- ``discover_days`` 在 ``<root>/<year>/<mm>/<dd>/`` 下查找任意格式的日文件（同一天多种格式时
+  按 qgrid > parquet > csv > json 取一个）；
+- ``read_day`` 解析为类型规整的 DataFrame：变量列为 float64，region_id 为 Int64，
+  并带 datetime64 类型的 ``date`` 列；
+- ``read_days`` 用线程池并行读取并拼接；解析结果缓存在进程内 LRU 中（按 DataFrame 占用字节数
+  限额，键含文件 mtime/size），同一会话构建多个产品时每天只解析一次。
+"""
+import os
+import re
+import glob
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Sequence, Union
+
+import pandas as pd
+
+from .config import DAY_CACHE_MAX_BYTES
+from .gridcodec import QGRID_SUFFIX, read_qgrid_frame
+
+NUMERIC_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v', 'lat', 'lon']
+# 同一天存在多种格式时的优先级（数值越小越优先）
+_FORMAT_PRIORITY = {'qgrid': 0, 'parquet': 1, 'csv': 2, 'json': 3}
+_DAY_RE = re.compile(r'^(\d{8})(\.qgrid\.json|\.parquet|\.csv|\.json)$')
+
+DayFile = namedtuple('DayFile', ['date', 'path', 'fmt'])
+
+
+def _fmt_of(suffix: str) -> str:
+    return 'qgrid' if suffix == QGRID_SUFFIX else suffix.lstrip('.')
+
+
+def discover_days(root: str, year: Optional[int] = None, month: Optional[int] = None,
+                  start=None, end=None) -> List[DayFile]:
+    """查找 root 下的日文件，返回按日期排序的 [DayFile(date=Timestamp, path, fmt)]。
+
+    root 可以是数据根目录（其下为 <year>/...）或某年/某月目录；year/month 仅用于缩小 glob 范围
+    并按文件名过滤，start/end 为闭区间日期过滤。
+    """
+    search = root
+    if year is not None and os.path.isdir(os.path.join(root, str(year))):
+        search = os.path.join(root, str(year))
+        if month is not None and os.path.isdir(os.path.join(search, f'{month:02d}')):
+            search = os.path.join(search, f'{month:02d}')
+    prefix = f'{year}' if year is not None else ''
+    if year is not None and month is not None:
+        prefix += f'{month:02d}'
+    best = {}
+    for path in glob.glob(os.path.join(search, '**', prefix + '*'), recursive=True):
+        m = _DAY_RE.match(os.path.basename(path))
+        if not m:
+            continue
+        day, fmt = m.group(1), _fmt_of(m.group(2))
+        if not day.startswith(prefix):
+            continue
+        cur = best.get(day)
+        if cur is None or _FORMAT_PRIORITY[fmt] < _FORMAT_PRIORITY[cur.fmt]:
+            best[day] = DayFile(pd.Timestamp(f'{day[:4]}-{day[4:6]}-{day[6:8]}'), path, fmt)
+    files = [best[d] for d in sorted(best)]
+    if start is not None:
+        files = [f for f in files if f.date >= pd.Timestamp(start)]
+    if end is not None:
+        files = [f for f in files if f.date <= pd.Timestamp(end)]
+    return files
+
+
+def _day_file(path_or_day: Union[str, DayFile]) -> DayFile:
+    if isinstance(path_or_day, DayFile):
+        return path_or_day
+    m = _DAY_RE.match(os.path.basename(path_or_day))
+    if not m:
+        raise ValueError(f'not a day file (expected YYYYMMDD.<fmt>): {path_or_day}')
+    day = m.group(1)
+    return DayFile(pd.Timestamp(f'{day[:4]}-{day[4:6]}-{day[6:8]}'), path_or_day, _fmt_of(m.group(2)))
+
+
+def read_day(path_or_day: Union[str, DayFile], columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """不经缓存地读取并规整一个日文件。columns 为需要保留的列（date 总会保留）。"""
+    day = _day_file(path_or_day)
+    if day.fmt == 'qgrid':
+        df = read_qgrid_frame(day.path, [c for c in columns if c not in ('lat', 'lon')] if columns else None)
+    elif day.fmt == 'parquet':
+        df = pd.read_parquet(day.path)
+    elif day.fmt == 'csv':
+        df = pd.read_csv(day.path)
+    else:
+        with open(day.path, 'r', encoding='utf-8') as f:
+            df = pd.DataFrame(json.load(f))
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    if columns is not None:
+        df = df[[c for c in df.columns if c in columns]]
+    for c in df.columns:
+        if c in NUMERIC_VARS:
+            df[c] = pd.to_numeric(df[c], errors='coerce').astype('float64')
+    if 'region_id' in df.columns:
+        df['region_id'] = pd.to_numeric(df['region_id'], errors='coerce').astype('Int64')
+    if 'time' in df.columns:
+        df['time'] = pd.to_datetime(df['time'], errors='coerce')
+    df['date'] = day.date
+    return df
+
+
+class DayCache:
+    """线程安全的 LRU 缓存，按缓存 DataFrame 的 memory_usage(deep=True) 总和限额。"""
+
+    def __init__(self, max_bytes: int = DAY_CACHE_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str, columns):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size, tuple(columns) if columns else None)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, df: pd.DataFrame):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._items[key] = (df, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and self._items:
+                _, (_, s) = self._items.popitem(last=False)
+                self.nbytes -= s
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+_DEFAULT_CACHE = DayCache()
+
+
+def get_cache() -> DayCache:
+    return _DEFAULT_CACHE
+
+
+def read_day_cached(path_or_day: Union[str, DayFile], columns: Optional[Sequence[str]] = None,
+                    cache: Optional[DayCache] = None) -> pd.DataFrame:
+    """带缓存的 read_day。返回的是缓存对象的副本，调用方可以放心修改。"""
+    cache = _DEFAULT_CACHE if cache is None else cache
+    day = _day_file(path_or_day)
+    key = cache._key(day.path, columns)
+    df = cache.get(key)
+    if df is None:
+        df = read_day(day, columns)
+        cache.put(key, df)
+    return df.copy()
+
+
+def read_days(files: Union[str, Iterable[Union[str, DayFile]]], year: Optional[int] = None,
+              month: Optional[int] = None, start=None, end=None, columns: Optional[Sequence[str]] = None,
+              workers: int = 8, cache: Optional[DayCache] = None, on_error: str = 'warn') -> pd.DataFrame:
+    """并行读取多个日文件并按日期顺序拼接。
+
+    files 可以是根目录（此时用 discover_days(root, year, month, start, end) 查找），
+    也可以是路径 / DayFile 的列表。读取失败的文件按 on_error 处理：'warn' 打印并跳过，'raise' 抛出。
+    """
+    if isinstance(files, str):
+        days = discover_days(files, year, month, start, end)
+    else:
+        days = [_day_file(f) for f in files]
+    if not days:
+        return pd.DataFrame()
+
+    def _one(day):
+        try:
+            return read_day_cached(day, columns, cache)
+        except Exception as e:
+            if on_error == 'raise':
+                raise
+            print(f"warning: failed reading {day.path}: {e}")
+            return None
+
+    if workers and workers > 1 and len(days) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(days))) as ex:
+            parts = list(ex.map(_one, days))
+    else:
+        parts = [_one(d) for d in days]
+    parts = [p for p in parts if p is not None and not p.empty]
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,227 @@
+"""网格级输出的紧凑量化编码（qgrid）。
+
+`--no-mapping` 模式下每天约 14.6 万个网格单元，按 JSON 字符串保存体积过大。qgrid 格式：
+
+- 每天两个文件：``YYYYMMDD.qgrid.json``（小的 JSON 头）+ ``YYYYMMDD.qgrid.bin``（二进制数组）；
+- 每个变量存为 uint16 编码，``value = offset + code * scale``；量化区间取该变量当天的
+  实际范围并裁剪到 VAR_BOUNDS，因此最大量化误差为 scale / 2；
+- 每个变量附带一个有效位掩码（np.packbits，1 = 有效），NaN 不占用编码值；
+- 经纬度按网格在数据集根目录只保存一次（``coords.<校验值>.qgrid.json`` + ``.qgrid.bin``，float32）：
+  每种网格一对文件，日文件头中记录所用坐标文件的相对路径与校验值，读取时校验，不一致直接报错。
+
+所有数组均为小端序，头中记录每个数组在 .bin 中的字节偏移，便于前端用 ArrayBuffer 直接切片读取。
+"""
+import os
+import json
+import zlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import VAR_BOUNDS
+
+QGRID_VERSION = 1
+QGRID_SUFFIX = '.qgrid.json'
+COORDS_BASENAME = 'coords'
+_CHECKSUM_CHARS = 12
+_CODE_MAX = np.iinfo(np.uint16).max
+
+
+def quantization_params(values: np.ndarray, bounds: Optional[Tuple[float, float]] = None) -> Tuple[float, float]:
+    """根据变量的有效取值范围（并裁剪到物理范围）选择 (offset, scale)。"""
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return 0.0, 1.0
+    lo = float(finite.min())
+    hi = float(finite.max())
+    if bounds is not None:
+        lo = max(lo, float(bounds[0]))
+        hi = min(hi, float(bounds[1]))
+        if hi < lo:
+            lo, hi = float(bounds[0]), float(bounds[1])
+    if hi <= lo:
+        return lo, 1.0
+    return lo, (hi - lo) / _CODE_MAX
+
+
+def quantize(values: np.ndarray, offset: float, scale: float) -> Tuple[np.ndarray, np.ndarray]:
+    """把浮点数组编码为 (uint16 codes, bool valid)。超出量化区间的值被截断到端点。"""
+    values = np.asarray(values, dtype=np.float64).ravel()
+    valid = np.isfinite(values)
+    codes = np.zeros(values.shape, dtype=np.uint16)
+    scaled = np.rint((values[valid] - offset) / scale)
+    codes[valid] = np.clip(scaled, 0, _CODE_MAX).astype(np.uint16)
+    return codes, valid
+
+
+def dequantize(codes: np.ndarray, valid: np.ndarray, offset: float, scale: float) -> np.ndarray:
+    """解码为 float64：误差只来自量化本身（<= scale / 2，即头中的 max_error），不再叠加 float32 舍入。"""
+    out = offset + codes.astype(np.float64) * scale
+    out[~valid] = np.nan
+    return out
+
+
+def _coords_checksum(lat: np.ndarray, lon: np.ndarray) -> str:
+    crc = zlib.crc32(np.ascontiguousarray(lat, dtype='<f4').tobytes())
+    crc = zlib.crc32(np.ascontiguousarray(lon, dtype='<f4').tobytes(), crc)
+    return f"{crc:08x}"
+
+
+def _write_pair(base_path: str, header: dict, chunks) -> str:
+    bin_path = base_path + '.qgrid.bin'
+    json_path = base_path + QGRID_SUFFIX
+    header['bin'] = os.path.basename(bin_path)
+    with open(bin_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(header, f, ensure_ascii=False, separators=(',', ':'))
+    return json_path
+
+
+def coords_basename(checksum: str) -> str:
+    return f'{COORDS_BASENAME}.{checksum[:_CHECKSUM_CHARS]}'
+
+
+def write_coords(dataset_dir: str, lat: np.ndarray, lon: np.ndarray, shape: Tuple[int, ...]) -> str:
+    """在数据集根目录写入共享经纬度 coords.<校验值>.qgrid.json|bin（同一网格已存在则直接返回）。
+
+    不同网格的坐标各占一对文件，已有文件不会被覆盖。
+    """
+    lat = np.asarray(lat, dtype='<f4').ravel()
+    lon = np.asarray(lon, dtype='<f4').ravel()
+    checksum = _coords_checksum(lat, lon)
+    base = os.path.join(dataset_dir, coords_basename(checksum))
+    json_path = base + QGRID_SUFFIX
+    if os.path.exists(json_path):
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                if json.load(f).get('checksum') == checksum:
+                    return json_path
+        except Exception:
+            pass
+    os.makedirs(dataset_dir, exist_ok=True)
+    header = {
+        'format': 'qgrid-coords', 'version': QGRID_VERSION,
+        'shape': [int(s) for s in shape], 'n': int(lat.size), 'checksum': checksum,
+        'arrays': {
+            'lat': {'dtype': '<f4', 'offset': 0, 'nbytes': int(lat.nbytes)},
+            'lon': {'dtype': '<f4', 'offset': int(lat.nbytes), 'nbytes': int(lon.nbytes)},
+        },
+    }
+    return _write_pair(base, header, [lat.tobytes(), lon.tobytes()])
+
+
+def read_coords(json_path: str, checksum: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, dict]:
+    """读取坐标文件，返回 (lat, lon, header)，数组均为一维 float32。
+
+    按数组内容重算校验值；与文件头不一致，或给定的 checksum（日文件头中记录的值）不一致时抛出 ValueError。
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    raw = np.fromfile(os.path.join(os.path.dirname(json_path), header['bin']), dtype=np.uint8)
+    arrays = {}
+    for name, meta in header['arrays'].items():
+        arrays[name] = raw[meta['offset']:meta['offset'] + meta['nbytes']].view(meta['dtype'])
+    actual = _coords_checksum(arrays['lat'], arrays['lon'])
+    if actual != header.get('checksum'):
+        raise ValueError(f'{json_path}: coords checksum {actual} does not match header {header.get("checksum")}')
+    if checksum is not None and actual != checksum:
+        raise ValueError(f'{json_path}: coords checksum {actual} does not match expected {checksum}')
+    return arrays['lat'], arrays['lon'], header
+
+
+def encode_grid(values: Dict[str, np.ndarray], bounds: Optional[Dict[str, Tuple[float, float]]] = None):
+    """把 {变量: 一维数组} 编码为 (header_vars, chunks)。所有数组长度必须一致。"""
+    bounds = VAR_BOUNDS if bounds is None else bounds
+    header_vars = {}
+    chunks = []
+    pos = 0
+    n = None
+    for name, arr in values.items():
+        arr = np.asarray(arr, dtype=np.float64).ravel()
+        if n is None:
+            n = arr.size
+        elif arr.size != n:
+            raise ValueError(f'variable {name} has {arr.size} cells, expected {n}')
+        offset, scale = quantization_params(arr, bounds.get(name))
+        codes, valid = quantize(arr, offset, scale)
+        mask = np.packbits(valid, bitorder='little')
+        code_bytes = codes.astype('<u2').tobytes()
+        # uint16 数组按 2 字节对齐，方便前端直接构造 Uint16Array
+        pad = (-(pos + mask.nbytes)) % 2
+        header_vars[name] = {
+            'dtype': '<u2', 'offset': offset, 'scale': scale,
+            'max_error': scale / 2.0, 'valid_count': int(valid.sum()),
+            'mask_offset': pos, 'mask_nbytes': int(mask.nbytes),
+            'data_offset': pos + int(mask.nbytes) + pad, 'data_nbytes': len(code_bytes),
+        }
+        chunks.extend([mask.tobytes(), b'\x00' * pad, code_bytes])
+        pos += int(mask.nbytes) + pad + len(code_bytes)
+    return header_vars, chunks, (n or 0)
+
+
+def write_qgrid(base_path: str, values: Dict[str, np.ndarray], shape: Tuple[int, ...],
+                coords: Optional[Tuple[np.ndarray, np.ndarray]] = None, dataset_dir: Optional[str] = None,
+                bounds: Optional[Dict[str, Tuple[float, float]]] = None, extra: Optional[dict] = None) -> str:
+    """写一天的 qgrid 文件，返回 JSON 头路径。
+
+    base_path 不带扩展名（例如 .../grid/2013/01/01/20130101）。coords=(lat, lon) 时同时
+    确保 dataset_dir 下存在该网格的坐标文件，并在头中记录其相对路径与校验值。
+    """
+    header_vars, chunks, n = encode_grid(values, bounds)
+    header = {'format': 'qgrid', 'version': QGRID_VERSION, 'shape': [int(s) for s in shape], 'n': int(n),
+              'vars': header_vars}
+    if coords is not None and dataset_dir is not None:
+        coords_json = write_coords(dataset_dir, coords[0], coords[1], shape)
+        header['coords'] = os.path.relpath(coords_json, os.path.dirname(base_path)).replace(os.sep, '/')
+        with open(coords_json, 'r', encoding='utf-8') as f:
+            header['coords_checksum'] = json.load(f)['checksum']
+    if extra:
+        header.update(extra)
+    os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+    return _write_pair(base_path, header, chunks)
+
+
+def read_qgrid(json_path: str, variables=None) -> Tuple[Dict[str, np.ndarray], dict]:
+    """读取 qgrid 日文件，返回 ({变量: float64 一维数组（无效为 NaN）}, header)。"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    raw = np.fromfile(os.path.join(os.path.dirname(json_path), header['bin']), dtype=np.uint8)
+    n = header['n']
+    out = {}
+    for name, meta in header['vars'].items():
+        if variables is not None and name not in variables:
+            continue
+        mask = raw[meta['mask_offset']:meta['mask_offset'] + meta['mask_nbytes']]
+        valid = np.unpackbits(mask, count=n, bitorder='little').astype(bool)
+        codes = raw[meta['data_offset']:meta['data_offset'] + meta['data_nbytes']].view('<u2')
+        out[name] = dequantize(codes, valid, meta['offset'], meta['scale'])
+    return out, header
+
+
+def day_coords(json_path: str, header: Optional[dict] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """日文件头引用的坐标 (lat, lon)；头中没有坐标时返回 None。校验值或长度不一致时抛出 ValueError。"""
+    if header is None:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+    coords_ref = header.get('coords')
+    if not coords_ref:
+        return None
+    coords_json = os.path.normpath(os.path.join(os.path.dirname(json_path), coords_ref))
+    lat, lon, _ = read_coords(coords_json, header.get('coords_checksum'))
+    if lat.size != header['n']:
+        raise ValueError(f'{json_path}: coords have {lat.size} cells, expected {header["n"]}')
+    return lat, lon
+
+
+def read_qgrid_frame(json_path: str, variables=None) -> pd.DataFrame:
+    """把 qgrid 日文件还原为 DataFrame（lat, lon, 变量...），行顺序与网格展开顺序一致。"""
+    values, header = read_qgrid(json_path, variables)
+    frame = {}
+    coords = day_coords(json_path, header)
+    if coords is not None:
+        frame['lat'], frame['lon'] = coords
+    frame.update(values)
+    return pd.DataFrame(frame)
@@ -0,0 +1,257 @@
+"""由逐小时网格派生的日指标（在 extract 同一遍读取中计算）。
+
+process_single_zip 解码出的每小时网格先按变量堆成 (小时, 格点) 数组（stack_items，日均值也由它求），
+之后所有指标都是沿小时轴的整块数组运算：
+
+* 日最大/最小值与最大值出现的小时：``{var}_max1h`` / ``{var}_min1h`` / ``{var}_peak_hour``
+* O3 日最大 8 小时滑动平均（MDA8）：``o3_mda8``。8 小时窗口以 cumsum 差分求均值，
+  窗口内有效小时数 >= 6 才有效（HJ 633-2012），取当天结束于 07..23 时的各窗口最大值。
+
+网格级输出直接带上逐格点的指标；省市级输出先把每小时格点值按行政区平均成 (小时, 区域) 序列，
+再在区域序列上求同样的指标（即城市的 MDA8 是城市逐时均值的 MDA8，而不是格点 MDA8 的平均）。
+小时轴是时钟时刻：堆叠顺序只是 zip 内成功读取的 .nc 的先后（读取失败的成员会被跳过，之后的
+小时整体前移），因此计算前先按文件名中的时刻（hour_of_day）放进固定 24 格、缺测为 NaN 的时刻轴
+（clock_stacks），峰值小时即真实时刻，MDA8 的 8 小时窗口也只覆盖相邻时刻。
+
+日变化（diurnal）：每天按 (变量, 区域, 时刻 0..23) 累加和与有效格点数，写成日文件旁的
+``YYYYMMDD_diurnal.npz``；月度汇总只需把同月的 sums/counts 相加（merge_diurnal），
+均值廓线 = sums / counts。时刻取 .nc 文件名末尾的 HH（CN-ReanalysisYYYYMMDDHH.nc，与文件时间一致）。
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import DIURNAL_VARS, EXTREME_VARS
+
+HOURLY_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+MDA8_WINDOW = 8
+MDA8_MIN_HOURS = 6
+HOURS_PER_DAY = 24
+
+_HOUR_RE = re.compile(r'\d{8}(\d{2})$')
+
+
+def hour_of_day(names: Sequence[str]) -> np.ndarray:
+    """.nc 成员名 -> 时刻（0..23）；文件名里没有 YYYYMMDDHH 时按排序位置编号。"""
+    hours = []
+    for pos, name in enumerate(names):
+        m = _HOUR_RE.search(os.path.splitext(os.path.basename(name))[0])
+        h = int(m.group(1)) if m else pos
+        hours.append(h if 0 <= h < HOURS_PER_DAY else pos % HOURS_PER_DAY)
+    return np.asarray(hours, dtype=np.int64)
+
+
+def stack_items(items: List[dict], variables: Optional[Sequence[str]] = None):
+    """把每小时 item 列表堆成 (Lat2d, Lon2d, {var: (小时, 格点) float64})。
+
+    与 temporal_aggregation 相同的容错：尺寸不符的变量整小时记为 NaN，标量广播到全部格点。
+    """
+    first = items[0]
+    lat, lon = first.get('lat'), first.get('lon')
+    if lat is None or lon is None:
+        raise ValueError('items must include lat and lon')
+    lat_arr, lon_arr = np.array(lat), np.array(lon)
+    if lat_arr.ndim == 1 and lon_arr.ndim == 1:
+        Lon, Lat = np.meshgrid(lon_arr, lat_arr)
+    else:
+        Lon, Lat = lon_arr, lat_arr
+    n = Lat.size
+    if variables is None:
+        names = set()
+        for it in items:
+            names.update(k for k in it.keys() if k not in ('lat', 'lon', 'time', 'geometry'))
+        variables = sorted(names)
+    stacks = {}
+    for v in variables:
+        stacked = np.full((len(items), n), np.nan)
+        for h, it in enumerate(items):
+            try:
+                arr = np.asarray(it.get(v), dtype='float64')
+            except (TypeError, ValueError):
+                continue
+            if arr.size == n:
+                stacked[h] = arr.ravel()
+            elif arr.size == 1:
+                stacked[h] = arr.item()
+        stacks[v] = stacked
+    return Lat, Lon, stacks
+
+
+def apply_bounds(stacks: Dict[str, np.ndarray], bounds: Dict[str, Tuple[float, float]]) -> None:
+    """超出物理范围的逐时值置为 NaN（就地，与日均值的 remove_physical_bounds 一致）。"""
+    for v, (lo, hi) in (bounds or {}).items():
+        if v in stacks:
+            with np.errstate(invalid='ignore'):
+                stacks[v][(stacks[v] < lo) | (stacks[v] > hi)] = np.nan
+
+
+def clock_stacks(stacks: Dict[str, np.ndarray], hours: Sequence[int]) -> Dict[str, np.ndarray]:
+    """{var: (小时, ...)} -> {var: (24, ...)}：第 h 格为时刻 h 的值，没有文件的时刻为 NaN。
+
+    hours 与 stacks 的小时轴一一对应（hour_of_day 的结果）；同一时刻出现多次（重复文件）时取有效值的平均。
+    """
+    hours = np.asarray(hours, dtype=np.int64)
+    out = {}
+    for v, stack in stacks.items():
+        valid = np.isfinite(stack)
+        sums = np.zeros((HOURS_PER_DAY,) + stack.shape[1:])
+        counts = np.zeros((HOURS_PER_DAY,) + stack.shape[1:], dtype=np.int64)
+        np.add.at(sums, hours, np.where(valid, stack, 0.0))
+        np.add.at(counts, hours, valid)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[v] = np.where(counts > 0, sums / counts, np.nan)
+    return out
+
+
+def daily_extremes(stack: np.ndarray):
+    """(小时, ...) -> (日最大, 日最小, 最大值所在小时)；全天缺测为 NaN / -1。"""
+    valid = np.isfinite(stack)
+    any_valid = valid.any(axis=0)
+    peak = np.argmax(np.where(valid, stack, -np.inf), axis=0)
+    vmax = np.where(any_valid, np.take_along_axis(stack, peak[None], axis=0)[0], np.nan)
+    vmin = np.where(any_valid, np.where(valid, stack, np.inf).min(axis=0), np.nan)
+    return vmax, vmin, np.where(any_valid, peak, -1)
+
+
+def mda8(stack: np.ndarray, window: int = MDA8_WINDOW, min_hours: int = MDA8_MIN_HOURS) -> np.ndarray:
+    """(小时, ...) -> 日最大 8 小时滑动平均；没有任何有效窗口时为 NaN。"""
+    if stack.shape[0] < window:
+        return np.full(stack.shape[1:], np.nan)
+    valid = np.isfinite(stack)
+    zeros = np.zeros((1,) + stack.shape[1:])
+    cs = np.concatenate([zeros, np.cumsum(np.where(valid, stack, 0.0), axis=0)])
+    cn = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+    sums = cs[window:] - cs[:-window]
+    counts = cn[window:] - cn[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts >= min_hours, sums / counts, np.nan)
+    return np.fmax.reduce(means, axis=0)
+
+
+def hourly_features(stacks: Dict[str, np.ndarray], variables: Sequence[str] = EXTREME_VARS,
+                    hours: Optional[Sequence[int]] = None) -> Dict[str, np.ndarray]:
+    """对 {var: (小时, ...)} 计算 {var}_max1h/_min1h/_peak_hour 与 o3_mda8，返回 {列名: 数组}。
+
+    hours 为各小时的时钟时刻（hour_of_day），给出时先放到 24 格时刻轴上（clock_stacks）；
+    不给时假定 stacks 已经是时刻轴。
+    """
+    if hours is not None:
+        stacks = clock_stacks({v: stacks[v] for v in set(variables) | {'o3'} if v in stacks}, hours)
+    out = {}
+    for v in variables:
+        if v not in stacks:
+            continue
+        vmax, vmin, peak = daily_extremes(stacks[v])
+        out[f'{v}_max1h'] = vmax
+        out[f'{v}_min1h'] = vmin
+        out[f'{v}_peak_hour'] = np.where(peak >= 0, peak, np.nan)
+    if 'o3' in stacks:
+        out['o3_mda8'] = mda8(stacks['o3'])
+    return out
+
+
+def hour_region_keys(hours: int, cell_region: np.ndarray, n_regions: int):
+    """(小时, 格点) 展平后的 bincount 键 h * (n_regions + 1) + 区域，以及每个键的格点数。
+
+    不属于任何区域（-1）的格点落到每小时末尾的收纳格，这样各变量都不必再按掩码取子集；
+    同一天的多个变量共用一份键。
+    """
+    slot = np.where(cell_region >= 0, cell_region, n_regions)
+    keys = (np.arange(hours)[:, None] * (n_regions + 1) + slot[None, :]).ravel()
+    return keys, np.bincount(keys, minlength=hours * (n_regions + 1))
+
+
+def region_hourly(stack: np.ndarray, cell_region: np.ndarray, n_regions: int, keys=None):
+    """(小时, 格点) 按 cell_region（-1 表示不属于任何区域）求每小时的区域和与有效格点数，形状 (小时, 区域)。
+
+    keys 为 hour_region_keys 的结果（多个变量复用时传入）。
+    """
+    hours = stack.shape[0]
+    keys, full = keys if keys is not None else hour_region_keys(hours, cell_region, n_regions)
+    size = hours * (n_regions + 1)
+    values = stack.ravel()
+    missing = ~np.isfinite(values)
+    if missing.any():
+        sums = np.bincount(keys, weights=np.where(missing, 0.0, values), minlength=size)
+        counts = full - np.bincount(keys[missing], minlength=size)
+    else:
+        sums, counts = np.bincount(keys, weights=values, minlength=size), full
+    shape = (hours, n_regions + 1)
+    return sums.reshape(shape)[:, :n_regions], counts.reshape(shape)[:, :n_regions]
+
+
+def region_features(stacks: Dict[str, np.ndarray], cell_region: np.ndarray, n_regions: int,
+                    variables: Sequence[str] = EXTREME_VARS,
+                    hours: Optional[Sequence[int]] = None) -> Dict[str, np.ndarray]:
+    """先求各区域的逐时均值序列 (小时, 区域)，再在其上计算 hourly_features（hours 同 hourly_features）。"""
+    needed = [v for v in set(variables) | {'o3'} if v in stacks]
+    if not needed:
+        return {}
+    series = {}
+    keys = hour_region_keys(stacks[needed[0]].shape[0], cell_region, n_regions)
+    for v in needed:
+        sums, counts = region_hourly(stacks[v], cell_region, n_regions, keys)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            series[v] = np.where(counts > 0, sums / counts, np.nan)
+    return hourly_features(series, variables, hours)
+
+
+def diurnal_sums(stacks: Dict[str, np.ndarray], hours: Sequence[int], cell_region: np.ndarray, n_regions: int,
+                 variables: Sequence[str] = DIURNAL_VARS):
+    """一天的逐时网格 -> (变量列表, sums (变量, 区域, 24) float64, counts (变量, 区域, 24) int32)。
+
+    hours 与 stacks 的小时轴一一对应；同一时刻出现多次（重复文件）时累加。
+    """
+    variables = [v for v in variables if v in stacks]
+    hours = np.asarray(hours, dtype=np.int64)
+    sums = np.zeros((len(variables), n_regions, HOURS_PER_DAY))
+    counts = np.zeros((len(variables), n_regions, HOURS_PER_DAY), dtype=np.int32)
+    keys = hour_region_keys(len(hours), cell_region, n_regions)
+    for i, v in enumerate(variables):
+        s, c = region_hourly(stacks[v], cell_region, n_regions, keys)
+        np.add.at(sums[i].T, hours, s)
+        np.add.at(counts[i].T, hours, c)
+    return variables, sums, counts
+
+
+def write_diurnal(path: str, region_ids: Sequence[int], variables: Sequence[str],
+                  sums: np.ndarray, counts: np.ndarray) -> str:
+    """写出单日（或已合并）的日变化累加量。"""
+    np.savez_compressed(path, region_ids=np.asarray(region_ids, dtype=np.int64), variables=np.asarray(variables),
+                        sums=sums, counts=counts)
+    return path
+
+
+def merge_diurnal(paths: Sequence[str]):
+    """把若干 diurnal npz 按 region_id / 变量对齐后相加。
+
+    返回 (region_ids, variables, sums, counts, days)；days 为每个区域出现的文件数。无文件时返回 None。
+    """
+    parts = []
+    for p in paths:
+        with np.load(p) as data:
+            parts.append((data['region_ids'], [str(v) for v in data['variables']], data['sums'], data['counts']))
+    if not parts:
+        return None
+    region_ids = np.unique(np.concatenate([p[0] for p in parts]))
+    variables = [v for v in DIURNAL_VARS if any(v in p[1] for p in parts)]
+    variables += sorted({v for p in parts for v in p[1]} - set(variables))
+    sums = np.zeros((len(variables), len(region_ids), HOURS_PER_DAY))
+    counts = np.zeros((len(variables), len(region_ids), HOURS_PER_DAY), dtype=np.int64)
+    days = np.zeros(len(region_ids), dtype=np.int64)
+    for ids, names, s, c in parts:
+        rows = np.searchsorted(region_ids, ids)
+        days[rows] += 1
+        for j, v in enumerate(names):
+            i = variables.index(v)
+            sums[i, rows] += s[j]
+            counts[i, rows] += c[j]
+    return region_ids, variables, sums, counts, days
+
+
+def diurnal_profiles(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """累加量 -> 均值廓线（无有效样本的时刻为 NaN），形状同 sums。"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
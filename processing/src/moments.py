@@ -0,0 +1,105 @@
+"""可合并的汇总矩（count, sum, sumsq, min, max）。
+
+月/季/年汇总都由这五个量按区域相加（min/max 取极值）得到，均值与标准差再由合并后的矩计算，
+因此年度统计只需读 12 个月度文件，结果与直接从日数据计算完全一致（不再是“月均值的均值/标准差”）。
+
+列命名：``{var}_count``、``{var}_sum``、``{var}_sumsq``、``{var}_min``、``{var}_max``；
+finalize_moments 额外写出 ``{var}_mean``、``{var}_std``（默认样本标准差 ddof=1，与 pandas 的 std 一致）。
+"""
+from typing import Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+MOMENT_STATS = ('count', 'sum', 'sumsq', 'min', 'max')
+
+
+def moment_columns(variables: Iterable[str]) -> List[str]:
+    return [f'{v}_{s}' for v in variables for s in MOMENT_STATS]
+
+
+def compute_moments(df: pd.DataFrame, keys: Sequence[str], variables: Sequence[str]) -> pd.DataFrame:
+    """对原始观测（如城市日值）按 keys 分组计算五个矩，NaN 不计入。"""
+    variables = [v for v in variables if v in df.columns]
+    values = df[list(keys) + variables].copy()
+    for v in variables:
+        values[v] = pd.to_numeric(values[v], errors='coerce').astype('float64')
+        values[f'{v}__sq'] = values[v] ** 2
+    grouped = values.groupby(list(keys), sort=True)
+    spec = {}
+    for v in variables:
+        spec[f'{v}_count'] = (v, 'count')
+        spec[f'{v}_sum'] = (v, 'sum')
+        spec[f'{v}_sumsq'] = (f'{v}__sq', 'sum')
+        spec[f'{v}_min'] = (v, 'min')
+        spec[f'{v}_max'] = (v, 'max')
+    out = grouped.agg(**spec).reset_index()
+    # 全部缺测的组 sum 为 0，这里统一置为 NaN，避免被误当作有效值
+    for v in variables:
+        empty = out[f'{v}_count'] == 0
+        out.loc[empty, [f'{v}_sum', f'{v}_sumsq']] = np.nan
+    return out
+
+
+def merge_moments(df: pd.DataFrame, keys: Sequence[str], variables: Sequence[str]) -> pd.DataFrame:
+    """把已有的矩按 keys 合并（count/sum/sumsq 相加，min/max 取极值），O(行数)。"""
+    variables = [v for v in variables if f'{v}_count' in df.columns]
+    cols = [c for c in moment_columns(variables) if c in df.columns]
+    frame = df[list(keys) + cols].copy()
+    for c in cols:
+        frame[c] = pd.to_numeric(frame[c], errors='coerce')
+    grouped = frame.groupby(list(keys), sort=True)
+    out = {}
+    for v in variables:
+        out[f'{v}_count'] = grouped[f'{v}_count'].sum().astype('int64')
+        out[f'{v}_sum'] = grouped[f'{v}_sum'].sum(min_count=1)
+        out[f'{v}_sumsq'] = grouped[f'{v}_sumsq'].sum(min_count=1)
+        out[f'{v}_min'] = grouped[f'{v}_min'].min()
+        out[f'{v}_max'] = grouped[f'{v}_max'].max()
+    if not out:
+        return frame[list(keys)].drop_duplicates().reset_index(drop=True)
+    return pd.DataFrame(out).reset_index()
+
+
+def moments_from_summary(df: pd.DataFrame, variables: Sequence[str], ddof: int = 1) -> pd.DataFrame:
+    """由 {var}_mean/_std/_count 还原 sum/sumsq（旧的月度文件没有 sum/sumsq 时使用）。
+
+    sum = mean * n，sumsq = std^2 * (n - ddof) + n * mean^2，与原始数据计算的结果只差存储时的舍入。
+    """
+    out = df.copy()
+    for v in variables:
+        mean_col, std_col, n_col = f'{v}_mean', f'{v}_std', f'{v}_count'
+        if mean_col not in out.columns or n_col not in out.columns:
+            continue
+        n = pd.to_numeric(out[n_col], errors='coerce').fillna(0)
+        mean = pd.to_numeric(out[mean_col], errors='coerce')
+        std = pd.to_numeric(out[std_col], errors='coerce').fillna(0) if std_col in out.columns else 0.0
+        sum_ = mean * n
+        sumsq = std ** 2 * (n - ddof).clip(lower=0) + n * mean ** 2
+        if f'{v}_sum' in out.columns:
+            out[f'{v}_sum'] = pd.to_numeric(out[f'{v}_sum'], errors='coerce').fillna(sum_)
+        else:
+            out[f'{v}_sum'] = sum_
+        if f'{v}_sumsq' in out.columns:
+            out[f'{v}_sumsq'] = pd.to_numeric(out[f'{v}_sumsq'], errors='coerce').fillna(sumsq)
+        else:
+            out[f'{v}_sumsq'] = sumsq
+    return out
+
+
+def finalize_moments(df: pd.DataFrame, variables: Sequence[str], ddof: int = 1) -> pd.DataFrame:
+    """由矩计算 {var}_mean 与 {var}_std（n <= ddof 时 std 为 0，与原脚本单值时写 0 一致）。"""
+    out = df.copy()
+    for v in variables:
+        if f'{v}_count' not in out.columns:
+            continue
+        n = out[f'{v}_count'].astype('float64')
+        s = out[f'{v}_sum'].astype('float64')
+        ss = out[f'{v}_sumsq'].astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s / n
+            var = (ss - s * mean) / (n - ddof)
+        var = var.clip(lower=0)
+        out[f'{v}_mean'] = mean.where(n > 0)
+        out[f'{v}_std'] = np.sqrt(var).where(n > ddof, 0.0).where(n > 0)
+    return out
@@ -1,6 +1,7 @@
 import os
 import sys
 import shutil
+import hashlib
 from typing import Optional, List, Tuple, Dict
 import xarray as xr, io
 import zipfile
@@ -14,14 +15,54 @@ from .remove_outliers import remove_physical_bounds, remove_iqr_outliers
 from . import config as _config
 from .config import PROCESSED_DIR, DEFER_CLEANUP, VAR_BOUNDS, IQR_K, IQR_GROUPBY
 from .util.geo_utils import map_points_to_admin, canonicalize_admin_mapping
+from .regions import get_registry, attach_region_ids, save_registry_if_dirty
+from .centroids import cell_centroids, update_centroids
+from .gridcodec import write_qgrid
+from .aqi import add_aqi_columns
+from .windrose import hourly_rose, write_rose
+from .hourly import (apply_bounds, diurnal_sums, hour_of_day, hourly_features, region_features, stack_items,
+                     write_diurnal)
 
 # 默认聚合方式
 DEFAULT_AGGREGATE_MEAN = getattr(_config, 'DEFAULT_AGGREGATE_MEAN', True)
 
-def _save_df_by_year_granularity(df: pd.DataFrame, day_basename: str, granularity: str, no_mapping: bool = False) -> str:
+# 格点 -> 行政区映射的进程内缓存：同一网格、同一 geojson 在一次运行中只做一次空间连接，
+# 后续的 zip（线程池共享同一进程）直接复用 'mapped'（映射表）、'cells'（格点序号 -> 区域编号）
+# 与 'centroids'（映射格点的均值质心，运行结束时写入质心表）
+_ADMIN_LOOKUP_CACHE: Dict[tuple, dict] = {}
+_ADMIN_LOOKUP_LOCK = threading.Lock()
+
+
+def _admin_lookup(coords_unique: pd.DataFrame, admin_geojson: str, level: str) -> dict:
+    digest = hashlib.sha1(np.ascontiguousarray(coords_unique[['lat', 'lon']].to_numpy(dtype='float64')).tobytes()).hexdigest()
+    key = (os.path.abspath(admin_geojson), level, digest)
+    with _ADMIN_LOOKUP_LOCK:
+        entry = _ADMIN_LOOKUP_CACHE.get(key)
+        if entry is None:
+            entry = {'mapped': map_points_to_admin(coords_unique, admin_geojson, level=level)}
+            _ADMIN_LOOKUP_CACHE[key] = entry
+    return entry
+
+
+def _cell_regions(merged: pd.DataFrame, n_cells: int):
+    """映射后的表（带 _cell）-> (cell_region 数组（-1 为未映射）, 区域表 province/city/region_id)。"""
+    keyed = merged[merged['province'].notna() & merged['city'].notna()]
+    codes, uniques = pd.MultiIndex.from_frame(keyed[['province', 'city']]).factorize()
+    cell_region = np.full(n_cells, -1, dtype=np.int64)
+    cell_region[keyed['_cell'].to_numpy(dtype=np.int64)] = codes
+    regions = pd.DataFrame({'province': uniques.get_level_values(0), 'city': uniques.get_level_values(1)})
+    regions['region_id'] = attach_region_ids(regions, get_registry(), names=False)['region_id'].to_numpy()
+    return cell_region, regions
+
+def _save_df_by_year_granularity(df: pd.DataFrame, day_basename: str, granularity: str, no_mapping: bool = False,
+                                 region_ids_only: bool = False, grid_format: str = 'json',
+                                 grid_shape: Optional[Tuple[int, ...]] = None, with_aqi: bool = False) -> str:
     """保存数据框到 PROCESSED_DIR，按年/月/日和粒度组织。
 
     day_basename 预期格式为 'YYYYMMDD'（8 个字符）。如果不存在，则保存到 year=unknown。
+    region_ids_only=True 时只输出整数 region_id，省市名称由注册表（regions.json）还原。
+    with_aqi=True 时省市日文件额外带 aqi / aqi_level / primary_pollutant 列（见 aqi.py）。
+    no_mapping 且 grid_format='qgrid' 时按 gridcodec 的量化二进制格式保存（坐标在数据集根目录只存一次）。
     返回保存的文件路径。
     """
     year = None
@@ -41,6 +82,14 @@ def _save_df_by_year_granularity(df: pd.DataFrame, day_basename: str, granularit
         out_dir = os.path.join(PROCESSED_DIR, str(granularity), str(year), f"{month:02d}", f"{day:02d}")
     os.makedirs(out_dir, exist_ok=True)
 
+    if no_mapping and grid_format == 'qgrid':
+        value_cols = [c for c in df.columns if c not in ('lat', 'lon', 'time')]
+        values = {c: pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=float, na_value=np.nan) for c in value_cols}
+        coords = (df['lat'].to_numpy(dtype=float), df['lon'].to_numpy(dtype=float)) if 'lat' in df.columns and 'lon' in df.columns else None
+        shape = tuple(grid_shape) if grid_shape else (len(df),)
+        return write_qgrid(os.path.join(out_dir, day_basename), values, shape, coords=coords,
+                           dataset_dir=os.path.join(PROCESSED_DIR, str(granularity)))
+
     # 保存为 JSON 格式
     json_path = os.path.join(out_dir, f"{day_basename}.json")
     try:
@@ -60,9 +109,15 @@ def _save_df_by_year_granularity(df: pd.DataFrame, day_basename: str, granularit
                 save_df['province'] = 'Unknown'
             if 'city' not in save_df.columns:
                 save_df['city'] = 'Unknown'
-
-        # 转换所有数值列为字符串（保持与现有JSON格式一致）
-        numeric_cols = save_df.select_dtypes(include=[np.number]).columns
+            if region_ids_only and 'region_id' in save_df.columns:
+                save_df = save_df.drop(columns=[c for c in ('province', 'city', 'admin_name') if c in save_df.columns])
+            if with_aqi:
+                save_df = add_aqi_columns(save_df)
+
+        # 转换所有数值列为字符串（保持与现有JSON格式一致）；region_id 保持整数
+        if 'region_id' in save_df.columns:
+            save_df['region_id'] = save_df['region_id'].astype(object).where(save_df['region_id'].notna(), None)
+        numeric_cols = [c for c in save_df.select_dtypes(include=[np.number]).columns if c != 'region_id']
         for col in numeric_cols:
             save_df[col] = save_df[col].astype(str)
 
@@ -122,56 +177,23 @@ def _save_df_by_year_granularity(df: pd.DataFrame, day_basename: str, granularit
             df.to_csv(csv_path, index=False)
             return csv_path
 
-def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregate_mean: bool = False) -> pd.DataFrame:
+def temporal_aggregation(items: List[dict], aggregation: str = 'daily', aggregate_mean: bool = False,
+                         stacked: Optional[tuple] = None) -> pd.DataFrame:
     """将内存中的网格字典列表转换为 DataFrame。
 
     如果 aggregate_mean 为 True，则计算跨项目的每个网格均值（快速，无时间列）。
     每个项目应包含 'lat' 和 'lon' 数组（2D 或 1D）以及零个或多个变量数组。
+    stacked 为 hourly.stack_items 的结果时直接复用（逐时指标与日均值共用一次堆叠）。
     """
     if not items:
         return pd.DataFrame()
 
     # 快速按均值聚合路径
     if aggregate_mean:
-        first = items[0]
-        lat = first.get('lat')
-        lon = first.get('lon')
-        if lat is None or lon is None:
-            raise ValueError('items must include lat and lon')
-        lat_arr = np.array(lat)
-        lon_arr = np.array(lon)
-        if lat_arr.ndim == 1 and lon_arr.ndim == 1:
-            Lon, Lat = np.meshgrid(lon_arr, lat_arr)
-        else:
-            Lon = lon_arr
-            Lat = lat_arr
-        N = Lat.size
+        Lat, Lon, stacks = stacked if stacked is not None else stack_items(items)
         out = {'lat': Lat.ravel().astype(float), 'lon': Lon.ravel().astype(float)}
-        # collect variable names
-        vars_set = set()
-        for it in items:
-            vars_set.update([k for k in it.keys() if k not in ('lat', 'lon', 'time', 'geometry')])
-        vars_list = sorted(vars_set)
-        for v in vars_list:
-            stacks = []
-            for it in items:
-                val = it.get(v)
-                try:
-                    arr = np.array(val)
-                    if arr.size == N:
-                        stacks.append(arr.ravel())
-                    elif arr.size == 1:
-                        stacks.append(np.repeat(arr.item(), N))
-                    else:
-                        stacks.append(np.repeat(np.nan, N))
-                except Exception:
-                    stacks.append(np.repeat(np.nan, N))
-            if stacks:
-                stacked = np.vstack(stacks)
-                mean_vals = np.nanmean(stacked, axis=0)
-            else:
-                mean_vals = np.repeat(np.nan, N)
-            out[v] = mean_vals
+        for v, values in stacks.items():
+            out[v] = np.nanmean(values, axis=0)
         df = pd.DataFrame(out)
         return df
 
@@ -224,10 +246,20 @@ def process_single_zip(zip_path: str,
                        admin_geojson: Optional[str] = None,
                        amap_key: Optional[str] = None,
                        aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN,
-                       no_mapping: bool = False) -> str:
+                       no_mapping: bool = False,
+                       region_ids_only: bool = False,
+                       grid_format: str = 'json',
+                       with_aqi: bool = False,
+                       extremes: bool = False,
+                       diurnal: bool = False,
+                       wind_rose: bool = False) -> str:
     """处理单个 zip 文件（包含一天的每小时 .nc 文件）并保存结果。
 
     使用 io_utils 中的 read_nc_from_zip 避免手动提取。
+    省市粒度的输出带有注册表分配的整数 region_id（见 regions.py）。
+    extremes=True 时由同一批逐时网格额外计算日极值与 O3 MDA8（见 hourly.py，需 aggregate_mean）。
+    diurnal=True 时在省市输出旁另写 YYYYMMDD_diurnal.npz（区域 × 时刻的累加量，需 aggregate_mean）。
+    wind_rose=True 时另写 YYYYMMDD_windrose.npz（逐时 u/v 的区域 × 扇区 × 风速级计数与 PM2.5 和，见 windrose.py）。
     返回保存的文件路径（parquet 或 csv）。
     """
     basename = os.path.basename(zip_path)
@@ -244,6 +276,7 @@ def process_single_zip(zip_path: str,
 
     # 读取 zip 中所有的 .nc 文件并构建每小时的 items 列表（行为与 run_single_day_quick 保持一致）
     items = []
+    item_names = []
     tmp_dirs = []
     tmp_dir = None
     try:
@@ -306,6 +339,7 @@ def process_single_zip(zip_path: str,
                     item['time'] = day_basename
 
                     items.append(item)
+                    item_names.append(nc_name)
                 finally:
                     try:
                         if ds is not None:
@@ -334,6 +368,7 @@ def process_single_zip(zip_path: str,
                     item['lon'] = ds['lon'].values
                 item['time'] = day_basename
                 items.append(item)
+                item_names.append(basename)
             except Exception:
                 # no usable files found
                 items = []
@@ -349,7 +384,20 @@ def process_single_zip(zip_path: str,
             pass
 
     # 使用 temporal_aggregation 创建 day_df；当使用 aggregate_mean 可避免数据膨胀
-    day_df = temporal_aggregation(items, aggregation='daily', aggregate_mean=aggregate_mean)
+    hourly = None
+    if (extremes or diurnal or wind_rose) and aggregate_mean and items:
+        hourly = stack_items(items)
+    day_df = temporal_aggregation(items, aggregation='daily', aggregate_mean=aggregate_mean, stacked=hourly)
+    if hourly is not None:
+        # 逐时值同样先做物理范围过滤；_cell 记录格点序号，映射到行政区后据此回到逐时数组
+        apply_bounds(hourly[2], VAR_BOUNDS)
+        day_df['_cell'] = np.arange(len(day_df))
+    # 二维网格形状（qgrid 输出需要；1D 经纬度时为 (ny, nx)）
+    grid_shape = None
+    if items and aggregate_mean:
+        lat0 = np.asarray(items[0].get('lat'))
+        lon0 = np.asarray(items[0].get('lon'))
+        grid_shape = lat0.shape if lat0.ndim == 2 else (lat0.size, lon0.size)
 
     if _debug:
         try:
@@ -433,7 +481,8 @@ def process_single_zip(zip_path: str,
                 coords_unique = coords[['_lat_r', '_lon_r']].drop_duplicates().reset_index(drop=True).rename(columns={'_lat_r': 'lat', '_lon_r': 'lon'})
 
                 # 只对唯一的四舍五入坐标进行映射
-                mapped_coords = map_points_to_admin(coords_unique, admin_geojson, level=granularity)
+                lookup = _admin_lookup(coords_unique, admin_geojson, granularity)
+                mapped_coords = lookup['mapped'].copy()
                 # 映射相关的调试信息
                 if _debug:
                     try:
@@ -625,6 +674,12 @@ def process_single_zip(zip_path: str,
                 except Exception:
                     pass
 
+                # 映射格点的质心与格点数（同一网格每次运行只算一次）
+                if granularity == 'city' and 'centroids' not in lookup and 'province' in merged.columns \
+                        and 'city' in merged.columns:
+                    lookup['centroids'] = cell_centroids(merged['lat'], merged['lon'], merged['province'],
+                                                         merged['city'])
+
                 # 强制数值列为数值类型并进行聚合
                 for v in expected_vars:
                     if v not in merged.columns:
@@ -645,7 +700,34 @@ def process_single_zip(zip_path: str,
                 else:
                     agg = merged[agg_numeric_cols].mean().to_frame().T
 
-                saved = _save_df_by_year_granularity(agg, day_basename, granularity, no_mapping=False)
+                # 逐时派生指标：格点 -> 区域编号（每次运行只算一次），区域逐时序列上求日极值 / MDA8 / 日变化
+                cell_region = regions = None
+                if hourly is not None and 'province' in agg.columns and 'city' in agg.columns:
+                    if 'cells' not in lookup:
+                        lookup['cells'] = _cell_regions(merged, len(day_df))
+                    cell_region, regions = lookup['cells']
+                if cell_region is not None and extremes:
+                    feats = pd.DataFrame(region_features(hourly[2], cell_region, len(regions),
+                                                         hours=hour_of_day(item_names)))
+                    feats.insert(0, 'province', regions['province'].to_numpy())
+                    feats.insert(1, 'city', regions['city'].to_numpy())
+                    agg = agg.merge(feats, on=['province', 'city'], how='left')
+
+                # 为每个省市分配稳定的整数 ID（下游按 region_id 做 join）
+                if 'province' in agg.columns and 'city' in agg.columns:
+                    agg = attach_region_ids(agg, get_registry())
+
+                saved = _save_df_by_year_granularity(agg, day_basename, granularity, no_mapping=False,
+                                                     region_ids_only=region_ids_only, with_aqi=with_aqi)
+                if cell_region is not None and diurnal:
+                    variables, sums, counts = diurnal_sums(hourly[2], hour_of_day(item_names), cell_region, len(regions))
+                    write_diurnal(os.path.join(os.path.dirname(saved), f'{day_basename}_diurnal.npz'),
+                                  regions['region_id'].to_numpy(), variables, sums, counts)
+                stacks = hourly[2] if hourly is not None else {}
+                if cell_region is not None and wind_rose and 'u' in stacks and 'v' in stacks:
+                    rose = hourly_rose(stacks['u'], stacks['v'], stacks.get('pm25'), cell_region, len(regions))
+                    write_rose(os.path.join(os.path.dirname(saved), f'{day_basename}_windrose.npz'),
+                               regions['region_id'].to_numpy(), rose)
                 if _debug:
                     try:
                         print(f"[task-debug] saved aggregated admin file: {saved}")
@@ -672,7 +754,13 @@ def process_single_zip(zip_path: str,
             except Exception:
                 pass
 
-        saved = _save_df_by_year_granularity(day_df, day_basename, 'grid', no_mapping=no_mapping)
+        if hourly is not None:
+            day_df = day_df.drop(columns=['_cell'])
+        if hourly is not None and extremes:
+            for col, values in hourly_features(hourly[2], hours=hour_of_day(item_names)).items():
+                day_df[col] = values
+        saved = _save_df_by_year_granularity(day_df, day_basename, 'grid', no_mapping=no_mapping,
+                                             grid_format=grid_format, grid_shape=grid_shape)
         if _debug:
             try:
                 print(f"[task-debug] saved grid file: {saved}")
@@ -707,9 +795,9 @@ def process_single_zip(zip_path: str,
 
 
 def _worker_wrapper(args: Tuple) -> Tuple[str, bool, str]:
-    zip_path, granularity, admin_geojson, amap_key, aggregate_mean, no_mapping = args
+    zip_path, kwargs = args
     try:
-        res = process_single_zip(zip_path, granularity=granularity, admin_geojson=admin_geojson, amap_key=amap_key, aggregate_mean=aggregate_mean, no_mapping=no_mapping)
+        res = process_single_zip(zip_path, **kwargs)
         return zip_path, True, res
     except Exception as e:
         return zip_path, False, str(e)
@@ -722,7 +810,13 @@ def process_zips_parallel(base_path: str,
                           admin_geojson: Optional[str] = None,
                           workers: int = 4,
                           aggregate_mean: bool = DEFAULT_AGGREGATE_MEAN,
-                          no_mapping: bool = False) -> Tuple[List[str], List[Dict]]:
+                          no_mapping: bool = False,
+                          region_ids_only: bool = False,
+                          grid_format: str = 'json',
+                          with_aqi: bool = False,
+                          extremes: bool = False,
+                          diurnal: bool = False,
+                          wind_rose: bool = False) -> Tuple[List[str], List[Dict]]:
     zip_paths = []
     # expect files named CN-Reanalysis{YYYY}{MM}{DD}.zip
     import glob
@@ -749,8 +843,8 @@ def process_zips_parallel(base_path: str,
             for root, dirs, files in os.walk(output_base_dir):
                 for file in files:
                     if file.endswith('.json'):
-                        # 从文件名提取日期部分 YYYYMMDD
-                        basename = os.path.splitext(file)[0]
+                        # 从文件名提取日期部分 YYYYMMDD（兼容 YYYYMMDD.qgrid.json）
+                        basename = file.split('.')[0]
                         existing_files.add(basename)
 
         # 过滤掉已处理的 ZIP 文件
@@ -783,7 +877,11 @@ def process_zips_parallel(base_path: str,
         print("所有文件都已处理完成，无需继续处理")
         return saved, failed
 
-    args_list = [(zp, granularity, admin_geojson, None, aggregate_mean, no_mapping) for zp in zip_paths]
+    task_kwargs = dict(granularity=granularity, admin_geojson=admin_geojson, amap_key=None,
+                       aggregate_mean=aggregate_mean, no_mapping=no_mapping, region_ids_only=region_ids_only,
+                       grid_format=grid_format, with_aqi=with_aqi, extremes=extremes,
+                       diurnal=diurnal, wind_rose=wind_rose)
+    args_list = [(zp, task_kwargs) for zp in zip_paths]
 
     with ThreadPoolExecutor(max_workers=workers) as ex:
     # 在调试模式下启动心跳线程以周期性显示进度
@@ -826,4 +924,13 @@ def process_zips_parallel(base_path: str,
             if completed_count % 10 == 0 or completed_count == total:
                 print(f"progress... {completed_count}/{total} completed; failed {len(failed)}")
 
+    # 本次运行中出现了新的省市名称时，持久化注册表（已有 ID 不变）
+    registry_path = save_registry_if_dirty()
+    if registry_path:
+        print(f"region registry updated: {registry_path}")
+    centroids = [e['centroids'] for e in list(_ADMIN_LOOKUP_CACHE.values()) if 'centroids' in e]
+    centroid_path = update_centroids(pd.concat(centroids, ignore_index=True)) if centroids else None
+    if centroid_path:
+        print(f"region centroids updated: {centroid_path}")
+
     return saved, failed
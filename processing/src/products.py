@@ -0,0 +1,342 @@
+"""一次扫描生成多个可视化产品（日历 / 风玫瑰 / 趋势 / 热力图 / 相关矩阵 / 排名与污染类型）。
+
+原来 util/ 下的四个脚本各自遍历 ``<root>/<year>`` 读取全部日文件、拼表、再按城市 groupby + copy。
+这里把一年的城市日数据只读一次，整理成内存中的列式表 YearTable：
+
+    data     DataFrame，按 (region, day) 排序；region 为 regions 的行号（int32），
+             day 为当年第几天（int16，对应 dates），month 为月份（int8），其余为变量列（float64）
+    regions  按 region 行号排列的 region_id / province / city / lon / lat（注册表规范名称，质心见 centroids.py）
+    dates    当年完整日历（DatetimeIndex）
+
+各产品构建器只拿整数编码做分组（bincount / 有序切片），互不重复读盘。
+新增产品只需写一个 ``builder(table, out_dir, **options) -> 写出的文件数`` 并登记到 PRODUCT_BUILDERS；
+需要跨年合并输出的产品（趋势文件）登记累积器工厂，并列入 ACCUMULATING_PRODUCTS。
+"""
+import os
+import json
+from collections import namedtuple
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .config import CORR_LAGS, OUTPUT_DIR
+from .aqi import AQI_POLLUTANTS, compute_aqi
+from .centroids import region_centroids
+from .correlation import correlation_tables
+from .rankings import TYPE_NAMES, period_region_stats
+from .regions import get_registry
+from .rolling import load_year_days
+
+PRODUCT_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+HEATMAP_POLLUTANTS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3']
+HEATMAP_VERSION = 1
+# 热力图输出保留的小数位（默认 2 位）
+HEATMAP_DECIMALS = {'co': 3, 'aqi': 0}
+HEATMAP_PERIODS = ('day', 'month', 'year')
+
+YearTable = namedtuple('YearTable', ['year', 'data', 'regions', 'dates'])
+
+
+def load_year_table(year: int, roots: Optional[Sequence[str]] = None,
+                    variables: Sequence[str] = PRODUCT_VARS) -> Optional[YearTable]:
+    """读取一年的城市日数据（任意格式，见 dayreader）并整理为 YearTable；没有数据时返回 None。"""
+    days = load_year_days(year, 0, roots, variables)
+    if days.empty:
+        return None
+    dates_col = pd.to_datetime(days['date']).dt.normalize()
+    days = days[days['region_id'].notna() & (dates_col.dt.year == int(year))]
+    dates_col = dates_col[days.index]
+    dates = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq='D')
+
+    codes, region_ids = pd.factorize(days['region_id'].astype('int64'), sort=True)
+    day = (dates_col - dates[0]).dt.days.to_numpy()
+    order = np.lexsort((day, codes))
+    data = pd.DataFrame({
+        'region': codes[order].astype(np.int32),
+        'day': day[order].astype(np.int16),
+        'month': dates_col.dt.month.to_numpy()[order].astype(np.int8),
+    })
+    for v in variables:
+        if v in days.columns:
+            data[v] = pd.to_numeric(days[v], errors='coerce').to_numpy(dtype='float64')[order]
+
+    frame = region_centroids()[['region_id', 'province', 'city', 'lon', 'lat']]
+    regions = pd.DataFrame({'region_id': pd.array(region_ids, dtype='Int64')}).merge(frame, on='region_id', how='left')
+    return YearTable(int(year), data, regions, dates)
+
+
+def group_means(codes: np.ndarray, n_groups: int, data: pd.DataFrame, variables: Sequence[str]) -> pd.DataFrame:
+    """按整数分组编码求各变量的均值（忽略 NaN），返回 n_groups 行（无样本的组为 NaN）。"""
+    out = {}
+    for v in variables:
+        vals = data[v].to_numpy(dtype='float64')
+        ok = np.isfinite(vals)
+        sums = np.bincount(codes[ok], weights=vals[ok], minlength=n_groups)
+        counts = np.bincount(codes[ok], minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[v] = sums / counts
+    return pd.DataFrame(out)
+
+
+def name_codes(table: YearTable, field: str = 'city'):
+    """区域 -> 名称编码（同名区域合并，与原脚本按名称分组一致），返回 (每行的编码, 名称数组)。"""
+    names = table.regions[field].astype(object)
+    codes, uniques = pd.factorize(names.where(names.notna(), None), sort=True)
+    return codes[table.data['region'].to_numpy()], np.asarray(uniques, dtype=object)
+
+
+def level_groups(table: YearTable, level: str = 'city'):
+    """区域层级的分组：返回 (每行的组下标（-1 为未知）, 组表 id / province[/ city])。
+
+    city 层的组即 table.regions（id 为 region_id），province 层按注册表 province_id 分组。
+    """
+    region = table.data['region'].to_numpy()
+    if level == 'city':
+        groups = table.regions[['region_id', 'province', 'city']].rename(columns={'region_id': 'id'})
+        return region.astype(np.int64), groups.reset_index(drop=True)
+    if level != 'province':
+        raise ValueError(f'unknown region level: {level}')
+    frame = get_registry().to_frame()[['region_id', 'province_id', 'province']]
+    merged = table.regions[['region_id']].merge(frame, on='region_id', how='left')
+    pid = merged['province_id'].fillna(-1).to_numpy(dtype=np.int64)
+    ids, codes = np.unique(pid, return_inverse=True)
+    codes = np.where(pid >= 0, codes - int((ids < 0).any()), -1)
+    groups = merged[pid >= 0].drop_duplicates('province_id').set_index('province_id').loc[ids[ids >= 0]]
+    groups = groups.reset_index()[['province_id', 'province']].rename(columns={'province_id': 'id'})
+    return codes[region], groups
+
+
+def _slices(codes: np.ndarray, n_groups: int):
+    """稳定排序后每组的行号切片：返回 (order, bounds)，第 g 组为 order[bounds[g]:bounds[g + 1]]。"""
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=n_groups))])
+    return order[np.count_nonzero(codes < 0):], bounds
+
+
+# ==================== 构建器 ====================
+
+def build_calendar(table: YearTable, out_dir: str) -> int:
+    """<out>/calendar/<year>/<城市>.json（格式同 util/generate_calendar_series.py）：(城市 × 日) 矩阵一次算完。"""
+    from .util.generate_calendar_series import calendar_matrix, write_calendars
+    codes, names = name_codes(table)
+    matrix = calendar_matrix(table.data, codes, table.data['day'].to_numpy(), len(names), len(table.dates))
+    return write_calendars(names, matrix, table.year, os.path.join(out_dir, 'calendar', str(table.year)))
+
+
+def build_wind_rose(table: YearTable, out_dir: str) -> int:
+    """<out>/wind_rose/<year>/<城市>.json（格式同 util/generate_wind_rose.py，日均 u/v）。"""
+    from .util.generate_wind_rose import save_wind_rose_json, wind_rose_tables
+    codes, names = name_codes(table)
+    tables = wind_rose_tables(table.data, codes=codes, names=names)
+    target = os.path.join(out_dir, 'wind_rose', str(table.year))
+    written = 0
+    for city, rose in tables.items():
+        if rose['all']:
+            save_wind_rose_json(city, rose, target)
+            written += 1
+    return written
+
+
+def trend_stores(out_dir: str, **options):
+    """trends 产品：返回跨年累积的 TrendStoreBuilder，全部年份处理完后写
+    <out>/trends/<level>_<freq>.trend.json/.trend.bin（见 trendstore.py，与 run_pipeline.py trends 相同）。"""
+    from .trendstore import TrendStoreBuilder
+    return TrendStoreBuilder(os.path.join(out_dir, 'trends'), **options)
+
+
+def _json_column(values: np.ndarray, decimals: int) -> list:
+    """浮点数组 -> 保留 decimals 位小数的列表，NaN 为 None（decimals=0 时为整数）。"""
+    values = np.round(np.asarray(values, dtype='float64'), decimals)
+    if decimals == 0:
+        return [None if np.isnan(x) else int(x) for x in values.tolist()]
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def write_heatmap(path: str, year: int, period: str, labels: Sequence[str], regions: pd.DataFrame,
+                  values: Dict[str, np.ndarray], binary: bool = False) -> str:
+    """写出一个列式热力图文件。
+
+    values 为 {变量: (周期, 区域) 数组}，展平为按周期优先的一维列表：第 p 个周期、第 r 个区域的值
+    位于 ``values[var][p * len(regions) + r]``，前端按周期切片即可切换指标或时间。
+
+    binary=True 时数值改写到同名 .bin（各变量依次为小端 float32，缺测为 NaN），JSON 中以
+    ``columns``（name/dtype/offset/length，与 trendstore 相同）代替 ``values``，前端用 ArrayBuffer 切片读取。
+    """
+    cols = {'region_id': [int(x) for x in regions['region_id']]}
+    for c in ('province', 'city'):
+        cols[c] = regions[c].astype(object).where(regions[c].notna(), None).tolist()
+    for c in ('lon', 'lat'):
+        cols[c] = _json_column(regions[c].to_numpy(dtype='float64'), 4)
+    doc = {
+        'version': HEATMAP_VERSION, 'year': int(year), 'period': period, 'periods': list(labels),
+        'regions': cols, 'variables': list(values),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if binary:
+        bin_path = os.path.splitext(path)[0] + '.bin'
+        columns, offset = [], 0
+        with open(bin_path, 'wb') as f:
+            for v, m in values.items():
+                arr = np.asarray(m, dtype='float64').ravel().astype('<f4')
+                f.write(arr.tobytes())
+                columns.append({'name': v, 'dtype': arr.dtype.str, 'offset': offset, 'length': int(arr.size)})
+                offset += arr.nbytes
+        doc.update({'bin': os.path.basename(bin_path), 'columns': columns})
+    else:
+        doc['values'] = {v: _json_column(np.asarray(m).ravel(), HEATMAP_DECIMALS.get(v, 2)) for v, m in values.items()}
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(doc, ensure_ascii=False, separators=(',', ':')))
+    return path
+
+
+def period_codes(table: YearTable):
+    """{周期类型: (每行的周期编码, 周期标签)}：day / month / year。"""
+    return {
+        'day': (table.data['day'].to_numpy().astype(np.int64), list(table.dates.strftime('%Y-%m-%d'))),
+        'month': (table.data['month'].to_numpy().astype(np.int64) - 1, [f'{table.year}-{m:02d}' for m in range(1, 13)]),
+        'year': (np.zeros(len(table.data), dtype=np.int64), [str(table.year)]),
+    }
+
+
+def build_heatmaps(table: YearTable, out_dir: str, periods: Sequence[str] = HEATMAP_PERIODS,
+                   binary_periods: Sequence[str] = ()) -> int:
+    """<out>/heatmap/<year>/{day,month,year}.json：全部变量与 AQI 的 (周期 × 区域) 均值，列式存储。
+
+    区域与坐标来自 table.regions（已与质心表合并），没有坐标的区域不输出；
+    aqi 为逐日 AQI（compute_aqi）在周期内的均值。binary_periods 中的周期（通常为体积最大的 day）
+    另以 float32 .bin 存放数值，见 write_heatmap。
+    """
+    variables = [v for v in PRODUCT_VARS if v in table.data.columns]
+    data = table.data[variables].copy()
+    if any(p in data.columns for p in HEATMAP_POLLUTANTS):
+        data['aqi'] = compute_aqi(data)['aqi']
+        variables.append('aqi')
+    located = np.nonzero((table.regions['lon'].notna() & table.regions['lat'].notna()).to_numpy())[0]
+    regions = table.regions.iloc[located].reset_index(drop=True)
+    n_regions = len(table.regions)
+    region = table.data['region'].to_numpy().astype(np.int64)
+    target = os.path.join(out_dir, 'heatmap', str(table.year))
+    written = 0
+    for period, (codes, labels) in period_codes(table).items():
+        if period not in periods:
+            continue
+        n_periods = len(labels)
+        means = group_means(region * n_periods + codes, n_regions * n_periods, data, variables)
+        cube = means.to_numpy().reshape(n_regions, n_periods, len(variables))[located]
+        values = {v: cube[:, :, i].T for i, v in enumerate(variables)}
+        write_heatmap(os.path.join(target, f'{period}.json'), table.year, period, labels, regions, values,
+                      binary=period in binary_periods)
+        written += 1
+    return written
+
+
+def build_correlation(table: YearTable, out_dir: str, lags: Sequence[int] = CORR_LAGS) -> int:
+    """<out>/correlation/<year>/global.json 与 regions/<region_id>.json：污染物 × 气象要素相关矩阵（见 correlation.py）。"""
+    docs = correlation_tables(table.data, table.data['region'].to_numpy(), table.data['day'].to_numpy(),
+                              table.data['month'].to_numpy(), len(table.regions), len(table.dates), table.year,
+                              lags=lags)
+    target = os.path.join(out_dir, 'correlation', str(table.year))
+    os.makedirs(os.path.join(target, 'regions'), exist_ok=True)
+    region_ids = table.regions['region_id'].to_numpy()
+    written = 0
+    for key, doc in docs.items():
+        if key == 'global':
+            path = os.path.join(target, 'global.json')
+        else:
+            row = table.regions.iloc[key]
+            doc = {'region_id': int(region_ids[key]), 'province': row['province'], 'city': row['city'], **doc}
+            path = os.path.join(target, 'regions', f'{int(region_ids[key])}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(doc, ensure_ascii=False, separators=(',', ':')))
+        written += 1
+    return written
+
+
+RANKING_LEVELS = ('city', 'province')
+
+
+def build_rankings(table: YearTable, out_dir: str) -> int:
+    """<out>/rankings/<year>/<level>_<period>.json：(时段 × 区域) 的 AQI 排名、首要污染物、占比与类型（见 rankings.py）。
+
+    数组按时段优先展平（第 p 个时段、第 r 个区域位于 p * 区域数 + r）；order[p] 为该时段有数据的区域按名次排列的下标，
+    前 N 个即 Top-N。
+    """
+    res = compute_aqi(table.data)
+    target = os.path.join(out_dir, 'rankings', str(table.year))
+    os.makedirs(target, exist_ok=True)
+    written = 0
+    for level in RANKING_LEVELS:
+        codes, groups = level_groups(table, level)
+        regions = {'id': [int(x) for x in groups['id']]}
+        for c in ('province', 'city'):
+            if c in groups.columns:
+                regions[c] = groups[c].astype(object).where(groups[c].notna(), None).tolist()
+        for period, (p_codes, labels) in period_codes(table).items():
+            st = period_region_stats(codes, p_codes, len(groups), len(labels), table.data, res['aqi'], res['primary'])
+            order = [row[:int(n)].tolist() for row, n in zip(st['order'], (st['rank'] > 0).sum(axis=1))]
+            doc = {
+                'version': HEATMAP_VERSION, 'year': table.year, 'level': level, 'period': period, 'periods': labels,
+                'regions': regions, 'pollutants': list(AQI_POLLUTANTS), 'types': list(TYPE_NAMES),
+                'aqi': _json_column(st['aqi'].ravel(), 1),
+                'rank': st['rank'].ravel().tolist(),
+                'order': order,
+                'primary': st['primary'].ravel().tolist(),
+                'dominant': st['dominant'].ravel().tolist(),
+                'type': st['type'].ravel().tolist(),
+                'shares': {p: _json_column(st['shares'][..., k].ravel(), 3) for k, p in enumerate(AQI_POLLUTANTS)},
+            }
+            with open(os.path.join(target, f'{level}_{period}.json'), 'w', encoding='utf-8') as f:
+                f.write(json.dumps(doc, ensure_ascii=False, separators=(',', ':')))
+            written += 1
+    return written
+
+
+# 跨年累积的产品：登记的是工厂 ``factory(out_dir, **options)``，返回带 add(table) 与
+# finish() -> {名称: 路径} 的累积器，build_products 逐年 add，全部年份处理完后 finish 一次
+ACCUMULATING_PRODUCTS = {'trends'}
+
+PRODUCT_BUILDERS: Dict[str, Callable] = {
+    'calendar': build_calendar,
+    'wind_rose': build_wind_rose,
+    'trends': trend_stores,
+    'heatmap': build_heatmaps,
+    'correlation': build_correlation,
+    'rankings': build_rankings,
+}
+
+
+def build_products(years: Sequence[int], products: Optional[Sequence[str]] = None,
+                   roots: Optional[Sequence[str]] = None, out_dir: Optional[str] = None,
+                   options: Optional[Dict[str, dict]] = None) -> Dict[str, int]:
+    """逐年加载一次 YearTable 并依次交给各构建器，返回 {产品: 写出的文件数}。
+
+    options 为 {产品: 额外关键字参数}，如 {'correlation': {'lags': [0, 1, 3]}}。
+    """
+    products = list(products or PRODUCT_BUILDERS)
+    unknown = [p for p in products if p not in PRODUCT_BUILDERS]
+    if unknown:
+        raise ValueError(f'unknown product: {unknown}; known: {sorted(PRODUCT_BUILDERS)}')
+    out_dir = out_dir or OUTPUT_DIR
+    options = options or {}
+    totals = {p: 0 for p in products}
+    accumulators = {p: PRODUCT_BUILDERS[p](out_dir, **options.get(p, {}))
+                    for p in products if p in ACCUMULATING_PRODUCTS}
+    for year in years:
+        table = load_year_table(int(year), roots)
+        if table is None:
+            print(f"{year}: no city-day files found")
+            continue
+        print(f"{year}: loaded {len(table.data)} city-days for {len(table.regions)} regions")
+        for p in products:
+            if p in accumulators:
+                accumulators[p].add(table)
+                continue
+            n = PRODUCT_BUILDERS[p](table, out_dir, **options.get(p, {}))
+            totals[p] += n
+            print(f"  {p}: {n} files")
+    for p, acc in accumulators.items():
+        written = acc.finish()
+        totals[p] = len(written)
+        print(f"  {p}: {len(written)} stores")
+    return totals
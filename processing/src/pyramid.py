@@ -0,0 +1,256 @@
+"""网格热力图的多分辨率瓦片金字塔。
+
+基于 `--no-mapping` 的网格日文件（qgrid 或旧 JSON），把 339x432 网格按 2x/4x/8x 块平均
+得到更粗的层级（NaN 感知：只对有效值求均值），每一层切成固定大小的空间瓦片并量化为 uint16。
+
+输出布局（out_root = OUTPUT_DIR/pyramid）::
+
+    <out_root>/L<k>/coords.<校验值>.qgrid.json|bin  每层的块平均经纬度（每种网格只写一次）
+    <out_root>/<year>/index.json               该年已生成的日期与层级
+    <out_root>/<year>/<YYYYMMDD>.json          日头：各层形状、瓦片字节范围、各变量量化参数
+    <out_root>/<year>/<YYYYMMDD>/L<k>.bin      该层所有瓦片顺序拼接
+
+前端只需读日头，再按瓦片的 offset/nbytes 用 HTTP Range 取所需层级与瓦片。
+瓦片内部布局：按 header['vars'] 顺序，每个变量为 有效位掩码(ceil(n/8) 字节，补齐到偶数) + uint16[n]，
+n = 瓦片行数 * 列数，值 = offset + code * scale（量化参数按 日 × 层 × 变量 给出）。
+
+块平均用 sum/count 金字塔逐级合并（L<k+1> 由 L<k> 的 2x2 块求和），对一批日期的 (days, ny, nx)
+数组整体 reshape，不在 Python 中逐格循环。
+"""
+import os
+import re
+import json
+import glob
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import GRID_SHAPE, OUTPUT_DIR, PROCESSED_DIR, VAR_BOUNDS
+from .gridcodec import QGRID_SUFFIX, day_coords, dequantize, quantization_params, quantize, read_qgrid, write_coords
+
+PYRAMID_VERSION = 1
+DEFAULT_FACTORS = (1, 2, 4, 8)
+DEFAULT_TILE_SIZE = 64
+DEFAULT_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+
+
+def _pad_to_multiple(arr: np.ndarray, f: int, fill) -> np.ndarray:
+    ny, nx = arr.shape[-2:]
+    py, px = (-ny) % f, (-nx) % f
+    if not py and not px:
+        return arr
+    pad = [(0, 0)] * (arr.ndim - 2) + [(0, py), (0, px)]
+    return np.pad(arr, pad, mode='constant', constant_values=fill)
+
+
+def block_sum_count(sums: np.ndarray, counts: np.ndarray, f: int) -> Tuple[np.ndarray, np.ndarray]:
+    """对 (..., ny, nx) 的 sum/count 做 f x f 块合并（边缘不足的块按实际单元计）。"""
+    sums = _pad_to_multiple(sums, f, 0.0)
+    counts = _pad_to_multiple(counts, f, 0)
+    lead = sums.shape[:-2]
+    ny, nx = sums.shape[-2:]
+    shape = lead + (ny // f, f, nx // f, f)
+    axes = (len(lead) + 1, len(lead) + 3)
+    return sums.reshape(shape).sum(axis=axes), counts.reshape(shape).sum(axis=axes)
+
+
+def block_means(stack: np.ndarray, factors: Iterable[int] = DEFAULT_FACTORS) -> Dict[int, np.ndarray]:
+    """NaN 感知的多级块平均：返回 {factor: (..., ny/f, nx/f) 均值}，全 NaN 的块为 NaN。
+
+    factors 需为递增且相互整除（如 1, 2, 4, 8），后一级由前一级的 sum/count 合并得到。
+    """
+    valid = np.isfinite(stack)
+    sums = np.where(valid, stack, 0.0).astype(np.float64)
+    counts = valid.astype(np.int32)
+    out = {}
+    prev = 1
+    for f in sorted(factors):
+        if f % prev:
+            raise ValueError(f'factors must divide each other, got {prev} -> {f}')
+        if f != prev:
+            sums, counts = block_sum_count(sums, counts, f // prev)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[f] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan).astype(np.float32)
+        prev = f
+    return out
+
+
+def _tile_slices(shape: Tuple[int, int], tile_size: int):
+    ny, nx = shape
+    for ty in range(0, (ny + tile_size - 1) // tile_size):
+        for tx in range(0, (nx + tile_size - 1) // tile_size):
+            ys = slice(ty * tile_size, min((ty + 1) * tile_size, ny))
+            xs = slice(tx * tile_size, min((tx + 1) * tile_size, nx))
+            yield ty, tx, ys, xs
+
+
+def _encode_level(fields: Dict[str, np.ndarray], tile_size: int, bounds) -> Tuple[dict, bytes]:
+    """把一层的 {变量: (ny, nx)} 切瓦片并量化，返回 (level_header, bin_bytes)。"""
+    names = list(fields)
+    shape = next(iter(fields.values())).shape
+    quant = {}
+    codes = {}
+    valids = {}
+    for name in names:
+        offset, scale = quantization_params(fields[name], bounds.get(name))
+        c, v = quantize(fields[name], offset, scale)
+        codes[name] = c.reshape(shape)
+        valids[name] = v.reshape(shape)
+        quant[name] = {'offset': offset, 'scale': scale, 'max_error': scale / 2.0}
+    tiles = []
+    parts = []
+    pos = 0
+    for ty, tx, ys, xs in _tile_slices(shape, tile_size):
+        start = pos
+        for name in names:
+            mask = np.packbits(valids[name][ys, xs].ravel(), bitorder='little').tobytes()
+            if len(mask) % 2:
+                mask += b'\x00'
+            data = np.ascontiguousarray(codes[name][ys, xs]).astype('<u2').tobytes()
+            parts.extend([mask, data])
+            pos += len(mask) + len(data)
+        tiles.append({'ty': ty, 'tx': tx, 'y0': ys.start, 'x0': xs.start,
+                      'shape': [ys.stop - ys.start, xs.stop - xs.start], 'offset': start, 'nbytes': pos - start})
+    return {'shape': list(shape), 'quant': quant, 'tiles': tiles}, b''.join(parts)
+
+
+# ---------- 读取网格日文件 ----------
+
+def find_grid_days(grid_root: str, year: int) -> List[Tuple[str, str]]:
+    """返回 [(YYYYMMDD, path)]；同一天同时有 qgrid 与 JSON 时优先 qgrid。"""
+    found = {}
+    for path in glob.glob(os.path.join(grid_root, str(year), '**', f'{year}*'), recursive=True):
+        name = os.path.basename(path)
+        m = re.match(r'(\d{8})(\.qgrid)?\.json$', name)
+        if not m:
+            continue
+        day = m.group(1)
+        if m.group(2) or day not in found:
+            found[day] = path
+    return sorted(found.items())
+
+
+def load_grid_day(path: str, variables: List[str], shape: Tuple[int, int] = GRID_SHAPE) -> Dict[str, np.ndarray]:
+    """读取一天网格为 {变量: (ny, nx) float32}；缺失变量为全 NaN。"""
+    if path.endswith(QGRID_SUFFIX):
+        values, header = read_qgrid(path, variables)
+        shape = tuple(header['shape']) if len(header['shape']) == 2 else shape
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            df = pd.DataFrame(json.load(f))
+        values = {v: pd.to_numeric(df[v], errors='coerce').to_numpy(dtype=np.float32) for v in variables if v in df.columns}
+    out = {}
+    for v in variables:
+        arr = values.get(v)
+        out[v] = np.full(shape, np.nan, dtype=np.float32) if arr is None else np.asarray(arr, dtype=np.float32).reshape(shape)
+    return out
+
+
+def _grid_coords(sample_path: str, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """样例日文件的网格坐标：qgrid 取头中引用（并校验）的坐标文件，旧 JSON 直接读 lat/lon 列。"""
+    coords = day_coords(sample_path) if sample_path.endswith(QGRID_SUFFIX) else None
+    if coords is not None:
+        lat, lon = coords
+    else:
+        with open(sample_path, 'r', encoding='utf-8') as f:
+            df = pd.DataFrame(json.load(f))
+        lat = pd.to_numeric(df['lat'], errors='coerce').to_numpy(dtype=np.float32)
+        lon = pd.to_numeric(df['lon'], errors='coerce').to_numpy(dtype=np.float32)
+    return lat.reshape(shape), lon.reshape(shape)
+
+
+# ---------- 主流程 ----------
+
+def build_year_pyramid(year: int, grid_root: Optional[str] = None, out_root: Optional[str] = None,
+                       variables: Optional[List[str]] = None, factors: Iterable[int] = DEFAULT_FACTORS,
+                       tile_size: int = DEFAULT_TILE_SIZE, batch_days: int = 16,
+                       shape: Tuple[int, int] = GRID_SHAPE) -> int:
+    """为一年的网格日文件生成瓦片金字塔，返回处理的天数。
+
+    每批 batch_days 天一起做块平均（(days, ny, nx) 整体 reshape），内存约为
+    batch_days * 变量数 * ny * nx * 8 字节。
+    """
+    grid_root = grid_root or os.path.join(PROCESSED_DIR, 'grid')
+    out_root = out_root or os.path.join(OUTPUT_DIR, 'pyramid')
+    variables = variables or DEFAULT_VARS
+    factors = sorted(set(int(f) for f in factors) | {1})
+    days = find_grid_days(grid_root, year)
+    if not days:
+        print(f"no grid-level day files for {year} under {grid_root}")
+        return 0
+
+    # 先确定真实网格形状（qgrid 头中有记录）
+    first = days[0][1]
+    if first.endswith(QGRID_SUFFIX):
+        with open(first, 'r', encoding='utf-8') as f:
+            hdr_shape = json.load(f).get('shape')
+        if hdr_shape and len(hdr_shape) == 2:
+            shape = tuple(hdr_shape)
+
+    # 各层坐标只写一次（同样用块平均）
+    lat, lon = _grid_coords(first, shape)
+    lat_levels = block_means(lat.astype(np.float64), factors)
+    lon_levels = block_means(lon.astype(np.float64), factors)
+    year_dir = os.path.join(out_root, str(year))
+    coords_refs = {}
+    for k, f in enumerate(factors):
+        path = write_coords(os.path.join(out_root, f'L{k}'), lat_levels[f], lon_levels[f], lat_levels[f].shape)
+        coords_refs[k] = os.path.relpath(path, year_dir).replace(os.sep, '/')
+
+    os.makedirs(year_dir, exist_ok=True)
+    written = []
+    for b in range(0, len(days), batch_days):
+        batch = days[b:b + batch_days]
+        loaded = [load_grid_day(p, variables, shape) for _, p in batch]
+        stacks = {v: np.stack([d[v] for d in loaded]) for v in variables}
+        levels = {v: block_means(stacks[v], factors) for v in variables}
+        for i, (day, _) in enumerate(batch):
+            day_dir = os.path.join(year_dir, day)
+            os.makedirs(day_dir, exist_ok=True)
+            header = {'format': 'qgrid-pyramid', 'version': PYRAMID_VERSION,
+                      'date': f"{day[:4]}-{day[4:6]}-{day[6:8]}", 'tile_size': tile_size,
+                      'vars': variables, 'levels': []}
+            for k, f in enumerate(factors):
+                fields = {v: levels[v][f][i] for v in variables}
+                level_header, payload = _encode_level(fields, tile_size, VAR_BOUNDS)
+                bin_name = f'L{k}.bin'
+                with open(os.path.join(day_dir, bin_name), 'wb') as fh:
+                    fh.write(payload)
+                level_header.update({'level': k, 'factor': f, 'bin': f'{day}/{bin_name}',
+                                     'coords': coords_refs[k]})
+                header['levels'].append(level_header)
+            with open(os.path.join(year_dir, f'{day}.json'), 'w', encoding='utf-8') as fh:
+                json.dump(header, fh, ensure_ascii=False, separators=(',', ':'))
+            written.append(header['date'])
+        print(f"pyramid {year}: {min(b + batch_days, len(days))}/{len(days)} days")
+
+    with open(os.path.join(year_dir, 'index.json'), 'w', encoding='utf-8') as fh:
+        json.dump({'days': written, 'factors': factors, 'tile_size': tile_size, 'vars': variables},
+                  fh, ensure_ascii=False, indent=2)
+    return len(written)
+
+
+def read_pyramid_tile(header_path: str, level: int, ty: int, tx: int) -> Dict[str, np.ndarray]:
+    """读取某天某层的一块瓦片，返回 {变量: (th, tw) float64}（主要用于校验与 Python 端使用）。"""
+    with open(header_path, 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    lvl = header['levels'][level]
+    tile = next(t for t in lvl['tiles'] if t['ty'] == ty and t['tx'] == tx)
+    with open(os.path.join(os.path.dirname(header_path), lvl['bin']), 'rb') as f:
+        f.seek(tile['offset'])
+        raw = np.frombuffer(f.read(tile['nbytes']), dtype=np.uint8)
+    th, tw = tile['shape']
+    n = th * tw
+    mask_nbytes = (n + 7) // 8
+    mask_nbytes += mask_nbytes % 2
+    out = {}
+    pos = 0
+    for name in header['vars']:
+        valid = np.unpackbits(raw[pos:pos + mask_nbytes], count=n, bitorder='little').astype(bool)
+        pos += mask_nbytes
+        codes = raw[pos:pos + 2 * n].view('<u2')
+        pos += 2 * n
+        q = lvl['quant'][name]
+        out[name] = dequantize(codes, valid, q['offset'], q['scale']).reshape(th, tw)
+    return out
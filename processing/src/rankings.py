@@ -0,0 +1,107 @@
+"""污染类型占比、类型标签与 AQI 排名（替代前端 dataLoader.js 的 computeShares / classifyPollutionType /
+computeTypeByRegion / computeAQIRanking / computeCityTypeTrajectory 的逐次重算）。
+
+所有量都在 (时段, 区域) 矩阵上一次算出：
+
+* 占比：各污染物在时段内的均值（缺测或非正值按 0 计入，分母为记录数，与前端一致）除以六项之和；
+* 类型：占比最大的污染物为主导污染物（并列取 AQI_POLLUTANTS 中靠前者）；最大占比 < TYPE_SHARE_THRESHOLD
+  为“标准型”，否则按主导污染物映射为 PRIMARY_TYPES 中的类型；
+* AQI 排名：逐日 AQI（aqi.compute_aqi）在时段内的均值，按每个时段一行做 argsort（降序，缺测排在最后），
+  rank 为 1 起的名次；首要污染物为时段内逐日首要污染物的众数（票数相同取靠前者）。
+"""
+from typing import Dict
+
+import numpy as np
+
+from .aqi import AQI_POLLUTANTS
+
+TYPE_SHARE_THRESHOLD = 0.3
+TYPE_NAMES = ('标准型', '偏颗粒物型', '偏燃煤型', '偏交通型', '偏燃烧型', '偏二次型')
+PRIMARY_TYPES = {
+    'pm25': '偏颗粒物型',
+    'pm10': '偏颗粒物型',
+    'so2': '偏燃煤型',
+    'no2': '偏交通型',
+    'co': '偏燃烧型',
+    'o3': '偏二次型',
+}
+
+_TYPE_OF_POLLUTANT = np.asarray([TYPE_NAMES.index(PRIMARY_TYPES[p]) for p in AQI_POLLUTANTS], dtype=np.int8)
+
+
+def group_shares(groups: np.ndarray, n_groups: int, data) -> np.ndarray:
+    """按分组求六项污染物的占比，形状 (n_groups, 6)；组内没有记录时为 NaN。"""
+    groups = np.asarray(groups, dtype=np.int64)
+    counts = np.bincount(groups, minlength=n_groups).astype('float64')
+    means = np.zeros((n_groups, len(AQI_POLLUTANTS)))
+    for k, p in enumerate(AQI_POLLUTANTS):
+        if p not in data.columns:
+            continue
+        vals = np.asarray(data[p], dtype='float64')
+        vals = np.where(np.isfinite(vals) & (vals > 0), vals, 0.0)
+        means[:, k] = np.bincount(groups, weights=vals, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means /= counts[:, None]
+        total = means.sum(axis=1, keepdims=True)
+        shares = np.where(total > 0, means / total, 0.0)
+    shares[counts == 0] = np.nan
+    return shares
+
+
+def classify_types(shares: np.ndarray):
+    """占比 (..., 6) -> (主导污染物下标 int8, 类型下标 int8（TYPE_NAMES）)；全为 NaN 的行为 -1。"""
+    has = np.isfinite(shares).any(axis=-1)
+    filled = np.where(np.isfinite(shares), shares, -np.inf)
+    primary = np.argmax(filled, axis=-1)
+    ratio = np.take_along_axis(filled, primary[..., None], axis=-1)[..., 0]
+    types = np.where(ratio < TYPE_SHARE_THRESHOLD, 0, _TYPE_OF_POLLUTANT[primary])
+    return np.where(has, primary, -1).astype(np.int8), np.where(has, types, -1).astype(np.int8)
+
+
+def primary_vote(groups: np.ndarray, n_groups: int, primary: np.ndarray) -> np.ndarray:
+    """每组逐日首要污染物的众数（AQI_POLLUTANTS 下标），没有有效记录为 -1。"""
+    groups = np.asarray(groups, dtype=np.int64)
+    primary = np.asarray(primary, dtype=np.int64)
+    ok = (groups >= 0) & (primary >= 0)
+    n_p = len(AQI_POLLUTANTS)
+    votes = np.bincount(groups[ok] * n_p + primary[ok], minlength=n_groups * n_p).reshape(n_groups, n_p)
+    return np.where(votes.any(axis=1), np.argmax(votes, axis=1), -1).astype(np.int8)
+
+
+def rank_rows(values: np.ndarray):
+    """(时段, 区域) 矩阵按行降序排名：返回 (rank (1 起，缺测为 0) int32, order 每行的区域下标排序)。"""
+    values = np.asarray(values, dtype='float64')
+    order = np.argsort(np.where(np.isfinite(values), -values, np.inf), axis=1, kind='stable')
+    rank = np.empty(values.shape, dtype=np.int32)
+    np.put_along_axis(rank, order, np.arange(1, values.shape[1] + 1, dtype=np.int32)[None, :], axis=1)
+    return np.where(np.isfinite(values), rank, 0).astype(np.int32), order
+
+
+def period_region_stats(region: np.ndarray, periods: np.ndarray, n_regions: int, n_periods: int, data,
+                        aqi: np.ndarray, primary: np.ndarray) -> Dict[str, np.ndarray]:
+    """城市日行 -> (时段, 区域) 矩阵：aqi 均值、rank、order、primary（众数）、shares、dominant、type。
+
+    region 为每行的区域下标（< 0 忽略），periods 为每行的时段下标。
+    """
+    region = np.asarray(region, dtype=np.int64)
+    periods = np.asarray(periods, dtype=np.int64)
+    ok = region >= 0
+    keys = np.where(ok, periods * n_regions + region, -1)
+    size = n_periods * n_regions
+    valid = ok & np.isfinite(aqi)
+    counts = np.bincount(keys[valid], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_aqi = np.bincount(keys[valid], weights=aqi[valid], minlength=size) / counts
+    shares = group_shares(keys[ok], size, data[ok])
+    dominant, types = classify_types(shares)
+    shape = (n_periods, n_regions)
+    rank, order = rank_rows(mean_aqi.reshape(shape))
+    return {
+        'aqi': mean_aqi.reshape(shape),
+        'rank': rank,
+        'order': order,
+        'primary': primary_vote(keys, size, primary).reshape(shape),
+        'shares': shares.reshape(shape + (len(AQI_POLLUTANTS),)),
+        'dominant': dominant.reshape(shape),
+        'type': types.reshape(shape),
+    }
@@ -0,0 +1,316 @@
+"""行政区注册表：为 (province, city) 分配稳定的整数 region_id。
+
+注册表保存在 REGION_REGISTRY_PATH（front/public/data/regions.json），格式：
+
+    {
+      "version": 1,
+      "provinces": [{"id": 0, "name": "上海市"}, ...],
+      "regions": [{"id": 0, "province_id": 0, "province": "上海市", "city": "上海市",
+                   "lon": 121.48, "lat": 31.22}, ...]
+    }
+
+ID 一经分配就不再改变：新出现的省市只会追加到末尾（max_id + 1），因此日/月/年输出
+可以只引用 region_id，各聚合脚本也可以按整数键做 join，而不必反复规范化中文名。
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import REGION_REGISTRY_PATH, REGION_REFERENCE_PATH
+
+REGISTRY_VERSION = 1
+
+_PLACEHOLDERS = {'', 'NA', 'N/A', 'NAN', '<NA>', 'NONE', 'UNKNOWN'}
+# 与前端 stripSuffix 保持一致，用于“昌都地区” vs “昌都市”之类的简称匹配
+_SUFFIX_RE = re.compile(r'(?:特别行政区|维吾尔自治区|壮族自治区|回族自治区|自治区|自治州|地区|省|市|盟|县|区|旗)$')
+
+
+def normalize_name(name) -> str:
+    """规范化单个行政区名称：取 '简体|繁体' 的最后一段、去掉空白；占位值返回空串。"""
+    if name is None:
+        return ''
+    try:
+        if pd.isna(name):
+            return ''
+    except (TypeError, ValueError):
+        pass
+    s = str(name)
+    if '|' in s:
+        parts = [p.strip() for p in s.split('|') if p.strip()]
+        s = parts[-1] if parts else ''
+    s = s.replace('　', '').strip()
+    if s.upper() in _PLACEHOLDERS:
+        return ''
+    return s
+
+
+def short_name(name) -> str:
+    """去掉行政后缀后的简称（至少保留两个字符）。"""
+    s = normalize_name(name)
+    short = _SUFFIX_RE.sub('', s)
+    return short if len(short) > 1 else s
+
+
+class RegionRegistry:
+    """进程内的行政区注册表。
+
+    线程安全：extract 阶段的多个工作线程可以同时调用 encode()，新名称的追加由锁保护。
+    """
+
+    def __init__(self, regions: Optional[List[dict]] = None, provinces: Optional[List[dict]] = None,
+                 path: Optional[str] = None):
+        self.path = path or REGION_REGISTRY_PATH
+        self._lock = threading.Lock()
+        self._regions: Dict[int, dict] = {}
+        self._by_key: Dict[Tuple[str, str], int] = {}
+        self._provinces: Dict[int, str] = {}
+        self._province_by_name: Dict[str, int] = {}
+        self._province_by_short: Dict[str, int] = {}
+        self.dirty = False
+        for p in provinces or []:
+            self._register_province(int(p['id']), p['name'])
+        for r in regions or []:
+            rec = dict(r)
+            rid = int(rec['id'])
+            if rec.get('province_id') is None:
+                rec['province_id'] = self._province_id(rec.get('province', ''))
+            self._regions[rid] = rec
+            self._by_key[(rec.get('province', ''), rec.get('city', ''))] = rid
+
+    # ---------- 读写 ----------
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'RegionRegistry':
+        """从 JSON 读取注册表；文件不存在时返回空注册表（首次 save 时创建）。"""
+        path = path or REGION_REGISTRY_PATH
+        if not os.path.exists(path):
+            return cls(path=path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(regions=data.get('regions', []), provinces=data.get('provinces', []), path=path)
+
+    def save(self, path: Optional[str] = None) -> str:
+        path = path or self.path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._lock:
+            data = {
+                'version': REGISTRY_VERSION,
+                'provinces': [{'id': pid, 'name': name} for pid, name in sorted(self._provinces.items())],
+                'regions': [self._regions[rid] for rid in sorted(self._regions)],
+            }
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, path)
+            self.dirty = False
+        return path
+
+    # ---------- 查询 / 分配 ----------
+
+    def __len__(self):
+        return len(self._regions)
+
+    def _register_province(self, pid: int, name: str):
+        self._provinces[pid] = name
+        self._province_by_name[name] = pid
+        self._province_by_short.setdefault(short_name(name), pid)
+
+    def canonical_province(self, name) -> str:
+        """返回已登记的规范省名（'河北' -> '河北省'）；未登记时返回规范化后的原名。"""
+        s = normalize_name(name)
+        if not s or s in self._province_by_name:
+            return s
+        pid = self._province_by_short.get(short_name(s))
+        return self._provinces[pid] if pid is not None else s
+
+    def _province_id(self, name: str) -> Optional[int]:
+        if not name:
+            return None
+        pid = self._province_by_name.get(name)
+        if pid is None:
+            pid = max(self._provinces, default=-1) + 1
+            self._register_province(pid, name)
+            self.dirty = True
+        return pid
+
+    def region_id(self, province, city, add: bool = True) -> Optional[int]:
+        """返回 (province, city) 的 region_id；add=True 时为新名称分配下一个 ID。"""
+        prov = self.canonical_province(province)
+        cty = normalize_name(city)
+        if not prov and not cty:
+            return None
+        key = (prov, cty)
+        rid = self._by_key.get(key)
+        if rid is not None or not add:
+            return rid
+        with self._lock:
+            rid = self._by_key.get(key)
+            if rid is None:
+                rid = max(self._regions, default=-1) + 1
+                self._regions[rid] = {'id': rid, 'province_id': self._province_id(prov),
+                                      'province': prov, 'city': cty, 'lon': None, 'lat': None}
+                self._by_key[key] = rid
+                self.dirty = True
+        return rid
+
+    def encode(self, df: pd.DataFrame, province_col: str = 'province', city_col: str = 'city',
+               add: bool = True) -> pd.Series:
+        """为 df 的每一行返回 region_id（可空整数 Int64）。只对唯一的省市对做一次查找。"""
+        if df.empty:
+            return pd.Series([], index=df.index, dtype='Int64')
+        prov = df[province_col] if province_col in df.columns else pd.Series([''] * len(df), index=df.index)
+        city = df[city_col] if city_col in df.columns else pd.Series([''] * len(df), index=df.index)
+        keys = pd.DataFrame({'p': prov.astype(object), 'c': city.astype(object)})
+        codes, uniques = pd.factorize(pd.MultiIndex.from_frame(keys.fillna('')))
+        ids = np.array([self.region_id(p, c, add=add) for p, c in uniques], dtype=object)
+        out = pd.array(ids[codes], dtype='Int64')
+        return pd.Series(out, index=df.index, name='region_id')
+
+    def decode(self, ids: Iterable) -> pd.DataFrame:
+        """把 region_id 序列还原为规范的 province/city 名称（未知 ID 为 NA）。"""
+        frame = self.to_frame()[['region_id', 'province', 'city']]
+        left = pd.DataFrame({'region_id': pd.array(list(ids), dtype='Int64')})
+        return left.merge(frame, on='region_id', how='left')
+
+    def to_frame(self) -> pd.DataFrame:
+        """注册表的表格视图：region_id, province_id, province, city, lon, lat。"""
+        rows = [self._regions[rid] for rid in sorted(self._regions)]
+        frame = pd.DataFrame(rows, columns=['id', 'province_id', 'province', 'city', 'lon', 'lat'])
+        frame = frame.rename(columns={'id': 'region_id'})
+        frame['region_id'] = frame['region_id'].astype('Int64')
+        frame['province_id'] = frame['province_id'].astype('Int64')
+        return frame
+
+    # ---------- 质心 ----------
+
+    def fill_centroids(self, reference_path: Optional[str] = None, overwrite: bool = False) -> int:
+        """用 region.json（省/市/县 + 经纬度）为缺少质心的行政区补上 lon/lat。
+
+        优先使用 county == city 的市级条目，其次使用该市所有县级条目的均值；
+        名称不一致时（“昌都地区” vs “昌都市”）按简称匹配。返回补齐的数量。
+        """
+        reference_path = reference_path or REGION_REFERENCE_PATH
+        if not os.path.exists(reference_path):
+            return 0
+        with open(reference_path, 'r', encoding='utf-8') as f:
+            ref = pd.DataFrame(json.load(f))
+        if ref.empty:
+            return 0
+        ref['lon'] = pd.to_numeric(ref.get('longitude'), errors='coerce')
+        ref['lat'] = pd.to_numeric(ref.get('latitude'), errors='coerce')
+        ref = ref.dropna(subset=['lon', 'lat'])
+        ref['p_short'] = ref['province'].map(short_name)
+        ref['c_short'] = ref['city'].map(short_name)
+        ref['is_city_row'] = ref['county'].map(normalize_name) == ref['city'].map(normalize_name)
+        # 市级条目优先；否则县级均值
+        city_rows = ref[ref['is_city_row']].groupby(['p_short', 'c_short'])[['lon', 'lat']].first()
+        county_mean = ref.groupby(['p_short', 'c_short'])[['lon', 'lat']].mean()
+        table = county_mean.copy()
+        table.loc[city_rows.index, ['lon', 'lat']] = city_rows[['lon', 'lat']].values
+        by_city = table.reset_index().drop_duplicates('c_short', keep=False).set_index('c_short')
+
+        filled = 0
+        with self._lock:
+            for rec in self._regions.values():
+                if not overwrite and rec.get('lon') is not None and rec.get('lat') is not None:
+                    continue
+                key = (short_name(rec.get('province')), short_name(rec.get('city')))
+                if key in table.index:
+                    lon, lat = table.loc[key, ['lon', 'lat']]
+                elif key[1] in by_city.index:
+                    lon, lat = by_city.loc[key[1], ['lon', 'lat']]
+                else:
+                    continue
+                rec['lon'] = round(float(lon), 4)
+                rec['lat'] = round(float(lat), 4)
+                filled += 1
+            if filled:
+                self.dirty = True
+        return filled
+
+
+# 进程级共享实例（extract 的工作线程共用一个注册表）
+_REGISTRY: Optional[RegionRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry(path: Optional[str] = None) -> RegionRegistry:
+    """返回进程级缓存的注册表实例（首次调用时从磁盘加载）。"""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None or (path and os.path.abspath(path) != os.path.abspath(_REGISTRY.path)):
+            _REGISTRY = RegionRegistry.load(path)
+        return _REGISTRY
+
+
+def registry_signature(registry: Optional[RegionRegistry] = None) -> str:
+    """注册表内容指纹（region_id / province / city 的 sha1），供增量缓存判断 region_id 是否仍然有效。"""
+    frame = (registry or get_registry()).to_frame()[['region_id', 'province', 'city']]
+    rows = frame.astype(object).where(frame.notna(), None).values.tolist()
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def save_registry_if_dirty() -> Optional[str]:
+    """若本进程分配过新的 region_id，则把注册表写回磁盘。"""
+    if _REGISTRY is not None and _REGISTRY.dirty:
+        return _REGISTRY.save()
+    return None
+
+
+def attach_region_ids(df: pd.DataFrame, registry: Optional[RegionRegistry] = None, add: bool = True,
+                      names: bool = True) -> pd.DataFrame:
+    """确保 df 同时带有 region_id 与规范的 province/city 列。
+
+    - 只有名称的行：按名称分配/查找 region_id；
+    - 只有 region_id 的行（--region-ids-only 输出）：从注册表还原名称；
+    - names=True 时已知 ID 的名称统一替换为注册表中的规范名称（'河北' -> '河北省'）。
+    """
+    registry = registry or get_registry()
+    out = df.copy()
+    has_names = 'province' in out.columns or 'city' in out.columns
+    if 'region_id' in out.columns:
+        out['region_id'] = pd.to_numeric(out['region_id'], errors='coerce').astype('Int64')
+        if has_names:
+            missing = out['region_id'].isna()
+            if missing.any():
+                out.loc[missing, 'region_id'] = registry.encode(out.loc[missing], add=add)
+    elif has_names:
+        out.insert(0, 'region_id', registry.encode(out, add=add))
+    else:
+        return out
+    if names:
+        decoded = registry.decode(out['region_id'])
+        known = out['region_id'].notna().to_numpy()
+        for col in ('province', 'city'):
+            if col in out.columns:
+                out[col] = out[col].astype(object)
+                out.loc[known, col] = decoded.loc[known, col].to_numpy()
+            else:
+                out[col] = decoded[col].to_numpy()
+    return out
+
+
+def build_registry_from_frames(frames: Iterable[pd.DataFrame], path: Optional[str] = None,
+                               reference_path: Optional[str] = None) -> RegionRegistry:
+    """从若干日级输出帧中收集省市对并更新注册表（已有 ID 保持不变，新名称按排序追加）。"""
+    registry = RegionRegistry.load(path)
+    pairs = set()
+    for df in frames:
+        if df is None or df.empty or 'city' not in df.columns:
+            continue
+        prov = df['province'] if 'province' in df.columns else pd.Series([''] * len(df))
+        for p, c in zip(prov.map(registry.canonical_province), df['city'].map(normalize_name)):
+            if p or c:
+                pairs.add((p, c))
+    for p, c in sorted(pairs):
+        registry.region_id(p, c, add=True)
+    registry.fill_centroids(reference_path)
+    return registry
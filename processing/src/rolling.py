@@ -0,0 +1,216 @@
+"""按年计算的滑动窗口统计：7/30 天滑动均值、滑动最大值、滑动超标天数。
+
+城市日数据先排成 (变量, 区域, 日) 矩阵（日为完整日历，缺测或缺文件的日子为 NaN），
+之后所有窗口统计都是整块数组运算，不按日循环：
+
+* 滑动均值：对“值（NaN 记 0）”和“有效标记”分别做 cumsum，窗口和 = cs[t] - cs[t-w]，
+  均值 = 窗口和 / 窗口有效天数；有效天数不足 min_periods 时为 NaN。
+* 滑动最大值：sliding_window_view 后 np.fmax.reduce（忽略 NaN）。
+* 超标天数：指示矩阵 (值 > 限值) 的 cumsum 差分，限值见 config.DAILY_LIMITS。O3 的限值是
+  MDA8 限值，因此 O3 超标按 ``o3_mda8`` 判定（见 LIMIT_SOURCES）；日数据缺 ``o3_mda8`` 的
+  区域-日退回日均 ``o3`` 并打印警告。
+
+窗口均为“截至当天”的尾随窗口（t-w+1 .. t），1 月初的窗口会用到上一年末的日数据（存在时）。
+每年写出一个 npz（float32）::
+
+    <out>/<year>.npz   dates[YYYY-MM-DD], region_ids, variables, windows,
+                       {var}_mean{w}, {var}_max{w}, {var}_exceed{w}   形状 (区域, 日)
+
+可选再写 <out>/<year>/<region_id>.json（列式：dates + 各序列）供前端趋势图直接使用。
+"""
+import os
+import json
+from collections import namedtuple
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .config import DAILY_LIMITS, DAY_ROOTS, ROLLING_DIR, ROLLING_WINDOWS
+from .dayreader import read_days
+from .regions import attach_region_ids, get_registry, save_registry_if_dirty
+from .store import prefer_first_root, store_days
+
+ROLLING_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v', 'o3_mda8']
+# 超标判定所用的日值：{变量: 列名}，限值按该列的统计口径给出（O3 为日最大 8 小时均值）
+LIMIT_SOURCES = {'o3': 'o3_mda8'}
+
+# cube: (变量, 区域, 日)；region_ids / dates 为对应的坐标
+DayMatrix = namedtuple('DayMatrix', ['cube', 'variables', 'region_ids', 'dates'])
+
+
+def day_matrix(days: pd.DataFrame, variables: Sequence[str] = ROLLING_VARS,
+               start=None, end=None) -> DayMatrix:
+    """把带 region_id/date 的日数据排成 (变量, 区域, 日) 矩阵；同一区域同一天多条记录取均值。
+
+    start/end 默认取数据的首尾日期所在年份的 1/1 与 12/31，日期轴为连续日历。
+    """
+    variables = [v for v in variables if v in days.columns]
+    days = days[days['region_id'].notna()]
+    dates_col = pd.to_datetime(days['date']).dt.normalize()
+    start = pd.Timestamp(start) if start is not None else pd.Timestamp(dates_col.min().year, 1, 1)
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp(dates_col.max().year, 12, 31)
+    dates = pd.date_range(start, end, freq='D')
+    keep = (dates_col >= start) & (dates_col <= end)
+    days, dates_col = days[keep], dates_col[keep]
+
+    region_idx, region_ids = pd.factorize(days['region_id'].astype('int64'), sort=True)
+    day_idx = (dates_col - start).dt.days.to_numpy()
+    n_regions, n_days = len(region_ids), len(dates)
+    flat = region_idx * n_days + day_idx
+
+    cube = np.full((len(variables), n_regions, n_days), np.nan)
+    for i, v in enumerate(variables):
+        vals = pd.to_numeric(days[v], errors='coerce').to_numpy(dtype='float64')
+        ok = np.isfinite(vals)
+        sums = np.bincount(flat[ok], weights=vals[ok], minlength=n_regions * n_days)
+        counts = np.bincount(flat[ok], minlength=n_regions * n_days)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cube[i] = (sums / counts).reshape(n_regions, n_days)
+    return DayMatrix(cube, list(variables), np.asarray(region_ids, dtype=np.int64), dates)
+
+
+def _window_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """沿最后一维的尾随窗口和（cumsum 差分），前 window-1 天为不完整窗口的和。"""
+    cs = np.cumsum(x, axis=-1, dtype='float64')
+    out = cs.copy()
+    out[..., window:] -= cs[..., :-window]
+    return out
+
+
+def rolling_mean(cube: np.ndarray, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """NaN 感知的尾随滑动均值；窗口内有效天数 < min_periods（默认 window 的一半，至少 1）时为 NaN。"""
+    if min_periods is None:
+        min_periods = max(1, window // 2)
+    valid = np.isfinite(cube)
+    sums = _window_sum(np.where(valid, cube, 0.0), window)
+    counts = _window_sum(valid, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / counts
+    mean[counts < min_periods] = np.nan
+    return mean
+
+
+def rolling_max(cube: np.ndarray, window: int) -> np.ndarray:
+    """尾随滑动最大值（忽略 NaN，窗口内全部缺测时为 NaN）。"""
+    pad = np.full(cube.shape[:-1] + (window - 1,), np.nan)
+    view = sliding_window_view(np.concatenate([pad, cube], axis=-1), window, axis=-1)
+    return np.fmax.reduce(view, axis=-1)
+
+
+def rolling_exceedance(values: np.ndarray, limit: float, window: int) -> np.ndarray:
+    """尾随窗口内超过 limit 的天数（缺测日不计为超标）。"""
+    with np.errstate(invalid='ignore'):
+        hits = values > limit
+    return _window_sum(hits, window).astype(np.int32)
+
+
+def limit_values(matrix: DayMatrix, var: str) -> np.ndarray:
+    """变量 var 做超标判定用的 (区域, 日) 日值。
+
+    LIMIT_SOURCES 指定了来源列（如 o3 -> o3_mda8）时优先用该列；该列缺失的区域-日
+    （旧日文件未带极值字段）退回 var 自身的日均值，并打印警告。
+    """
+    values = matrix.cube[matrix.variables.index(var)]
+    source = LIMIT_SOURCES.get(var)
+    if source is None:
+        return values
+    if source in matrix.variables:
+        preferred = matrix.cube[matrix.variables.index(source)]
+        missing = ~np.isfinite(preferred) & np.isfinite(values)
+    else:
+        preferred, missing = values, np.isfinite(values)
+    n_missing = int(missing.sum())
+    if n_missing:
+        print(f"warning: {source} missing for {n_missing} region-days; "
+              f"{var} exceedance falls back to the daily mean there")
+    return np.where(missing, values, preferred)
+
+
+def compute_rolling(matrix: DayMatrix, windows: Sequence[int] = ROLLING_WINDOWS,
+                    limits: Optional[Dict[str, float]] = None) -> Dict[str, np.ndarray]:
+    """对 DayMatrix 的每个变量、每个窗口计算滑动均值/最大值（及有限值的变量的超标天数）。"""
+    limits = DAILY_LIMITS if limits is None else limits
+    limited = {v: limit_values(matrix, v) for v in matrix.variables if v in limits}
+    out = {}
+    for w in windows:
+        means = rolling_mean(matrix.cube, w)
+        maxes = rolling_max(matrix.cube, w)
+        for i, v in enumerate(matrix.variables):
+            out[f'{v}_mean{w}'] = means[i]
+            out[f'{v}_max{w}'] = maxes[i]
+            if v in limited:
+                out[f'{v}_exceed{w}'] = rolling_exceedance(limited[v], limits[v], w)
+    return out
+
+
+def write_rolling(year: int, matrix: DayMatrix, series: Dict[str, np.ndarray], windows: Sequence[int],
+                  out_dir: Optional[str] = None, region_json: bool = False) -> str:
+    """写出 <out>/<year>.npz；region_json=True 时另写每个区域一个列式 JSON。返回 npz 路径。"""
+    out_dir = out_dir or ROLLING_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    dates = matrix.dates.strftime('%Y-%m-%d').to_numpy().astype('U10')
+    arrays = {k: (v if v.dtype.kind == 'i' else v.astype(np.float32)) for k, v in series.items()}
+    path = os.path.join(out_dir, f'{year}.npz')
+    np.savez_compressed(path, dates=dates, region_ids=matrix.region_ids,
+                        variables=np.asarray(matrix.variables), windows=np.asarray(windows), **arrays)
+    if region_json:
+        region_dir = os.path.join(out_dir, str(year))
+        os.makedirs(region_dir, exist_ok=True)
+        names = sorted(series)
+        for r, region_id in enumerate(matrix.region_ids):
+            record = {'region_id': int(region_id), 'dates': dates.tolist()}
+            for k in names:
+                row = series[k][r]
+                if row.dtype.kind == 'i':
+                    record[k] = row.tolist()
+                else:
+                    record[k] = [None if not np.isfinite(x) else x for x in np.round(row, 3).tolist()]
+            with open(os.path.join(region_dir, f'{int(region_id)}.json'), 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, separators=(',', ':'))
+    return path
+
+
+def load_rolling(year: int, out_dir: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """读取 write_rolling 写出的 npz，返回 {名称: 数组}。"""
+    with np.load(os.path.join(out_dir or ROLLING_DIR, f'{year}.npz')) as data:
+        return {k: data[k] for k in data.files}
+
+
+def load_year_days(year: int, lead_days: int = 0, roots: Optional[Sequence[str]] = None,
+                   variables: Sequence[str] = ROLLING_VARS) -> pd.DataFrame:
+    """读取某年的城市日数据，外加上一年末 lead_days 天（用于年初窗口），并补齐 region_id。
+
+    分析库（store.py）与日文件一致时直接按日期范围查询，否则逐文件读取。
+    """
+    roots = roots or DAY_ROOTS
+    lead_start = pd.Timestamp(year, 1, 1) - pd.Timedelta(days=lead_days)
+    days = store_days(lead_start, f'{year}-12-31', roots, variables)
+    if days is not None:
+        return days
+    columns = ['region_id', 'province', 'city'] + list(variables)
+    parts = []
+    for root in roots:
+        parts.append(read_days(root, int(year), columns=columns))
+        if lead_days > 0:
+            parts.append(read_days(root, int(year) - 1, start=lead_start, columns=columns))
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame()
+    days = attach_region_ids(pd.concat(parts, ignore_index=True), get_registry(), names=False)
+    save_registry_if_dirty()
+    return prefer_first_root(days)
+
+
+def build_year_rolling(year: int, days: pd.DataFrame, windows: Iterable[int] = ROLLING_WINDOWS,
+                       variables: Sequence[str] = ROLLING_VARS, out_dir: Optional[str] = None,
+                       region_json: bool = False) -> str:
+    """一年的日数据（可含上一年末的若干天）-> 矩阵 -> 滑动统计 -> 截取本年并写出。"""
+    windows = sorted(set(int(w) for w in windows))
+    lead = windows[-1] - 1
+    start = pd.Timestamp(year, 1, 1)
+    matrix = day_matrix(days, variables, start=start - pd.Timedelta(days=lead), end=f'{year}-12-31')
+    series = {k: v[..., lead:] for k, v in compute_rolling(matrix, windows).items()}
+    matrix = matrix._replace(cube=matrix.cube[..., lead:], dates=matrix.dates[lead:])
+    return write_rolling(year, matrix, series, windows, out_dir, region_json)
@@ -0,0 +1,186 @@
+"""单次扫描的多粒度时间汇总：day → week → month → season → heating → year。
+
+日数据只读一次（dayreader），每个日期先映射到各粒度的周期标签（只对去重后的日期计算，
+每年最多 366 个），得到一个 (粒度数 × 行数) 的周期编码数组；所有粒度共用一次
+groupby(周期编码, region) 求出可合并矩（count/sum/sumsq/min/max，见 moments.py），
+再按编码区间切回各粒度。新增周期类型只需在 PERIOD_LABELERS 里加一个标签函数，不需要再扫一遍数据。
+
+输出与月度/年度文件同一类格式（记录列表 JSON）::
+
+    <out>/<granularity>/<period>.json   [{region_id, province, city, period, start, end, days,
+                                         {var}_mean/_max/_min/_std/_count/_sum/_sumsq ...}]
+    <out>/index.json                    {granularity: [period, ...]}
+
+周期标签：week 为 ISO 周（'2013-W05'，跨年的周归属 ISO 年）；month 'YYYY-MM'；
+season 'YYYY-spring/summer/autumn/winter'（见 config.SEASON_MONTHS）；heating 'YYYY-heating' /
+'YYYY-nonheating'（config.HEATING_MONTHS）；year 'YYYY'。跨年的周期按起始年份标记：'2015-winter' 为
+2015-12 ~ 2016-02，'2015-heating' 为 2015-11 ~ 2016-02，因此每个标签都是一段连续日期；只读入部分
+年份时首尾的冬季/采暖季不完整，可由 start / end / days 看出。
+"""
+import os
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .config import DAY_ROOTS, HEATING_MONTHS, ROLLUP_DIR, SEASON_MONTHS
+from .dayreader import read_days
+from .moments import MOMENT_STATS, finalize_moments
+from .regions import attach_region_ids, get_registry, save_registry_if_dirty
+from .store import prefer_first_root, store_days
+
+ROLLUP_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v']
+DEFAULT_GRANULARITIES = ('week', 'month', 'season', 'heating', 'year')
+
+_MONTH_SEASON = {m: name for name, months in SEASON_MONTHS.items() for m in months}
+# 月份 -> 所属季节的首月（1..12 索引）
+_SEASON_START = np.zeros(13, dtype=np.int64)
+for _months in SEASON_MONTHS.values():
+    _SEASON_START[list(_months)] = _months[0]
+
+
+def _week_labels(dates: pd.DatetimeIndex) -> np.ndarray:
+    iso = dates.isocalendar()
+    return (iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)).to_numpy()
+
+
+def season_years(years: np.ndarray, months: np.ndarray) -> np.ndarray:
+    """季节的起始年份：月份早于所属季节首月（冬季的 1、2 月）时归上一年。"""
+    months = np.asarray(months, dtype=np.int64)
+    return np.asarray(years, dtype=np.int64) - (months < _SEASON_START[months])
+
+
+def season_labels(dates: pd.DatetimeIndex) -> np.ndarray:
+    years = season_years(dates.year, dates.month)
+    return np.array([f'{y}-{_MONTH_SEASON[m]}' for y, m in zip(years.tolist(), dates.month.tolist())], dtype=object)
+
+
+def _heating_labels(dates: pd.DatetimeIndex) -> np.ndarray:
+    months = dates.month.to_numpy()
+    heating = np.isin(months, HEATING_MONTHS)
+    # 采暖季中早于起始月的月份（1、2 月）属于上一年开始的采暖季
+    years = (dates.year.to_numpy() - (heating & (months < HEATING_MONTHS[0]))).astype(str)
+    return np.where(heating, np.char.add(years, '-heating'), np.char.add(years, '-nonheating')).astype(object)
+
+
+PERIOD_LABELERS: Dict[str, Callable[[pd.DatetimeIndex], np.ndarray]] = {
+    'day': lambda d: d.strftime('%Y-%m-%d').to_numpy(),
+    'week': _week_labels,
+    'month': lambda d: d.strftime('%Y-%m').to_numpy(),
+    'season': season_labels,
+    'heating': _heating_labels,
+    'year': lambda d: d.strftime('%Y').to_numpy(),
+}
+
+
+def rollup(days: pd.DataFrame, granularities: Sequence[str] = DEFAULT_GRANULARITIES,
+           variables: Sequence[str] = ROLLUP_VARS) -> Dict[str, pd.DataFrame]:
+    """把带 region_id/date 的日数据一次性汇总到多个粒度，返回 {粒度: 汇总表}。"""
+    unknown = [g for g in granularities if g not in PERIOD_LABELERS]
+    if unknown:
+        raise ValueError(f'unknown granularity: {unknown}; known: {sorted(PERIOD_LABELERS)}')
+    variables = [v for v in variables if v in days.columns]
+    days = days[days['region_id'].notna()]
+    region_idx, regions = pd.factorize(days['region_id'].astype('int64'), sort=True)
+    date_idx, dates = pd.factorize(pd.to_datetime(days['date']).dt.normalize(), sort=True)
+    dates = pd.DatetimeIndex(dates)
+
+    # 每个粒度：日期 -> 周期编码（全局唯一，粒度之间按偏移错开）
+    offset = 0
+    date_codes, period_tables = [], {}
+    for g in granularities:
+        codes, labels = pd.factorize(PERIOD_LABELERS[g](dates), sort=True)
+        date_codes.append(codes + offset)
+        bounds = pd.DataFrame({'code': codes, 'date': dates}).groupby('code')['date'].agg(['min', 'max', 'size'])
+        period_tables[g] = pd.DataFrame({
+            'code': np.arange(len(labels)) + offset, 'period': np.asarray(labels, dtype=object),
+            'start': bounds['min'].dt.strftime('%Y-%m-%d').to_numpy(),
+            'end': bounds['max'].dt.strftime('%Y-%m-%d').to_numpy(),
+            'days': bounds['size'].to_numpy(),
+        })
+        offset += len(labels)
+
+    # (粒度数 × 行数) 的周期编码，值数组按粒度平铺
+    n_regions = len(regions)
+    period_code = np.concatenate([c[date_idx] for c in date_codes])
+    key = period_code.astype(np.int64) * n_regions + np.tile(region_idx, len(granularities))
+    frame = {'key': key}
+    for v in variables:
+        vals = np.tile(pd.to_numeric(days[v], errors='coerce').to_numpy(dtype='float64'), len(granularities))
+        frame[v] = vals
+        frame[f'{v}__sq'] = vals ** 2
+    spec = {}
+    for v in variables:
+        spec[f'{v}_count'] = (v, 'count')
+        spec[f'{v}_sum'] = (v, 'sum')
+        spec[f'{v}_sumsq'] = (f'{v}__sq', 'sum')
+        spec[f'{v}_min'] = (v, 'min')
+        spec[f'{v}_max'] = (v, 'max')
+    agg = pd.DataFrame(frame).groupby('key', sort=True).agg(**spec).reset_index()
+    for v in variables:
+        empty = agg[f'{v}_count'] == 0
+        agg.loc[empty, [f'{v}_sum', f'{v}_sumsq']] = np.nan
+    agg['code'] = agg['key'] // n_regions
+    agg['region_id'] = regions.to_numpy()[agg['key'] % n_regions]
+    agg = finalize_moments(agg.drop(columns=['key']), variables)
+
+    out = {}
+    for g in granularities:
+        table = period_tables[g]
+        part = agg[agg['code'].between(table['code'].min(), table['code'].max())]
+        part = table.merge(part, on='code').drop(columns=['code'])
+        cols = ['region_id', 'period', 'start', 'end', 'days']
+        for v in variables:
+            cols += [f'{v}_mean', f'{v}_max', f'{v}_min', f'{v}_std'] + [f'{v}_{s}' for s in MOMENT_STATS if s not in ('min', 'max')]
+        out[g] = part[cols].sort_values(['period', 'region_id'], kind='stable').reset_index(drop=True)
+    return out
+
+
+def load_days_for_rollup(years: Iterable[int], roots: Optional[List[str]] = None,
+                         variables: Sequence[str] = ROLLUP_VARS) -> pd.DataFrame:
+    """读取若干年的城市日数据（任意格式）并补齐 region_id；分析库与日文件一致的年份直接查库。"""
+    roots = roots or DAY_ROOTS
+    stored = [store_days(f'{y}-01-01', f'{y}-12-31', roots, variables) for y in years]
+    if stored and all(s is not None for s in stored):
+        return pd.concat(stored, ignore_index=True)
+    parts = []
+    for root in roots:
+        for y in years:
+            df = read_days(root, int(y), columns=['region_id', 'province', 'city'] + list(variables))
+            if not df.empty:
+                parts.append(df)
+    if not parts:
+        return pd.DataFrame()
+    days = attach_region_ids(pd.concat(parts, ignore_index=True), get_registry(), names=False)
+    save_registry_if_dirty()
+    # 同一区域同一天出现多次（多个根目录）时只保留一条，规则与分析库导入相同
+    return prefer_first_root(days)
+
+
+def write_rollups(results: Dict[str, pd.DataFrame], out_dir: Optional[str] = None, names: bool = True) -> Dict[str, List[str]]:
+    """按 <out>/<粒度>/<周期>.json 写出汇总，并更新 <out>/index.json。"""
+    out_dir = out_dir or ROLLUP_DIR
+    registry = get_registry()
+    index_path = os.path.join(out_dir, 'index.json')
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    for g, table in results.items():
+        if names:
+            decoded = registry.decode(table['region_id'])
+            table = table.copy()
+            table.insert(1, 'province', decoded['province'].to_numpy())
+            table.insert(2, 'city', decoded['city'].to_numpy())
+        g_dir = os.path.join(out_dir, g)
+        os.makedirs(g_dir, exist_ok=True)
+        for period, part in table.groupby('period', sort=True):
+            records = part.round(6).astype(object).where(part.notna(), None).to_dict('records')
+            with open(os.path.join(g_dir, f'{period}.json'), 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+        index[g] = sorted(set(index.get(g, [])) | set(table['period'].unique()))
+    os.makedirs(out_dir, exist_ok=True)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    return index
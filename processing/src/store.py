@@ -0,0 +1,327 @@
+"""城市日数据的本地分析库（SQLite 单文件）。
+
+各生成脚本每次都要遍历 <year>/<mm>/<dd>/ 目录并拼接几千个小文件。这里把所有已处理的
+城市日数据批量写入一个 SQLite 文件，之后按 日期范围 / 区域 / 变量 一次索引查询即可。
+
+表结构：
+
+    regions(region_id PRIMARY KEY, province_id, province, city, lon, lat)   -- 来自行政区注册表
+    city_days(region_id, date 'YYYY-MM-DD', pm25, pm10, ...)                 -- 主键 (region_id, date)
+    loaded_files(path PRIMARY KEY, mtime, size, rows)                       -- 增量加载记录
+
+索引：city_days 主键即 (region_id, date)，另建 (date) 索引用于按日期范围扫描全部区域。
+使用标准库 sqlite3，不引入额外依赖。
+
+下游的 rolling / climatology / rollup / build-products / trends 通过 store_days() 读取：库存在且
+与日文件一致（loaded_files 与当前各根目录下该时段的文件逐一对应、mtime/size 未变）时直接按日期
+范围查询，否则返回 None，由调用方退回逐文件读取（dayreader）。
+
+导入以“日期”为单位：某天任一根目录下的文件有变化时，先删除该日期的全部行，再按根目录顺序
+合并当天各文件重新写入（prefer_first_root：同一 (region_id, date) 取最靠前的根目录、文件内的
+第一条），与逐文件读取的路径使用同一条优先级规则。
+"""
+import os
+import re
+import sqlite3
+from typing import Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .config import ANALYTICS_DB_PATH, DAY_ROOTS
+from .dayreader import DayFile, discover_days, read_day
+from .regions import get_registry, attach_region_ids, save_registry_if_dirty, RegionRegistry
+
+STORE_VARS = ['pm25', 'pm10', 'so2', 'no2', 'co', 'o3', 'temp', 'rh', 'psfc', 'u', 'v', 'o3_mda8']
+
+
+def connect(db_path: Optional[str] = None, variables: Sequence[str] = STORE_VARS) -> sqlite3.Connection:
+    """打开（必要时创建）分析库并确保表与索引存在。"""
+    db_path = db_path or ANALYTICS_DB_PATH
+    d = os.path.dirname(db_path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS regions (
+            region_id INTEGER PRIMARY KEY,
+            province_id INTEGER,
+            province TEXT,
+            city TEXT,
+            lon REAL,
+            lat REAL
+        )
+        """
+    )
+    var_cols = ',\n            '.join(f'{v} REAL' for v in variables)
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS city_days (
+            region_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            {var_cols},
+            PRIMARY KEY (region_id, date)
+        ) WITHOUT ROWID
+        """
+    )
+    # 旧库缺少的新变量列按需补齐
+    existing = {row[1] for row in cur.execute('PRAGMA table_info(city_days)')}
+    for v in variables:
+        if v not in existing:
+            cur.execute(f'ALTER TABLE city_days ADD COLUMN {v} REAL')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_city_days_date ON city_days(date)')
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loaded_files (
+            path TEXT PRIMARY KEY,
+            mtime REAL,
+            size INTEGER,
+            rows INTEGER
+        )
+        """
+    )
+    conn.commit()
+    return conn
+
+
+def _table_vars(conn: sqlite3.Connection) -> List[str]:
+    return [row[1] for row in conn.execute('PRAGMA table_info(city_days)') if row[1] not in ('region_id', 'date')]
+
+
+def sync_regions(conn: sqlite3.Connection, registry: Optional[RegionRegistry] = None) -> int:
+    """把注册表写入 regions 表（整表覆盖，region_id 稳定所以无需级联）。"""
+    registry = registry or get_registry()
+    frame = registry.to_frame()
+    rows = [(int(r.region_id), None if pd.isna(r.province_id) else int(r.province_id), r.province, r.city,
+             None if pd.isna(r.lon) else float(r.lon), None if pd.isna(r.lat) else float(r.lat))
+            for r in frame.itertuples(index=False)]
+    with conn:
+        conn.execute('DELETE FROM regions')
+        conn.executemany('INSERT INTO regions VALUES (?, ?, ?, ?, ?, ?)', rows)
+    return len(rows)
+
+
+def find_day_files(roots: Iterable[str], years: Optional[Iterable[int]] = None) -> List[DayFile]:
+    """在各 root 下查找城市日文件（任意格式，见 dayreader.discover_days）。"""
+    out = []
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for y in (list(years) if years else [None]):
+            out.extend(discover_days(root, y))
+    return out
+
+
+def prefer_first_root(days: pd.DataFrame) -> pd.DataFrame:
+    """同一 (region_id, date) 出现多次时只保留第一条。
+
+    days 按 roots 顺序拼接（同一根目录内按文件顺序），因此前面的根目录优先；分析库导入与
+    rolling / rollup 的逐文件读取共用这一规则，两条路径对同一查询返回相同的数据。
+    """
+    return days.drop_duplicates(['region_id', 'date'], keep='first')
+
+
+def _path_date(path: str) -> Optional[str]:
+    """日文件路径 -> 'YYYY-MM-DD'（文件名以 YYYYMMDD 开头），否则 None。"""
+    m = re.match(r'(\d{8})\.', os.path.basename(path))
+    return f'{m.group(1)[:4]}-{m.group(1)[4:6]}-{m.group(1)[6:]}' if m else None
+
+
+def _date_rows(frames: Sequence[pd.DataFrame], date: str, variables: Sequence[str], registry: RegionRegistry,
+               register_new: bool = False) -> list:
+    """同一天各根目录的日文件（按 roots 顺序）-> city_days 行。"""
+    frames = [df for df in frames if 'region_id' in df.columns or {'province', 'city'} <= set(df.columns)]
+    if not frames:
+        return []
+    df = attach_region_ids(pd.concat(frames, ignore_index=True), registry, add=register_new, names=False)
+    df = df[df['region_id'].notna()]
+    if df.empty:
+        return []
+    df = prefer_first_root(df.assign(region_id=df['region_id'].astype('int64')))
+    cols = {'region_id': df['region_id'].to_numpy(), 'date': date}
+    for v in variables:
+        if v in df.columns:
+            cols[v] = pd.to_numeric(df[v], errors='coerce').astype('float64').to_numpy()
+        else:
+            cols[v] = np.full(len(df), np.nan)
+    frame = pd.DataFrame(cols)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+def load_days(roots: Optional[Iterable[str]] = None, years: Optional[Iterable[int]] = None,
+              db_path: Optional[str] = None, force: bool = False, batch_rows: int = 50000,
+              register_new: bool = False) -> dict:
+    """批量导入城市日文件，以日期为单位：某天各根目录下的文件与上次导入完全一致（路径、mtime、size）
+    时跳过，否则在同一事务中删除该日期的旧行并按 prefer_first_root 合并重写（force=True 则全部重导）。
+
+    默认只导入注册表中已有的省市（未知名称的行跳过），不改动 regions.json；
+    register_new=True 时为新名称分配 region_id 并保存注册表。
+    返回 {'files': 导入文件数, 'skipped': 跳过数, 'rows': 写入行数, 'removed': 文件已被删除而清空的日期数}。
+    """
+    roots = list(roots) if roots else DAY_ROOTS
+    conn = connect(db_path)
+    variables = _table_vars(conn)
+    registry = get_registry()
+    seen = {}
+    for path, mtime, size in conn.execute('SELECT path, mtime, size FROM loaded_files'):
+        seen.setdefault(_path_date(path), {})[path] = (mtime, size)
+    placeholders = ', '.join(['?'] * (len(variables) + 2))
+    insert_sql = f"INSERT INTO city_days (region_id, date, {', '.join(variables)}) VALUES ({placeholders})"
+
+    # 按日期归组；find_day_files 按 roots 顺序返回，组内顺序即根目录优先级
+    by_date = {}
+    for day in find_day_files(roots, years):
+        by_date.setdefault(day.date.strftime('%Y-%m-%d'), []).append(day)
+
+    # 上次导入过、但这些根目录下已没有任何文件的日期：旧行同样要删除
+    root_dirs = tuple(os.path.join(os.path.abspath(r), '') for r in roots)
+    year_set = {int(y) for y in years} if years else None
+    removed = [d for d, paths in seen.items() if d and d not in by_date
+               and (year_set is None or int(d[:4]) in year_set) and any(p.startswith(root_dirs) for p in paths)]
+
+    stats = {'files': 0, 'skipped': 0, 'rows': 0, 'removed': len(removed)}
+    pending, pending_files, pending_dates = [], [], list(removed)
+
+    def flush():
+        if not pending_dates:
+            return
+        with conn:
+            for date in pending_dates:
+                conn.execute('DELETE FROM city_days WHERE date = ?', (date,))
+                conn.executemany('DELETE FROM loaded_files WHERE path = ?', [(p,) for p in seen.get(date, {})])
+            conn.executemany(insert_sql, pending)
+            conn.executemany('INSERT OR REPLACE INTO loaded_files VALUES (?, ?, ?, ?)', pending_files)
+        pending.clear()
+        pending_files.clear()
+        pending_dates.clear()
+
+    conn.execute('PRAGMA synchronous=OFF')
+    for date in sorted(by_date):
+        days = by_date[date]
+        current = {}
+        for day in days:
+            st = os.stat(day.path)
+            current[os.path.abspath(day.path)] = (st.st_mtime, st.st_size)
+        if not force and seen.get(date) == current:
+            stats['skipped'] += len(days)
+            continue
+        try:
+            frames = [read_day(day) for day in days]
+        except Exception as e:
+            print(f"warning: failed reading {date}: {e}")
+            continue
+        rows = _date_rows(frames, date, variables, registry, register_new)
+        pending.extend(rows)
+        pending_files.extend((path, mtime, size, len(rows)) for path, (mtime, size) in current.items())
+        pending_dates.append(date)
+        stats['files'] += len(days)
+        stats['rows'] += len(rows)
+        if len(pending) >= batch_rows:
+            flush()
+    flush()
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if register_new:
+        save_registry_if_dirty()
+    sync_regions(conn, registry)
+    conn.execute('ANALYZE')
+    conn.close()
+    return stats
+
+
+def query(start: Optional[str] = None, end: Optional[str] = None,
+          regions: Optional[Iterable[Union[int, str]]] = None, provinces: Optional[Iterable[str]] = None,
+          variables: Optional[Sequence[str]] = None, db_path: Optional[str] = None,
+          conn: Optional[sqlite3.Connection] = None, names: bool = True) -> pd.DataFrame:
+    """按日期范围 / 区域 / 变量查询城市日数据。
+
+    start/end 为闭区间 'YYYY-MM-DD'（也可只给 'YYYY' 或 'YYYY-MM'，自动扩展到整年/整月）；
+    regions 可混合 region_id 与城市名；provinces 为省份名。返回带 datetime 类型 date 列的
+    DataFrame，按 (region_id, date) 排序；names=True 时附带 province/city。
+    """
+    own = conn is None
+    conn = conn or connect(db_path)
+    try:
+        table_vars = _table_vars(conn)
+        variables = [v for v in (variables or table_vars) if v in table_vars]
+        where, params = [], []
+        if start:
+            where.append('d.date >= ?')
+            params.append(_expand_date(start, upper=False))
+        if end:
+            where.append('d.date <= ?')
+            params.append(_expand_date(end, upper=True))
+        if regions is not None:
+            ids = [int(r) for r in regions if isinstance(r, (int, np.integer)) or str(r).isdigit()]
+            names_ = [str(r) for r in regions if not (isinstance(r, (int, np.integer)) or str(r).isdigit())]
+            cond = []
+            if ids:
+                cond.append(f"d.region_id IN ({', '.join(['?'] * len(ids))})")
+                params.extend(ids)
+            if names_:
+                cond.append(f"r.city IN ({', '.join(['?'] * len(names_))})")
+                params.extend(names_)
+            where.append('(' + (' OR '.join(cond) or '0') + ')')
+        if provinces is not None:
+            provinces = list(provinces)
+            where.append(f"r.province IN ({', '.join(['?'] * len(provinces)) or 'NULL'})")
+            params.extend(provinces)
+        cols = ['d.region_id', 'd.date'] + (['r.province', 'r.city'] if names else []) + [f'd.{v}' for v in variables]
+        sql = f"SELECT {', '.join(cols)} FROM city_days d LEFT JOIN regions r ON r.region_id = d.region_id"
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY d.region_id, d.date'
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        if own:
+            conn.close()
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    return df
+
+
+def store_days(start, end, roots: Optional[Iterable[str]] = None, variables: Sequence[str] = STORE_VARS,
+               db_path: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """从分析库读取 [start, end] 的城市日数据（region_id, date, 变量...）。
+
+    库不存在、缺少所需变量列，或与 roots 下该时段的日文件不一致（有新增/删除/改动的文件）时返回 None。
+    """
+    db_path = db_path or ANALYTICS_DB_PATH
+    if not os.path.exists(db_path):
+        return None
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    roots = list(roots) if roots else DAY_ROOTS
+    current = {}
+    for day in find_day_files(roots, range(start.year, end.year + 1)):
+        if start <= day.date <= end:
+            st = os.stat(day.path)
+            current[os.path.abspath(day.path)] = (st.st_mtime, st.st_size)
+    if not current:
+        return None
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if not {v for v in variables} <= set(_table_vars(conn)):
+            return None
+        loaded = {}
+        for path, mtime, size in conn.execute('SELECT path, mtime, size FROM loaded_files'):
+            date = _path_date(path)
+            if date and start <= pd.Timestamp(date) <= end:
+                loaded[path] = (mtime, size)
+        if loaded != current:
+            return None
+        return query(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), variables=variables, conn=conn,
+                     names=False)
+    finally:
+        conn.close()
+
+
+def _expand_date(s: str, upper: bool) -> str:
+    s = str(s)[:10]
+    if len(s) == 4:
+        return f'{s}-12-31' if upper else f'{s}-01-01'
+    if len(s) == 7:
+        # 'YYYY-MM-99' 大于该月任意日期字符串，'YYYY-MM-00' 小于任意日期字符串
+        return f'{s}-99' if upper else f'{s}-00'
+    return s
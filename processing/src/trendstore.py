@@ -0,0 +1,225 @@
+"""按层级的列式趋势文件（trend store）。
+
+原来的 generate_trend_csvs.py 为每个省/市各写一个 CSV，多年的逐日趋势就是成千上万个小文件。
+这里每个 (层级, 频率) 只写一对文件：
+
+- ``<level>_<freq>.trend.json``：索引头（变量、各列在 .bin 中的字节偏移、每个区域的起始行与行数）；
+- ``<level>_<freq>.trend.bin``：按列连续存放的小端序数组。``date`` 为 int32（逐日 YYYYMMDD，
+  逐月 YYYYMM），各变量为 float32（缺测 NaN）。
+
+所有行按 (区域键, 日期) 排序，因此一个区域的整条序列是每一列上的一个连续切片：
+``column[start:start + count]``。前端可以用 ArrayBuffer 按偏移直接切片，Python 端用 TrendStore
+（np.memmap + 区域 -> 行区间字典）随机访问。
+
+区域键：city 层为注册表 region_id，province 层为 province_id；序列均由城市日数据按键求均值
+（省级 = 该省各城市当天/当月的均值，与原脚本按名称 groupby 的做法一致）。
+"""
+import os
+import json
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .config import TRENDS_DIR
+from .products import PRODUCT_VARS, YearTable, group_means, level_groups, load_year_table
+from .regions import get_registry
+
+TREND_STORE_VERSION = 1
+TREND_LEVELS = ('city', 'province')
+TREND_FREQS = ('daily', 'monthly')
+TREND_SUFFIX = '.trend.json'
+TREND_BIN_SUFFIX = '.trend.bin'
+
+
+def _level_codes(table: YearTable, level: str):
+    """每行的区域键（city: region_id，province: province_id），键未知的行为 -1。"""
+    if level not in TREND_LEVELS:
+        raise ValueError(f'unknown trend level: {level}')
+    codes, groups = level_groups(table, level)
+    ids = groups['id'].fillna(-1).to_numpy(dtype=np.int64)
+    return np.where(codes >= 0, ids[np.maximum(codes, 0)], -1)
+
+
+def year_trend_rows(table: YearTable, level: str, freq: str, variables: Sequence[str]) -> pd.DataFrame:
+    """一年的 (键, 日期) 均值行：key, date(int), 变量...；全部变量缺测的组合不输出。"""
+    keys = _level_codes(table, level)
+    if freq == 'daily':
+        periods = table.data['day'].to_numpy().astype(np.int64)
+        labels = table.dates.strftime('%Y%m%d').astype(int).to_numpy()
+    elif freq == 'monthly':
+        periods = table.data['month'].to_numpy().astype(np.int64) - 1
+        labels = table.year * 100 + np.arange(1, 13)
+    else:
+        raise ValueError(f'unknown trend frequency: {freq}')
+    ok = keys >= 0
+    uniq, codes = np.unique(keys[ok], return_inverse=True)
+    n_periods = len(labels)
+    means = group_means(codes * n_periods + periods[ok], len(uniq) * n_periods,
+                        table.data.loc[ok, variables], variables)
+    present = means.notna().any(axis=1).to_numpy()
+    rows = np.nonzero(present)[0]
+    out = pd.DataFrame({'key': uniq[rows // n_periods], 'date': labels[rows % n_periods]})
+    for v in variables:
+        out[v] = means[v].to_numpy()[rows]
+    return out
+
+
+def write_trend_store(prefix: str, rows: pd.DataFrame, level: str, freq: str, variables: Sequence[str]) -> str:
+    """把 (key, date, 变量...) 行按 (key, date) 排序后写成 .trend.json + .trend.bin，返回索引路径。"""
+    order = np.lexsort((rows['date'].to_numpy(), rows['key'].to_numpy()))
+    keys = rows['key'].to_numpy(dtype=np.int64)[order]
+    uniq, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    arrays = [('date', rows['date'].to_numpy()[order].astype('<i4'))]
+    arrays += [(v, rows[v].to_numpy(dtype='float64')[order].astype('<f4')) for v in variables]
+
+    columns, offset = [], 0
+    bin_path = prefix + TREND_BIN_SUFFIX
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    with open(bin_path, 'wb') as f:
+        for name, arr in arrays:
+            f.write(arr.tobytes())
+            columns.append({'name': name, 'dtype': arr.dtype.str, 'offset': offset, 'length': int(arr.size)})
+            offset += arr.nbytes
+
+    registry = get_registry().to_frame()
+    if level == 'city':
+        names = pd.DataFrame({'region_id': pd.array(uniq, dtype='Int64')}).merge(
+            registry[['region_id', 'province', 'city']], on='region_id', how='left')
+        meta = {'province': names['province'], 'city': names['city']}
+    else:
+        names = pd.DataFrame({'province_id': pd.array(uniq, dtype='Int64')}).merge(
+            registry[['province_id', 'province']].drop_duplicates('province_id'), on='province_id', how='left')
+        meta = {'province': names['province']}
+    index = {
+        'version': TREND_STORE_VERSION, 'level': level, 'freq': freq, 'rows': int(len(keys)),
+        'variables': list(variables), 'bin': os.path.basename(bin_path), 'columns': columns,
+        'keys': {'id': uniq.tolist(), 'start': starts.tolist(), 'count': counts.tolist(),
+                 **{k: s.astype(object).where(s.notna(), None).tolist() for k, s in meta.items()}},
+    }
+    index_path = prefix + TREND_SUFFIX
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(index, ensure_ascii=False, separators=(',', ':')))
+    return index_path
+
+
+class TrendStoreBuilder:
+    """逐年 add 城市日表，累积各 (层级, 频率) 的均值行；finish 时每个组合写一对文件，返回 {名称: 索引路径}。
+
+    build_trend_stores 与 build-products 的 trends 产品（products.trend_stores）共用。
+    """
+
+    def __init__(self, out_dir: Optional[str] = None, levels: Sequence[str] = TREND_LEVELS,
+                 freqs: Sequence[str] = TREND_FREQS):
+        self.out_dir = out_dir or TRENDS_DIR
+        self.parts = {(lv, fq): [] for lv in levels for fq in freqs}
+        self.variables = None
+
+    def add(self, table: YearTable) -> None:
+        year_vars = [v for v in PRODUCT_VARS if v in table.data.columns]
+        self.variables = year_vars if self.variables is None else \
+            [v for v in self.variables if v in year_vars] + [v for v in year_vars if v not in self.variables]
+        for (lv, fq), acc in self.parts.items():
+            acc.append(year_trend_rows(table, lv, fq, year_vars))
+
+    def finish(self) -> Dict[str, str]:
+        written = {}
+        for (lv, fq), acc in self.parts.items():
+            if not acc:
+                continue
+            rows = pd.concat(acc, ignore_index=True)
+            for v in self.variables:
+                if v not in rows.columns:
+                    rows[v] = np.nan
+            written[f'{lv}_{fq}'] = write_trend_store(os.path.join(self.out_dir, f'{lv}_{fq}'), rows, lv, fq,
+                                                      self.variables)
+        return written
+
+
+def build_trend_stores(years: Sequence[int], roots: Optional[Sequence[str]] = None, out_dir: Optional[str] = None,
+                       levels: Sequence[str] = TREND_LEVELS, freqs: Sequence[str] = TREND_FREQS) -> Dict[str, str]:
+    """逐年加载一次城市日表，累积各 (层级, 频率) 的均值行，最后每个组合写一对文件。返回 {名称: 索引路径}。"""
+    builder = TrendStoreBuilder(out_dir, levels, freqs)
+    for year in years:
+        table = load_year_table(int(year), roots)
+        if table is None:
+            print(f"{year}: no city-day files found")
+            continue
+        builder.add(table)
+        print(f"{year}: {len(table.data)} city-days")
+    return builder.finish()
+
+
+class TrendStore:
+    """只读访问一个 .trend.json/.trend.bin：按区域键取连续切片，不解析整文件。"""
+
+    def __init__(self, index_path: str):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        self.level = self.index['level']
+        self.freq = self.index['freq']
+        self.variables = list(self.index['variables'])
+        bin_path = os.path.join(os.path.dirname(os.path.abspath(index_path)), self.index['bin'])
+        raw = np.memmap(bin_path, dtype=np.uint8, mode='r')
+        self.columns = {c['name']: raw[c['offset']:c['offset'] + c['length'] * np.dtype(c['dtype']).itemsize]
+                        .view(c['dtype']) for c in self.index['columns']}
+        keys = self.index['keys']
+        self._rows = {k: (s, s + n) for k, s, n in zip(keys['id'], keys['start'], keys['count'])}
+        # 名称 -> 键（同名时保留第一个）
+        name_field = 'city' if self.level == 'city' else 'province'
+        self._names = {}
+        for k, name in zip(keys['id'], keys.get(name_field, [])):
+            self._names.setdefault(name, k)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def keys(self):
+        return list(self._rows)
+
+    def key_for(self, region) -> Optional[int]:
+        """region 可以是键（region_id / province_id）或名称。"""
+        if isinstance(region, str):
+            return self._names.get(region)
+        return int(region) if int(region) in self._rows else None
+
+    def arrays(self, region) -> Optional[Dict[str, np.ndarray]]:
+        """一个区域的 {列名: 数组切片}（零拷贝视图），未知区域返回 None。"""
+        key = self.key_for(region)
+        if key is None:
+            return None
+        start, stop = self._rows[key]
+        return {name: col[start:stop] for name, col in self.columns.items()}
+
+    def series(self, region) -> Optional[pd.DataFrame]:
+        """一个区域的趋势表：date（逐日 Timestamp / 逐月 'YYYY-MM'）+ 变量。"""
+        arrays = self.arrays(region)
+        if arrays is None:
+            return None
+        dates = arrays['date'].astype(np.int64)
+        if self.freq == 'daily':
+            months = (dates // 10000 - 1970) * 12 + dates // 100 % 100 - 1
+            date = months.astype('datetime64[M]').astype('datetime64[D]') + (dates % 100 - 1)
+        else:
+            date = [f'{d // 100}-{d % 100:02d}' for d in dates.tolist()]
+        return pd.DataFrame({'date': date, **{v: arrays[v].astype('float64') for v in self.variables}})
+
+
+def benchmark_lookup(store: TrendStore, n: int = 1000, seed: int = 0) -> Dict[str, float]:
+    """随机取 n 个区域分别做 arrays()（切片并读出数据）与 series()（组装 DataFrame）查询，
+    返回单次查询的平均 / 最大耗时（毫秒）。"""
+    keys = store.keys()
+    if not keys:
+        return {'lookups': 0}
+    picks = np.random.default_rng(seed).choice(len(keys), size=n)
+    out = {'lookups': n}
+    for name, fetch in (('slice', lambda k: [np.array(a) for a in store.arrays(k).values()]), ('series', store.series)):
+        times = np.empty(n)
+        for i, k in enumerate(picks):
+            t0 = time.perf_counter()
+            fetch(keys[k])
+            times[i] = time.perf_counter() - t0
+        out[f'{name}_mean_ms'] = float(times.mean() * 1e3)
+        out[f'{name}_max_ms'] = float(times.max() * 1e3)
+    return out
@@ -3,136 +3,68 @@ generate_calendar_series.py - 污染日历矩阵数据生成器
 
 功能：
 - 读取2013年城市日级清洗数据
-- 计算AQI（遵循HJ 633-2012标准）
-- 生成日历热力图JSON数据
+- 计算AQI（遵循HJ 633-2012标准，六项污染物，见 src/aqi.py）
+- 生成日历热力图JSON数据：全部城市组成 (城市 × 日) 矩阵一次计算，周末/节假日标记每年只算一次，
+  各城市文件逐行流式写出（每天一行）
+- 法定节假日按年份配置（HOLIDAY_PERIODS）
 
-用法：python processing/src/util/generate_calendar_series.py --year 2013
+用法（在 processing/ 下运行）：python -m src.util.generate_calendar_series --year 2013
 """
 
 import os
 import json
 import argparse
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
 
+from ..dayreader import read_days
+from ..aqi import AQI_LEVEL_NAMES, AQI_POLLUTANTS, IAQI_POINTS, PRIMARY_NAMES, compute_aqi
 
-# ==================== AQI 计算模块 ====================
-
-# HJ 633-2012 AQI分级浓度限值表
-AQI_BREAKPOINTS = {
-    'pm25': [
-        (0, 35, 0, 50),      # 优
-        (35, 75, 50, 100),   # 良
-        (75, 115, 100, 150), # 轻度污染
-        (115, 150, 150, 200),# 中度污染
-        (150, 250, 200, 300),# 重度污染
-        (250, 350, 300, 400),# 严重污染
-        (350, 500, 400, 500),# 严重污染
-    ],
-    'pm10': [
-        (0, 50, 0, 50),
-        (50, 150, 50, 100),
-        (150, 250, 100, 150),
-        (250, 350, 150, 200),
-        (350, 420, 200, 300),
-        (420, 500, 300, 400),
-        (500, 600, 400, 500),
-    ]
-}
 
-# AQI质量等级映射
-AQI_LEVELS = [
-    (0, 50, '优', '#00E400'),
-    (51, 100, '良', '#FFFF00'),
-    (101, 150, '轻度污染', '#FF7E00'),
-    (151, 200, '中度污染', '#FF0000'),
-    (201, 300, '重度污染', '#99004C'),
-    (301, 500, '严重污染', '#7E0023'),
-]
-
-# 2013年法定节假日
-HOLIDAYS_2013 = {
-    # 元旦
-    '2013-01-01', '2013-01-02', '2013-01-03',
-    # 春节
-    '2013-02-09', '2013-02-10', '2013-02-11', '2013-02-12', 
-    '2013-02-13', '2013-02-14', '2013-02-15',
-    # 清明
-    '2013-04-04', '2013-04-05', '2013-04-06',
-    # 劳动节
-    '2013-04-29', '2013-04-30', '2013-05-01',
-    # 端午
-    '2013-06-10', '2013-06-11', '2013-06-12',
-    # 中秋
-    '2013-09-19', '2013-09-20', '2013-09-21',
-    # 国庆
-    '2013-10-01', '2013-10-02', '2013-10-03', '2013-10-04',
-    '2013-10-05', '2013-10-06', '2013-10-07',
+# ==================== AQI 计算模块 ====================
+# AQI（六项污染物，HJ 633-2012）由共享的向量化模块 src/aqi.py 计算
+
+# 法定节假日放假安排（国务院办公厅每年公布），按公布年份列出起止日期（含两端）；
+# 跨年的元旦假期（如 2016-12-31 ~ 2017-01-02）按日期落在哪一年统计，见 holiday_dates
+HOLIDAY_PERIODS = {
+    2013: [('2013-01-01', '2013-01-03'), ('2013-02-09', '2013-02-15'), ('2013-04-04', '2013-04-06'),
+           ('2013-04-29', '2013-05-01'), ('2013-06-10', '2013-06-12'), ('2013-09-19', '2013-09-21'),
+           ('2013-10-01', '2013-10-07')],
+    2014: [('2014-01-01', '2014-01-01'), ('2014-01-31', '2014-02-06'), ('2014-04-05', '2014-04-07'),
+           ('2014-05-01', '2014-05-03'), ('2014-05-31', '2014-06-02'), ('2014-09-06', '2014-09-08'),
+           ('2014-10-01', '2014-10-07')],
+    2015: [('2015-01-01', '2015-01-03'), ('2015-02-18', '2015-02-24'), ('2015-04-04', '2015-04-06'),
+           ('2015-05-01', '2015-05-03'), ('2015-06-20', '2015-06-22'), ('2015-09-03', '2015-09-05'),
+           ('2015-09-26', '2015-09-27'), ('2015-10-01', '2015-10-07')],
+    2016: [('2016-01-01', '2016-01-03'), ('2016-02-07', '2016-02-13'), ('2016-04-02', '2016-04-04'),
+           ('2016-04-30', '2016-05-02'), ('2016-06-09', '2016-06-11'), ('2016-09-15', '2016-09-17'),
+           ('2016-10-01', '2016-10-07')],
+    2017: [('2016-12-31', '2017-01-02'), ('2017-01-27', '2017-02-02'), ('2017-04-02', '2017-04-04'),
+           ('2017-04-29', '2017-05-01'), ('2017-05-28', '2017-05-30'), ('2017-10-01', '2017-10-08')],
+    2018: [('2017-12-30', '2018-01-01'), ('2018-02-15', '2018-02-21'), ('2018-04-05', '2018-04-07'),
+           ('2018-04-29', '2018-05-01'), ('2018-06-16', '2018-06-18'), ('2018-09-22', '2018-09-24'),
+           ('2018-10-01', '2018-10-07')],
+    2019: [('2018-12-30', '2019-01-01'), ('2019-02-04', '2019-02-10'), ('2019-04-05', '2019-04-07'),
+           ('2019-05-01', '2019-05-04'), ('2019-06-07', '2019-06-09'), ('2019-09-13', '2019-09-15'),
+           ('2019-10-01', '2019-10-07')],
+    2020: [('2020-01-01', '2020-01-01'), ('2020-01-24', '2020-02-02'), ('2020-04-04', '2020-04-06'),
+           ('2020-05-01', '2020-05-05'), ('2020-06-25', '2020-06-27'), ('2020-10-01', '2020-10-08')],
 }
 
 
-def calculate_iaqi(concentration, pollutant):
-    """
-    计算单项污染物的分指数 IAQI
-    遵循 HJ 633-2012 标准
-    """
-    if pd.isna(concentration) or concentration < 0:
-        return None
-    
-    breakpoints = AQI_BREAKPOINTS.get(pollutant)
-    if not breakpoints:
-        return None
-    
-    for bp_lo, bp_hi, iaqi_lo, iaqi_hi in breakpoints:
-        if bp_lo <= concentration <= bp_hi:
-            # 线性插值公式: IAQI = (IAQI_hi - IAQI_lo) / (BP_hi - BP_lo) * (C - BP_lo) + IAQI_lo
-            iaqi = (iaqi_hi - iaqi_lo) / (bp_hi - bp_lo) * (concentration - bp_lo) + iaqi_lo
-            return round(iaqi)
-    
-    # 超出范围返回500
-    if concentration > breakpoints[-1][1]:
-        return 500
-    
-    return None
+@lru_cache(maxsize=None)
+def holiday_dates(year):
+    """某一年内的全部法定节假日（YYYY-MM-DD 集合）；没有放假安排的年份返回空集。"""
+    out = set()
+    for listed in (year - 1, year, year + 1):
+        for start, end in HOLIDAY_PERIODS.get(listed, ()):
+            out.update(d for d in pd.date_range(start, end, freq='D').strftime('%Y-%m-%d') if d.startswith(str(year)))
+    return frozenset(out)
 
 
-def calculate_aqi(pm25, pm10):
-    """
-    计算AQI值（取PM2.5和PM10分指数的最大值）
-    返回: (aqi, level, color, primary_pollutant)
-    """
-    iaqi_pm25 = calculate_iaqi(pm25, 'pm25')
-    iaqi_pm10 = calculate_iaqi(pm10, 'pm10')
-    
-    if iaqi_pm25 is None and iaqi_pm10 is None:
-        return None, None, None, None
-    
-    if iaqi_pm25 is None:
-        aqi = iaqi_pm10
-        primary = 'PM10'
-    elif iaqi_pm10 is None:
-        aqi = iaqi_pm25
-        primary = 'PM2.5'
-    elif iaqi_pm25 >= iaqi_pm10:
-        aqi = iaqi_pm25
-        primary = 'PM2.5'
-    else:
-        aqi = iaqi_pm10
-        primary = 'PM10'
-    
-    # 获取质量等级
-    level = '未知'
-    color = '#CCCCCC'
-    for lo, hi, lvl, clr in AQI_LEVELS:
-        if lo <= aqi <= hi:
-            level = lvl
-            color = clr
-            break
-    if aqi > 300:
-        level = '严重污染'
-        color = '#7E0023'
-    
-    return aqi, level, color, primary
+HOLIDAYS_2013 = holiday_dates(2013)
 
 
 def is_weekend(date_str):
@@ -143,7 +75,17 @@ def is_weekend(date_str):
 
 def is_holiday(date_str):
     """判断是否为法定节假日"""
-    return date_str in HOLIDAYS_2013
+    return date_str in holiday_dates(int(date_str[:4]))
+
+
+@lru_cache(maxsize=None)
+def year_calendar(year):
+    """一年的日期标签与周末 / 节假日标记（每年只算一次），返回 (dates, weekend, holiday) 三个等长数组。"""
+    dates = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq='D')
+    labels = np.asarray(dates.strftime('%Y-%m-%d'), dtype=object)
+    weekend = np.asarray(dates.dayofweek >= 5)
+    holiday = np.isin(labels, list(holiday_dates(year)))
+    return labels, weekend, holiday
 
 
 # ==================== 数据处理模块 ====================
@@ -151,56 +93,61 @@ def is_holiday(date_str):
 def load_daily_data(year, processed_dir):
     """
     加载指定年份的所有日级数据
-    返回按城市分组的DataFrame字典
+    返回整张城市日表（date 为 Timestamp），没有数据时返回空表
     """
     base_path = os.path.join(processed_dir, 'city', str(year))
     
     if not os.path.exists(base_path):
         print(f"错误: 找不到目录 {base_path}")
-        return {}
-    
-    all_data = []
-    
-    # 遍历月份目录
-    for month_dir in sorted(os.listdir(base_path)):
-        month_path = os.path.join(base_path, month_dir)
-        if not os.path.isdir(month_path):
-            continue
-        
-        # 遍历日期目录
-        for day_dir in sorted(os.listdir(month_path)):
-            day_path = os.path.join(month_path, day_dir)
-            if not os.path.isdir(day_path):
-                continue
-            
-            # 读取CSV文件
-            for csv_file in os.listdir(day_path):
-                if csv_file.endswith('.csv'):
-                    csv_path = os.path.join(day_path, csv_file)
-                    try:
-                        df = pd.read_csv(csv_path)
-                        # 从文件名提取日期
-                        date_str = csv_file.replace('.csv', '')
-                        if len(date_str) == 8:  # YYYYMMDD格式
-                            df['date'] = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-                        all_data.append(df)
-                    except Exception as e:
-                        print(f"读取文件失败 {csv_path}: {e}")
+        return pd.DataFrame()
     
-    if not all_data:
+    # 读取该年全部日文件（json/csv/parquet 均可）
+    combined = read_days(base_path)
+    if combined.empty or 'city' not in combined.columns:
         print(f"警告: 未找到 {year} 年的任何数据")
-        return {}
+        return pd.DataFrame()
     
-    combined = pd.concat(all_data, ignore_index=True)
-    
-    # 按城市分组
-    city_data = {}
-    if 'city' in combined.columns:
-        for city, group in combined.groupby('city'):
-            city_data[city] = group.copy()
-    
-    print(f"加载了 {len(city_data)} 个城市的数据")
-    return city_data
+    print(f"加载了 {combined['city'].nunique()} 个城市的数据")
+    return combined
+
+
+def calendar_matrix(df, codes, days, n_cities, n_days):
+    """
+    城市日表 -> (城市 × 日) 矩阵：aqi（float，缺测 NaN）、level / primary（int8，缺测 -1）
+    codes 为每行的城市编号，days 为每行在当年的第几天（0 起）；范围外的行忽略，
+    同一城市同一天有多行时取第一行（与原逐城市实现一致）
+    """
+    res = compute_aqi(df)
+    codes = np.asarray(codes, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    ok = (codes >= 0) & (days >= 0) & (days < n_days)
+    keys, first = np.unique(codes[ok] * n_days + days[ok], return_index=True)
+    rows = np.nonzero(ok)[0][first]
+    out = {'aqi': np.full(n_cities * n_days, np.nan),
+           'level': np.full(n_cities * n_days, -1, dtype=np.int8),
+           'primary': np.full(n_cities * n_days, -1, dtype=np.int8)}
+    for k, m in out.items():
+        m[keys] = res[k][rows]
+    return {k: m.reshape(n_cities, n_days) for k, m in out.items()}
+
+
+def calendar_lines(matrix, year):
+    """
+    把 calendar_matrix 的结果整体格式化为 (城市 × 日) 的 JSON 行文本：
+    [日期, AQI, 等级, 首要污染物, 是否周末, 是否节假日]，缺测日为 [日期, null, null, null, 周末, 节假日]
+    """
+    labels, weekend, holiday = year_calendar(year)
+    dumps = lambda v: json.dumps(v, ensure_ascii=False)  # noqa: E731
+    prefix = np.asarray([f'[{dumps(d)}, ' for d in labels], dtype=object)
+    suffix = np.asarray([f', {dumps(bool(w))}, {dumps(bool(h))}]' for w, h in zip(weekend, holiday)], dtype=object)
+    aqi_tok = np.asarray([str(i) for i in range(IAQI_POINTS[-1] + 1)], dtype=object)
+    level_tok = np.asarray([dumps(n) for n in AQI_LEVEL_NAMES] + ['null'], dtype=object)
+    primary_tok = np.asarray([dumps(PRIMARY_NAMES[p]) for p in AQI_POLLUTANTS] + ['null'], dtype=object)
+    valid = np.isfinite(matrix['aqi'])
+    aqi = np.where(valid, matrix['aqi'], 0).astype(np.int64)
+    middle = np.where(valid, aqi_tok[aqi] + ', ' + level_tok[matrix['level']] + ', ' + primary_tok[matrix['primary']],
+                      'null, null, null')
+    return prefix[None, :] + middle + suffix[None, :]
 
 
 def generate_calendar_series(city_df, year):
@@ -208,56 +155,22 @@ def generate_calendar_series(city_df, year):
     为单个城市生成完整的日历序列
     返回: [[日期, AQI, 等级, 首要污染物, 是否周末, 是否节假日], ...]
     """
-    result = []
-    
-    # 生成完整的年度日期序列
-    start_date = datetime(year, 1, 1)
-    end_date = datetime(year, 12, 31)
-    current_date = start_date
-    
-    # 将数据转换为日期索引的字典
-    date_data = {}
-    if 'date' in city_df.columns:
-        for _, row in city_df.iterrows():
-            date_str = str(row['date'])[:10]  # 确保格式为 YYYY-MM-DD
-            if date_str not in date_data:
-                pm25 = row.get('pm25', None)
-                pm10 = row.get('pm10', None)
-                date_data[date_str] = (pm25, pm10)
-    
-    # 遍历全年每一天
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        
-        weekend = is_weekend(date_str)
-        holiday = is_holiday(date_str)
-        
-        if date_str in date_data:
-            pm25, pm10 = date_data[date_str]
-            aqi, level, color, primary = calculate_aqi(pm25, pm10)
-            
-            if aqi is not None:
-                result.append([
-                    date_str,
-                    aqi,
-                    level,
-                    primary,
-                    weekend,
-                    holiday
-                ])
-            else:
-                result.append([date_str, None, None, None, weekend, holiday])
-        else:
-            # 数据缺失
-            result.append([date_str, None, None, None, weekend, holiday])
-        
-        current_date += timedelta(days=1)
-    
+    labels, weekend, holiday = year_calendar(year)
+    result = [[d, None, None, None, bool(w), bool(h)] for d, w, h in zip(labels, weekend, holiday)]
+    if 'date' not in city_df.columns or not len(city_df):
+        return result
+    days = (pd.to_datetime(city_df['date'].astype(str).str[:10], errors='coerce')
+            - pd.Timestamp(year, 1, 1)).dt.days.fillna(-1).to_numpy()
+    m = calendar_matrix(city_df, np.zeros(len(city_df)), days, 1, len(labels))
+    level_names = list(AQI_LEVEL_NAMES)
+    primary_names = [PRIMARY_NAMES[p] for p in AQI_POLLUTANTS]
+    for d in np.nonzero(np.isfinite(m['aqi'][0]))[0]:
+        result[d][1:4] = [int(m['aqi'][0, d]), level_names[m['level'][0, d]], primary_names[m['primary'][0, d]]]
     return result
 
 
-def save_calendar_json(city_name, calendar_data, output_dir):
-    """保存日历数据为JSON"""
+def write_calendar_lines(city_name, lines, output_dir):
+    """把一个城市的日历行流式写出为 JSON（每天一行），返回文件路径"""
     # 清理城市名中的特殊字符
     safe_name = city_name.replace('|', '_').replace('/', '_').replace('\\', '_')
     
@@ -265,14 +178,27 @@ def save_calendar_json(city_name, calendar_data, output_dir):
     output_path = os.path.join(output_dir, f"{safe_name}.json")
     
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump({
-            'city': city_name,
-            'data': calendar_data
-        }, f, ensure_ascii=False, indent=2)
+        f.write('{"city": ' + json.dumps(city_name, ensure_ascii=False) + ', "data": [\n')
+        f.write(',\n'.join(lines))
+        f.write('\n]}\n')
     
     return output_path
 
 
+def save_calendar_json(city_name, calendar_data, output_dir):
+    """保存日历数据（generate_calendar_series 的结果）为JSON"""
+    lines = (json.dumps(row, ensure_ascii=False) for row in calendar_data)
+    return write_calendar_lines(city_name, lines, output_dir)
+
+
+def write_calendars(names, matrix, year, output_dir):
+    """按 calendar_matrix 的城市顺序逐个写出日历 JSON，返回写出的文件数"""
+    lines = calendar_lines(matrix, year)
+    for g, city in enumerate(names):
+        write_calendar_lines(city, lines[g], output_dir)
+    return len(names)
+
+
 # ==================== 主函数 ====================
 
 def build_calendar_series(year, processed_dir=None, output_dir=None):
@@ -289,27 +215,22 @@ def build_calendar_series(year, processed_dir=None, output_dir=None):
     print(f"输出目录: {output_dir}")
     
     # 加载数据
-    city_data = load_daily_data(year, processed_dir)
+    combined = load_daily_data(year, processed_dir)
     
-    if not city_data:
+    if combined.empty:
         print("未找到数据，退出")
         return
     
-    # 为每个城市生成日历
-    success_count = 0
-    for city_name, city_df in city_data.items():
-        try:
-            calendar = generate_calendar_series(city_df, year)
-            output_path = save_calendar_json(city_name, calendar, output_dir)
-            success_count += 1
-            print(f"  ✓ {city_name} -> {os.path.basename(output_path)}")
-        except Exception as e:
-            print(f"  ✗ {city_name}: {e}")
+    # (城市 × 日) 矩阵一次算好，再逐城市流式写出
+    codes, names = pd.factorize(combined['city'], sort=True)
+    days = (combined['date'].dt.normalize() - pd.Timestamp(year, 1, 1)).dt.days.to_numpy()
+    n_days = len(year_calendar(year)[0])
+    matrix = calendar_matrix(combined, codes, days, len(names), n_days)
+    success_count = write_calendars(list(names), matrix, year, output_dir)
     
-    print(f"\n完成！成功生成 {success_count}/{len(city_data)} 个城市的日历数据")
+    print(f"\n完成！成功生成 {success_count}/{len(names)} 个城市的日历数据")
     print(f"输出目录: {output_dir}")
 
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='生成污染日历矩阵数据')
     parser.add_argument('--year', type=int, default=2013, help='年份 (默认: 2013)')
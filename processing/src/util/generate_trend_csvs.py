@@ -2,7 +2,7 @@
 生成每个省份和每个城市的趋势 CSV。
 
 用途：
-  python 脚本/generate_trend_csvs.py --2013 年
+  cd processing && python -m src.util.generate_trend_csvs --year 2013
 
 此脚本读取 `resources/aggreated/{year}/` 下的每月聚合 CSV（如果存在）
 并回退到“resources/processed/city/{year}/”下每天处理的 CSV
@@ -13,6 +13,9 @@
   资源/趋势/城市/Beijing_monthly.csv
   资源/趋势/city/Beijing_daily.csv
 列：日期、pm25、pm10、so2、no2、co、o3、temp、rh、psfc、u、v
+
+多年逐日趋势请用 run_pipeline.py trends：每个层级/频率只写一个列式文件（见 src/trendstore.py），
+按区域切片读取，不再产生成千上万个小 CSV。
 """
 import argparse
 import os
@@ -20,6 +23,8 @@ import glob
 import pandas as pd
 import json
 
+from ..dayreader import read_days
+
 
 DEFAULT_VARS = ['pm25','pm10','so2','no2','co','o3','temp','rh','psfc','u','v']
 
@@ -29,6 +34,19 @@ def ensure_dir(p):
         os.makedirs(p, exist_ok=True)
 
 
+def sanitize_filename(s):
+    # remove characters invalid on Windows filenames: <>:"/\\|?* and control chars
+    bad = '<>:"/\\|?*'
+    out = ''.join((c if c not in bad and ord(c) >= 32 else '_') for c in str(s))
+    # also strip surrounding whitespace and collapse consecutive underscores
+    out = out.strip()
+    while '__' in out:
+        out = out.replace('__', '_')
+    if not out:
+        out = 'item'
+    return out
+
+
 def read_aggregated_monthly(year):
     base = os.path.join('resources', 'aggregated', str(year))
     pattern = os.path.join(base, '*.csv')
@@ -58,27 +76,15 @@ def read_aggregated_monthly(year):
 
 def read_processed_daily(year):
     base = os.path.join('resources', 'processed', 'city', str(year))
-    pattern = os.path.join(base, '**', '*.csv')
-    files = sorted(glob.glob(pattern, recursive=True))
-    dfs = []
-    for f in files:
-        try:
-            df = pd.read_csv(f)
-            df.columns = [c.strip().lower() for c in df.columns]
-            # try to infer date from filename if not present
-            fname = os.path.basename(f)
-            m = None
-            if len(fname) >= 8 and fname[:8].isdigit():
-                m = fname[:8]
-            if m:
-                date = m[:4] + '-' + m[4:6] + '-' + m[6:8]
-                df['time'] = df.get('time').fillna(date) if 'time' in df.columns else date
-            dfs.append(df)
-        except Exception as e:
-            print('Failed to read', f, e)
-    if dfs:
-        return pd.concat(dfs, ignore_index=True)
-    return pd.DataFrame()
+    if not os.path.isdir(base):
+        return pd.DataFrame()
+    # 共享读取层：任意格式的日文件，date 列来自文件名
+    df = read_days(base)
+    if df.empty:
+        return df
+    date = df['date'].dt.strftime('%Y-%m-%d')
+    df['time'] = df['time'].fillna(date) if 'time' in df.columns else date
+    return df.drop(columns=['date'])
 
 
 def produce_monthly_trends(df, out_dir, group_field='province'):
@@ -102,18 +108,6 @@ def produce_monthly_trends(df, out_dir, group_field='province'):
     grp = g.groupby([group_field, '__period'])[vars_present].mean().reset_index()
     ensure_dir(out_dir)
     # write one CSV per group (province/city)
-    def sanitize_filename(s):
-        # remove characters invalid on Windows filenames: <>:"/\\|?* and control chars
-        bad = '<>:"/\\|?*'
-        out = ''.join((c if c not in bad and ord(c) >= 32 else '_') for c in str(s))
-        # also strip surrounding whitespace and collapse consecutive underscores
-        out = out.strip()
-        while '__' in out:
-            out = out.replace('__', '_')
-        if not out:
-            out = 'item'
-        return out
-
     for name, group in grp.groupby(group_field):
         safe = sanitize_filename(name)
         out_path = os.path.join(out_dir, f"{safe}_monthly.csv")
@@ -147,15 +141,6 @@ def produce_daily_trends(df, out_dir, group_field='city'):
     grp = g.groupby([group_field, '__day'])[vars_present].mean().reset_index()
     ensure_dir(out_dir)
     for name, group in grp.groupby(group_field):
-        def sanitize_filename(s):
-            bad = '<>:"/\\|?*'
-            out = ''.join((c if c not in bad and ord(c) >= 32 else '_') for c in str(s))
-            out = out.strip()
-            while '__' in out:
-                out = out.replace('__', '_')
-            if not out:
-                out = 'item'
-            return out
         safe = sanitize_filename(name)
         out_path = os.path.join(out_dir, f"{safe}_daily.csv")
         group = group.rename(columns={'__day': 'date'})
@@ -6,34 +6,33 @@ generate_wind_rose.py - 污染风向玫瑰图数据生成器
 - 将风矢量(u, v)转换为风速和风向
 - 按16个方位统计风频和PM2.5平均浓度
 - 支持季节对比（采暖季 vs 非采暖季）
+- --hourly：改用 extract --wind-rose 写出的逐时分箱结果（YYYYMMDD_windrose.npz），
+  按逐时 u/v 统计风频（含风速分级与静风比例），避免日均风矢量相互抵消
 
-用法：python processing/src/util/generate_wind_rose.py --year 2013
+用法（在 processing/ 下运行）：python -m src.util.generate_wind_rose --year 2013 [--hourly]
 """
 
 import os
+import glob
 import json
 import argparse
-import math
 import pandas as pd
 import numpy as np
 
+from ..dayreader import read_days
+from ..regions import get_registry
+from ..windrose import DIRECTIONS, N_SECTORS, merge_roses, rose_bincount, wind_sector
 
-# ==================== 常量定义 ====================
-
-# 16个风向方位（从北开始，顺时针）
-DIRECTIONS = [
-    'N', 'NNE', 'NE', 'ENE', 
-    'E', 'ESE', 'SE', 'SSE',
-    'S', 'SSW', 'SW', 'WSW', 
-    'W', 'WNW', 'NW', 'NNW'
-]
 
-# 每个扇区的角度范围（22.5度）
-SECTOR_SIZE = 360.0 / 16  # 22.5度
+# ==================== 常量定义 ====================
 
 # 采暖季月份（1, 2, 11, 12月）
 HEATING_MONTHS = {1, 2, 11, 12}
 
+# 季节编码：每个城市两个分组（采暖季 / 非采暖季），全年 = 两者相加
+SEASON_HEATING = 0
+SEASON_NON_HEATING = 1
+
 # AQI质量等级映射（与日历模块保持一致）
 AQI_LEVELS = [
     (0, 50, '优', '#00E400'),
@@ -44,237 +43,146 @@ AQI_LEVELS = [
     (301, 500, '严重污染', '#7E0023'),
 ]
 
-
-# ==================== 风矢量转换模块 ====================
-
-def calculate_wind_speed(u, v):
-    """
-    计算风速
-    Wind_Speed = sqrt(u^2 + v^2)
-    
-    Args:
-        u: 东西方向风分量（正值表示西风，即向东吹）
-        v: 南北方向风分量（正值表示南风，即向北吹）
-    
-    Returns:
-        风速 (m/s)
-    """
-    if pd.isna(u) or pd.isna(v):
-        return np.nan
-    return math.sqrt(u**2 + v**2)
-
-
-def calculate_wind_direction(u, v):
-    """
-    计算风向（风的来向）
-    Wind_Direction = atan2(u, v) * (180/π)
-    
-    注意：气象学中风向指的是风的来向
-    - u > 0, v > 0: 西南风（来自西南，吹向东北）
-    - u > 0, v < 0: 西北风
-    - u < 0, v > 0: 东南风
-    - u < 0, v < 0: 东北风
-    
-    Args:
-        u: 东西方向风分量
-        v: 南北方向风分量
-    
-    Returns:
-        风向角度 (0-360度, 0=北, 90=东, 180=南, 270=西)
-    """
-    if pd.isna(u) or pd.isna(v):
-        return np.nan
-    
-    # 如果风速接近0，返回NaN
-    if abs(u) < 1e-6 and abs(v) < 1e-6:
-        return np.nan
-    
-    # atan2返回的是风吹向的方向，需要加180度得到风的来向
-    # 同时转换为气象学惯例（0度=北，顺时针增加）
-    direction = math.atan2(u, v) * (180.0 / math.pi)
-    
-    # 将角度转换为0-360范围
-    direction = (direction + 360) % 360
-    
-    return direction
-
-
-def direction_to_sector(direction):
-    """
-    将风向角度转换为16方位扇区索引
-    
-    每个扇区覆盖22.5度：
-    - N (北): 348.75° - 11.25°
-    - NNE (北北东): 11.25° - 33.75°
-    - ... 以此类推
-    
-    Args:
-        direction: 风向角度 (0-360度)
-    
-    Returns:
-        扇区索引 (0-15)，0=N, 1=NNE, ..., 15=NNW
-    """
-    if pd.isna(direction):
-        return None
-    
-    # 偏移11.25度使得北向位于中心
-    adjusted = (direction + SECTOR_SIZE / 2) % 360
-    sector = int(adjusted / SECTOR_SIZE)
-    
-    return sector
+# PM2.5 浓度近似映射到 AQI 等级（参考 HJ 633-2012）：<= 35 优，<= 75 良 ...
+PM25_LEVEL_BOUNDS = np.array([35, 75, 115, 150, 250], dtype='float64')
+PM25_LEVEL_NAMES = ['优', '良', '轻度污染', '中度污染', '重度污染', '严重污染']
+PM25_LEVEL_COLORS = ['#00E400', '#FFFF00', '#FF7E00', '#FF0000', '#99004C', '#7E0023']
 
 
 def get_aqi_level(pm25_value):
     """
     根据PM2.5浓度获取AQI等级信息
-    
+
     Args:
         pm25_value: PM2.5浓度值
-    
+
     Returns:
         (等级名称, 颜色代码)
     """
     if pd.isna(pm25_value):
         return '未知', '#CCCCCC'
-    
-    # 使用PM2.5浓度近似映射到AQI等级
-    # PM2.5浓度区间（参考HJ 633-2012）
-    if pm25_value <= 35:
-        return '优', '#00E400'
-    elif pm25_value <= 75:
-        return '良', '#FFFF00'
-    elif pm25_value <= 115:
-        return '轻度污染', '#FF7E00'
-    elif pm25_value <= 150:
-        return '中度污染', '#FF0000'
-    elif pm25_value <= 250:
-        return '重度污染', '#99004C'
-    else:
-        return '严重污染', '#7E0023'
+    level = int(np.searchsorted(PM25_LEVEL_BOUNDS, pm25_value, side='left'))
+    return PM25_LEVEL_NAMES[level], PM25_LEVEL_COLORS[level]
 
 
 # ==================== 数据处理模块 ====================
 
 def load_daily_data(year, processed_dir):
     """
-    加载指定年份的所有日级数据
-    返回按城市分组的DataFrame字典
+    加载指定年份的所有日级数据（全部城市一张表，带 month 列）
     """
     base_path = os.path.join(processed_dir, 'city', str(year))
-    
+
     if not os.path.exists(base_path):
         print(f"错误: 找不到目录 {base_path}")
-        return {}
-    
-    all_data = []
-    
-    # 遍历月份目录
-    for month_dir in sorted(os.listdir(base_path)):
-        month_path = os.path.join(base_path, month_dir)
-        if not os.path.isdir(month_path):
-            continue
-        
-        # 遍历日期目录
-        for day_dir in sorted(os.listdir(month_path)):
-            day_path = os.path.join(month_path, day_dir)
-            if not os.path.isdir(day_path):
-                continue
-            
-            # 读取CSV文件
-            for csv_file in os.listdir(day_path):
-                if csv_file.endswith('.csv'):
-                    csv_path = os.path.join(day_path, csv_file)
-                    try:
-                        df = pd.read_csv(csv_path)
-                        # 从文件名提取日期
-                        date_str = csv_file.replace('.csv', '')
-                        if len(date_str) == 8:  # YYYYMMDD格式
-                            df['date'] = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-                            df['month'] = int(date_str[4:6])
-                        all_data.append(df)
-                    except Exception as e:
-                        print(f"读取文件失败 {csv_path}: {e}")
-    
-    if not all_data:
+        return pd.DataFrame()
+
+    # 读取该年全部日文件（json/csv/parquet 均可）
+    combined = read_days(base_path, columns=['city', 'u', 'v', 'pm25'])
+    if combined.empty:
         print(f"警告: 未找到 {year} 年的任何数据")
+        return combined
+    combined['month'] = pd.to_datetime(combined['date']).dt.month
+
+    print(f"加载了 {combined['city'].nunique()} 个城市的数据")
+    return combined
+
+
+def _sector_records(counts, sums):
+    """
+    一个分组的 16 个扇区计数 / PM2.5 和 -> 输出记录列表（没有有效样本时为空列表）
+    """
+    total_count = int(counts.sum())
+    if total_count == 0:
+        return []
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+    freqs = counts / total_count * 100
+    levels = np.searchsorted(PM25_LEVEL_BOUNDS, means, side='left')
+    return [
+        {
+            'dir': DIRECTIONS[i],
+            'freq': round(freq, 2),
+            'value': round(mean, 2) if count > 0 else 0,
+            'level': PM25_LEVEL_NAMES[level],
+            'color': PM25_LEVEL_COLORS[level]
+        }
+        for i, (count, freq, mean, level) in enumerate(zip(counts.tolist(), freqs.tolist(), means.tolist(), levels.tolist()))
+    ]
+
+
+def wind_rose_tables(df, codes=None, names=None):
+    """
+    一次计算表中全部城市的风玫瑰（全年 / 采暖季 / 非采暖季）
+
+    风向扇区对整列 u/v 一次求出，城市 × 季节 × 扇区的样本数与 PM2.5 和由一次 bincount 得到。
+    codes / names 为已有的城市整数编码（每行一个，-1 为无城市）与编码对应的名称；
+    不传时按 df['city'] 编码。
+
+    Returns:
+        dict: {城市: {"all": [...], "heating": [...], "nonHeating": [...]}}
+    """
+    if df.empty:
         return {}
-    
-    combined = pd.concat(all_data, ignore_index=True)
-    
-    # 按城市分组
-    city_data = {}
-    if 'city' in combined.columns:
-        for city, group in combined.groupby('city'):
-            city_data[city] = group.copy()
-    
-    print(f"加载了 {len(city_data)} 个城市的数据")
-    return city_data
+    if 'u' not in df.columns or 'v' not in df.columns or 'pm25' not in df.columns:
+        print(f"警告: 缺少必要列 (u, v, pm25)")
+        return {}
+
+    if codes is None:
+        city_codes, cities = pd.factorize(df['city'], sort=True)
+    else:
+        city_codes, cities = np.asarray(codes), names
+    season = np.where(np.isin(df['month'].to_numpy(), list(HEATING_MONTHS)), SEASON_HEATING, SEASON_NON_HEATING)
+    groups = np.where(city_codes >= 0, city_codes * 2 + season, -1)
+    sectors = wind_sector(pd.to_numeric(df['u'], errors='coerce').to_numpy(dtype='float64'),
+                          pd.to_numeric(df['v'], errors='coerce').to_numpy(dtype='float64'))
+    pm25 = pd.to_numeric(df['pm25'], errors='coerce').to_numpy(dtype='float64')
+
+    counts, sums = rose_bincount(groups, sectors, pm25, len(cities) * 2)
+    counts = counts.reshape(len(cities), 2, N_SECTORS)
+    sums = sums.reshape(len(cities), 2, N_SECTORS)
+
+    tables = {}
+    for c, city in enumerate(cities):
+        tables[city] = {
+            'all': _sector_records(counts[c].sum(axis=0), sums[c].sum(axis=0)),
+            'heating': _sector_records(counts[c, SEASON_HEATING], sums[c, SEASON_HEATING]),
+            'nonHeating': _sector_records(counts[c, SEASON_NON_HEATING], sums[c, SEASON_NON_HEATING])
+        }
+    return tables
 
 
 def calculate_wind_rose_stats(city_df, filter_months=None):
     """
     计算单个城市的风玫瑰图统计数据
-    
+
     Args:
         city_df: 城市数据DataFrame
         filter_months: 可选，用于筛选特定月份的集合
-    
+
     Returns:
         list: 16个方位的统计数据
         [{"dir": "N", "freq": 15.5, "value": 85.2, "level": "良", "color": "#FFFF00"}, ...]
     """
-    df = city_df.copy()
-    
-    # 按月份筛选
+    df = city_df
     if filter_months is not None and 'month' in df.columns:
         df = df[df['month'].isin(filter_months)]
-    
     if df.empty:
         return []
-    
-    # 检查必要列
     if 'u' not in df.columns or 'v' not in df.columns or 'pm25' not in df.columns:
         print(f"警告: 缺少必要列 (u, v, pm25)")
         return []
-    
-    # 计算风向
-    df['wind_direction'] = df.apply(lambda row: calculate_wind_direction(row['u'], row['v']), axis=1)
-    df['sector'] = df['wind_direction'].apply(direction_to_sector)
-    
-    # 过滤无效数据
-    valid_df = df.dropna(subset=['sector', 'pm25'])
-    
-    if valid_df.empty:
-        return []
-    
-    total_count = len(valid_df)
-    
-    # 按扇区统计
-    sector_stats = []
-    for i, dir_name in enumerate(DIRECTIONS):
-        sector_data = valid_df[valid_df['sector'] == i]
-        
-        count = len(sector_data)
-        freq = (count / total_count) * 100 if total_count > 0 else 0
-        mean_pm25 = sector_data['pm25'].mean() if count > 0 else 0
-        
-        level, color = get_aqi_level(mean_pm25)
-        
-        sector_stats.append({
-            'dir': dir_name,
-            'freq': round(freq, 2),
-            'value': round(mean_pm25, 2) if not pd.isna(mean_pm25) else 0,
-            'level': level,
-            'color': color
-        })
-    
-    return sector_stats
+    sectors = wind_sector(pd.to_numeric(df['u'], errors='coerce').to_numpy(dtype='float64'),
+                          pd.to_numeric(df['v'], errors='coerce').to_numpy(dtype='float64'))
+    pm25 = pd.to_numeric(df['pm25'], errors='coerce').to_numpy(dtype='float64')
+    counts, sums = rose_bincount(np.zeros(len(df), dtype=np.int64), sectors, pm25, 1)
+    return _sector_records(counts[0], sums[0])
 
 
 def generate_wind_rose_data(city_df):
     """
     生成单个城市的完整风玫瑰图数据（含季节对比）
-    
+
     Returns:
         dict: {
             "all": [...],  # 全年数据
@@ -282,21 +190,91 @@ def generate_wind_rose_data(city_df):
             "nonHeating": [...]  # 非采暖季数据
         }
     """
-    # 全年数据
-    all_data = calculate_wind_rose_stats(city_df)
-    
-    # 采暖季数据
-    heating_data = calculate_wind_rose_stats(city_df, filter_months=HEATING_MONTHS)
-    
-    # 非采暖季数据
-    non_heating_months = set(range(1, 13)) - HEATING_MONTHS
-    non_heating_data = calculate_wind_rose_stats(city_df, filter_months=non_heating_months)
-    
-    return {
-        'all': all_data,
-        'heating': heating_data,
-        'nonHeating': non_heating_data
-    }
+    df = city_df.assign(city='_')
+    return wind_rose_tables(df).get('_', {'all': [], 'heating': [], 'nonHeating': []})
+
+
+def _hourly_sector_records(counts, pm25_sums, pm25_counts, calm):
+    """
+    一个分组的逐时分箱 (16 扇区 × 风速级) -> (输出记录列表, 静风百分比)
+
+    freq / speeds 为占全部有效风样本（含静风）的百分比，value 为该扇区 PM2.5 均值
+    """
+    total = int(counts.sum() + calm)
+    if total == 0:
+        return [], None
+    sector_counts = counts.sum(axis=1)
+    value_counts = pm25_counts.sum(axis=1)
+    means = np.where(value_counts > 0, pm25_sums.sum(axis=1) / np.maximum(value_counts, 1), 0.0)
+    freqs = sector_counts / total * 100
+    speeds = counts / total * 100
+    levels = np.searchsorted(PM25_LEVEL_BOUNDS, means, side='left')
+    records = [
+        {
+            'dir': DIRECTIONS[i],
+            'freq': round(freq, 2),
+            'value': round(mean, 2) if n > 0 else 0,
+            'level': PM25_LEVEL_NAMES[level],
+            'color': PM25_LEVEL_COLORS[level],
+            'speeds': [round(x, 2) for x in speed_row]
+        }
+        for i, (n, freq, mean, level, speed_row) in enumerate(
+            zip(value_counts.tolist(), freqs.tolist(), means.tolist(), levels.tolist(), speeds.tolist()))
+    ]
+    return records, round(calm / total * 100, 2)
+
+
+def load_hourly_roses(year, processed_dir):
+    """
+    合并一年的 YYYYMMDD_windrose.npz：返回 {'all'/'heating'/'nonHeating': (region_ids, speed_bins, 字段)}
+    """
+    base_path = os.path.join(processed_dir, 'city', str(year))
+    paths = sorted(glob.glob(os.path.join(base_path, '**', f"{year}{'[0-9]' * 4}_windrose.npz"), recursive=True))
+    if not paths:
+        print(f"警告: {base_path} 下没有逐时风玫瑰文件（需 extract --wind-rose）")
+        return {}
+    heating = [p for p in paths if int(os.path.basename(p)[4:6]) in HEATING_MONTHS]
+    non_heating = [p for p in paths if int(os.path.basename(p)[4:6]) not in HEATING_MONTHS]
+    print(f"加载了 {len(paths)} 天的逐时风玫瑰分箱")
+    return {'all': merge_roses(paths), 'heating': merge_roses(heating), 'nonHeating': merge_roses(non_heating)}
+
+
+def hourly_wind_rose_tables(roses):
+    """
+    逐时分箱 -> {城市: {"all", "heating", "nonHeating", "calm", "speedBins"}}；同名城市的分箱相加
+    """
+    if not roses or roses.get('all') is None:
+        return {}
+    region_ids, speed_bins, _ = roses['all']
+    names = get_registry().decode(region_ids.tolist())['city']
+    names = names.where(names.notna(), pd.Series(region_ids).astype(str))
+    city_codes, cities = pd.factorize(names, sort=True)
+
+    def _by_city(merged):
+        # 区域 -> 城市名：按名称编码把同名区域的分箱相加
+        out = {}
+        if merged is None:
+            return out
+        ids, _, fields = merged
+        codes = city_codes[np.searchsorted(region_ids, ids)]
+        for k, arr in fields.items():
+            summed = np.zeros((len(cities),) + arr.shape[1:], dtype=arr.dtype)
+            np.add.at(summed, codes, arr)
+            out[k] = summed
+        return out
+
+    seasons = {k: _by_city(roses.get(k)) for k in ('all', 'heating', 'nonHeating')}
+    tables = {}
+    for c, city in enumerate(cities):
+        table = {'source': 'hourly', 'speedBins': [float(b) for b in speed_bins], 'calm': {}}
+        for k, fields in seasons.items():
+            if not fields:
+                table[k], table['calm'][k] = [], None
+                continue
+            table[k], table['calm'][k] = _hourly_sector_records(
+                fields['counts'][c], fields['pm25_sums'][c], fields['pm25_counts'][c], int(fields['calm'][c]))
+        tables[city] = table
+    return tables
 
 
 def save_wind_rose_json(city_name, wind_rose_data, output_dir):
@@ -308,42 +286,44 @@ def save_wind_rose_json(city_name, wind_rose_data, output_dir):
     output_path = os.path.join(output_dir, f"{safe_name}.json")
     
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump({
+        f.write(json.dumps({
             'city': city_name,
             **wind_rose_data
-        }, f, ensure_ascii=False, indent=2)
+        }, ensure_ascii=False, indent=2))
     
     return output_path
 
 
 # ==================== 主函数 ====================
 
-def build_wind_rose_data(year, processed_dir=None, output_dir=None):
+def build_wind_rose_data(year, processed_dir=None, output_dir=None, hourly=False):
     """
-    主函数：为指定年份生成所有城市的风玫瑰图数据
+    主函数：为指定年份生成所有城市的风玫瑰图数据（hourly=True 时使用逐时分箱）
     """
     if processed_dir is None:
         processed_dir = os.path.join('resources', 'processed')
     if output_dir is None:
-        output_dir = os.path.join('resources', 'output', 'wind_rose', str(year))
+        output_dir = os.path.join('resources', 'output', 'wind_rose_hourly' if hourly else 'wind_rose', str(year))
     
     print(f"开始生成 {year} 年风玫瑰图数据...")
     print(f"数据源: {processed_dir}")
     print(f"输出目录: {output_dir}")
     
-    # 加载数据
-    city_data = load_daily_data(year, processed_dir)
-    
+    if hourly:
+        city_data = hourly_wind_rose_tables(load_hourly_roses(year, processed_dir))
+    else:
+        # 加载数据
+        combined = load_daily_data(year, processed_dir)
+        # 全部城市的风玫瑰一次算完，再逐个写出
+        city_data = wind_rose_tables(combined)
+
     if not city_data:
         print("未找到数据，退出")
         return
-    
-    # 为每个城市生成风玫瑰图数据
+
     success_count = 0
-    for city_name, city_df in city_data.items():
+    for city_name, wind_rose in city_data.items():
         try:
-            wind_rose = generate_wind_rose_data(city_df)
-            
             # 检查是否有有效数据
             if wind_rose['all']:
                 output_path = save_wind_rose_json(city_name, wind_rose, output_dir)
@@ -363,11 +343,13 @@ if __name__ == '__main__':
     parser.add_argument('--year', type=int, default=2013, help='年份 (默认: 2013)')
     parser.add_argument('--processed-dir', type=str, default=None, help='已处理数据目录')
     parser.add_argument('--output-dir', type=str, default=None, help='输出目录')
+    parser.add_argument('--hourly', action='store_true', help='使用 extract --wind-rose 生成的逐时分箱')
     
     args = parser.parse_args()
     
     build_wind_rose_data(
         year=args.year,
         processed_dir=args.processed_dir,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        hourly=args.hourly
     )
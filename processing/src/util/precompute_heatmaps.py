@@ -1,139 +1,60 @@
 #!/usr/bin/env python3
 """
-根据处理后的 CSV/聚合数据预先计算热图 JSON 文件和城市质心。
+预先计算热图 JSON 文件（products.build_heatmaps 的薄封装）。
 
 该脚本将：
- -通过对每个城市的经度/纬度进行平均来计算“resources/city_centroids.json”
-   `resources/processed/city/{year}/**/*.csv` 其中存在 `lon` 和 `lat` 列。
- -在“resources/heatmap/monthly/{YYYYMM}.json”下生成每月热图 JSON 文件。
+ -从城市日文件（或与之一致的分析库，见 src/store.py）读取一年的数据，整理为 YearTable；
+   城市质心取自质心表（见 src/centroids.py），缺失时退回注册表 regions.json 的坐标。
+ -在“resources/heatmap/{year}/{period}.json”下生成热图，默认只生成 month。
 
-热图 JSON 格式：对象列表 {"city":..., "province":..., "lon":..., "lat":..., "value":...}
-用法：python script/precompute_heatmaps.py --year 2013
+与 run_pipeline.py build-products --products heatmap 同一实现：AQI 为逐日 AQI 在周期内的均值，
+而不是由周期平均浓度计算。热图 JSON 格式：列式存储（见 src/products.py write_heatmap）。
+用法（在 processing/ 下运行）：python -m src.util.precompute_heatmaps --year 2013 [--periods day month] [--binary]
 """
 import os
-import glob
-import json
 import argparse
-import pandas as pd
 
+from ..config import DAY_ROOTS
+from ..products import HEATMAP_PERIODS, build_heatmaps, load_year_table
 
-def ensure_dir(p):
-    if not os.path.exists(p):
-        os.makedirs(p, exist_ok=True)
 
+def discover_years(roots):
+    """各数据根目录下以年份命名的子目录。"""
+    years = set()
+    for root in roots:
+        if os.path.isdir(root):
+            years.update(int(e) for e in os.listdir(root) if e.isdigit() and os.path.isdir(os.path.join(root, e)))
+    return sorted(years)
 
-def compute_city_centroids(year=None):
-    base = os.path.join('resources', 'processed', 'city')
-    pattern = os.path.join(base, '**', '*.csv') if year is None else os.path.join(base, str(year), '**', '*.csv')
-    files = sorted(glob.glob(pattern, recursive=True))
-    records = {}
-    for f in files:
-        try:
-            df = pd.read_csv(f)
-            df.columns = [c.strip().lower() for c in df.columns]
-            if 'city' not in df.columns:
-                continue
-            if 'lon' not in df.columns or 'lat' not in df.columns:
-                continue
-            for _, r in df.iterrows():
-                city = r.get('city')
-                if pd.isna(city):
-                    continue
-                try:
-                    lon = float(r.get('lon'))
-                    lat = float(r.get('lat'))
-                except Exception:
-                    continue
-                key = str(city)
-                if key not in records:
-                    records[key] = { 'sum_lon': 0.0, 'sum_lat': 0.0, 'n': 0, 'province': r.get('province') }
-                records[key]['sum_lon'] += lon
-                records[key]['sum_lat'] += lat
-                records[key]['n'] += 1
-        except Exception as e:
-            print('skipping', f, e)
-    centroids = {}
-    for k, v in records.items():
-        if v['n'] > 0:
-            centroids[k] = { 'city': k, 'lon': v['sum_lon'] / v['n'], 'lat': v['sum_lat'] / v['n'], 'count': v['n'], 'province': v.get('province') }
-    out = os.path.join('resources', 'city_centroids.json')
-    ensure_dir(os.path.dirname(out))
-    with open(out, 'w', encoding='utf-8') as fh:
-        json.dump(centroids, fh, ensure_ascii=False, indent=2)
-    print('Wrote city centroids to', out, 'entries=', len(centroids))
-    return centroids
 
-
-def build_monthly_heatmaps(year, centroids=None):
-    agg_dir = os.path.join('resources', 'aggregated', str(year))
-    pattern = os.path.join(agg_dir, '*.csv')
-    files = sorted(glob.glob(pattern))
-    out_base = os.path.join('resources', 'heatmap', 'monthly')
-    ensure_dir(out_base)
-    for f in files:
-        try:
-            df = pd.read_csv(f)
-            df.columns = [c.strip().lower() for c in df.columns]
-            fname = os.path.basename(f)
-            ym = os.path.splitext(fname)[0]
-            out_file = os.path.join(out_base, f"{ym}.json")
-            rows = []
-            # prefer lon/lat in aggregated rows if present, else look up centroids by city
-            for _, r in df.iterrows():
-                city = r.get('city')
-                prov = r.get('province')
-                value = None
-                # choose a primary pollutant value if available (pm25) else first numeric
-                if 'pm25' in r and not pd.isna(r['pm25']):
-                    value = float(r['pm25'])
-                else:
-                    # try to find first numeric among common pollutants
-                    for k in ['pm10','so2','no2','co','o3']:
-                        if k in r and not pd.isna(r[k]):
-                            value = float(r[k]); break
-                lon = r.get('lon') if 'lon' in r else None
-                lat = r.get('lat') if 'lat' in r else None
-                try:
-                    lon = float(lon) if lon is not None and str(lon) != '' else None
-                    lat = float(lat) if lat is not None and str(lat) != '' else None
-                except Exception:
-                    lon = lat = None
-                if (lon is None or lat is None) and centroids and city and city in centroids:
-                    lon = centroids[city]['lon']; lat = centroids[city]['lat']
-                if lon is None or lat is None:
-                    continue
-                rows.append({'city': city, 'province': prov, 'lon': lon, 'lat': lat, 'value': value})
-            with open(out_file, 'w', encoding='utf-8') as fh:
-                json.dump(rows, fh, ensure_ascii=False, indent=2)
-            print('Wrote heatmap', out_file, 'points=', len(rows))
-        except Exception as e:
-            print('Failed to build heatmap for', f, e)
+def build_year_heatmaps(year, roots=None, out_dir='resources', periods=('month',), binary=False):
+    """写出 <out_dir>/heatmap/<year>/<period>.json；binary=True 时 day 周期的数值另存为 float32 day.bin。"""
+    table = load_year_table(int(year), roots or DAY_ROOTS)
+    if table is None:
+        print('No city-day files for', year)
+        return 0
+    written = build_heatmaps(table, out_dir, periods=periods, binary_periods=('day',) if binary else ())
+    print('Wrote heatmaps', os.path.join(out_dir, 'heatmap', str(year)), 'periods=', list(periods),
+          'points=', len(table.regions))
+    return written
 
 
 def main():
     p = argparse.ArgumentParser()
-    p.add_argument('--year', type=int, required=False, help='year to process (e.g. 2013). If omitted, all years found under resources/aggregated will be processed.')
+    p.add_argument('--year', type=int, nargs='+', help='years to process (e.g. 2013). If omitted, all years found under the data roots are processed.')
+    p.add_argument('--data-root', action='append', help='root containing <year>/<mm>/<dd>/YYYYMMDD.* day files (repeatable)')
+    p.add_argument('--output-dir', default='resources', help='output root; files go to <output-dir>/heatmap/<year>/')
+    p.add_argument('--periods', nargs='+', choices=HEATMAP_PERIODS, default=['month'])
+    p.add_argument('--binary', action='store_true', help='store day period values as float32 day.bin next to a day.json header')
     args = p.parse_args()
-    year = args.year
-    # compute centroids across processed data (if year specified, restrict; else compute across all)
-    centroids = compute_city_centroids(year)
-    if year:
-        build_monthly_heatmaps(year, centroids)
-    else:
-        # discover years under resources/aggregated
-        agg_root = os.path.join('resources', 'aggregated')
-        years = []
-        if os.path.exists(agg_root):
-            for entry in sorted(os.listdir(agg_root)):
-                pth = os.path.join(agg_root, entry)
-                if os.path.isdir(pth) and entry.isdigit():
-                    years.append(int(entry))
-        if not years:
-            print('No aggregated year directories found under resources/aggregated. Nothing to build.')
-            return
-        for y in years:
-            print('Building heatmaps for', y)
-            build_monthly_heatmaps(y, centroids)
+    roots = args.data_root or DAY_ROOTS
+    years = args.year or discover_years(roots)
+    if not years:
+        print('No year directories found under', roots, '. Nothing to build.')
+        return
+    for y in years:
+        print('Building heatmaps for', y)
+        build_year_heatmaps(y, roots, args.output_dir, args.periods, args.binary)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,152 @@
+"""向量化的风向玫瑰统计。
+
+风向与扇区对整列 u/v 一次性计算（np.arctan2），不再逐行 apply；统计量是 (分组, 扇区) 的样本数与
+PM2.5 之和，由一次 np.bincount 在组合键 ``分组 * 16 + 扇区`` 上得到，分组可以是 城市 × 季节 等任意组合编码。
+
+风向约定与 util/generate_wind_rose.py 原有实现一致：atan2(u, v) 换算为 0-360 度（0 = 北，顺时针），
+扇区以正北为中心（N 覆盖 348.75°-11.25°）；u、v 同时接近 0 时为静风，没有风向。
+
+逐时风玫瑰（extract --wind-rose）：日均 u/v 会让一天内不同方向的风相互抵消，
+因此在 extract 中直接对每个小时、每个格点的 u/v 分箱，按 (区域, 扇区, 风速级) 累加样本数
+与同一格点同一小时的 PM2.5 和，写成日文件旁的 ``YYYYMMDD_windrose.npz``。
+风速低于 config.WIND_SPEED_BINS[0] 记为静风（单独计数）。各日文件相加即得任意时段的风玫瑰（merge_roses）。
+"""
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import WIND_SPEED_BINS
+
+# 16 个风向方位（从北开始，顺时针）
+DIRECTIONS = [
+    'N', 'NNE', 'NE', 'ENE',
+    'E', 'ESE', 'SE', 'SSE',
+    'S', 'SSW', 'SW', 'WSW',
+    'W', 'WNW', 'NW', 'NNW'
+]
+N_SECTORS = len(DIRECTIONS)
+SECTOR_SIZE = 360.0 / N_SECTORS  # 22.5 度
+CALM_EPS = 1e-6
+
+
+def wind_speed(u, v) -> np.ndarray:
+    """风速 sqrt(u² + v²)，任一分量缺测为 NaN。"""
+    u = np.asarray(u, dtype='float64')
+    v = np.asarray(v, dtype='float64')
+    return np.sqrt(u ** 2 + v ** 2)
+
+
+def wind_direction(u, v) -> np.ndarray:
+    """风向角度（0-360，0 = 北，90 = 东）；缺测或静风为 NaN。"""
+    u = np.asarray(u, dtype='float64')
+    v = np.asarray(v, dtype='float64')
+    with np.errstate(invalid='ignore'):
+        calm = (np.abs(u) < CALM_EPS) & (np.abs(v) < CALM_EPS)
+    direction = (np.arctan2(u, v) * (180.0 / np.pi) + 360) % 360
+    return np.where(calm | np.isnan(u) | np.isnan(v), np.nan, direction)
+
+
+def direction_sector(direction) -> np.ndarray:
+    """风向角度 -> 扇区下标（0 = N ... 15 = NNW），NaN 为 -1。"""
+    d = np.asarray(direction, dtype='float64')
+    ok = np.isfinite(d)
+    # 偏移半个扇区使正北位于 N 扇区中心
+    sector = (((np.where(ok, d, 0.0) + SECTOR_SIZE / 2) % 360) // SECTOR_SIZE).astype(np.int64)
+    return np.where(ok, sector, -1)
+
+
+def wind_sector(u, v) -> np.ndarray:
+    """u/v -> 扇区下标，没有风向（缺测/静风）为 -1。"""
+    return direction_sector(wind_direction(u, v))
+
+
+def rose_bincount(groups, sectors, values, n_groups: int, n_sectors: int = N_SECTORS) -> Tuple[np.ndarray, np.ndarray]:
+    """(分组, 扇区) 的样本数与 values 之和，形状 (n_groups, n_sectors)。
+
+    分组 < 0、扇区 < 0 或 value 为 NaN 的样本不计入。
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    sectors = np.asarray(sectors, dtype=np.int64)
+    values = np.asarray(values, dtype='float64')
+    ok = (groups >= 0) & (sectors >= 0) & np.isfinite(values)
+    keys = groups[ok] * n_sectors + sectors[ok]
+    size = n_groups * n_sectors
+    counts = np.bincount(keys, minlength=size).reshape(n_groups, n_sectors)
+    sums = np.bincount(keys, weights=values[ok], minlength=size).reshape(n_groups, n_sectors)
+    return counts, sums
+
+
+def speed_class(speed, bins: Sequence[float] = WIND_SPEED_BINS) -> np.ndarray:
+    """风速 -> 风速级下标（0 .. len(bins)-1）；静风（< bins[0]）或缺测为 -1。"""
+    speed = np.asarray(speed, dtype='float64')
+    cls = np.searchsorted(np.asarray(bins, dtype='float64'), np.where(np.isfinite(speed), speed, -np.inf),
+                          side='right') - 1
+    return cls.astype(np.int64)
+
+
+def hourly_rose(u: np.ndarray, v: np.ndarray, pm25: Optional[np.ndarray], cell_region: np.ndarray, n_regions: int,
+                bins: Sequence[float] = WIND_SPEED_BINS):
+    """逐时格点 u/v（形状 (小时, 格点)）按区域分箱，逐小时整行向量化（内存只占一小时的临时数组）。
+
+    返回 dict：counts (区域, 扇区, 风速级) 样本数；pm25_sums / pm25_counts 同形状，
+    为同一格点同一小时 PM2.5 有效时的和与样本数；calm (区域,) 静风样本数。
+    """
+    n_classes = len(bins)
+    size = n_regions * N_SECTORS * n_classes
+    inside = cell_region >= 0
+    region = cell_region[inside]
+    counts = np.zeros(size, dtype=np.int64)
+    pm25_sums = np.zeros(size)
+    pm25_counts = np.zeros(size, dtype=np.int64)
+    calm = np.zeros(n_regions, dtype=np.int64)
+    for h in range(u.shape[0]):
+        uh, vh = u[h, inside], v[h, inside]
+        speed = wind_speed(uh, vh)
+        sector = wind_sector(uh, vh)
+        cls = speed_class(speed, bins)
+        windy = (sector >= 0) & (cls >= 0)
+        calm += np.bincount(region[np.isfinite(speed) & ~windy], minlength=n_regions)
+        keys = (region * N_SECTORS + sector) * n_classes + cls
+        counts += np.bincount(keys[windy], minlength=size)
+        if pm25 is not None:
+            values = pm25[h, inside]
+            ok = windy & np.isfinite(values)
+            pm25_sums += np.bincount(keys[ok], weights=values[ok], minlength=size)
+            pm25_counts += np.bincount(keys[ok], minlength=size)
+    shape = (n_regions, N_SECTORS, n_classes)
+    return {'counts': counts.reshape(shape), 'pm25_sums': pm25_sums.reshape(shape),
+            'pm25_counts': pm25_counts.reshape(shape), 'calm': calm}
+
+
+ROSE_FIELDS = ('counts', 'pm25_sums', 'pm25_counts', 'calm')
+
+
+def write_rose(path: str, region_ids: Sequence[int], rose: dict, bins: Sequence[float] = WIND_SPEED_BINS) -> str:
+    """写出单日（或已合并）的逐时风玫瑰累加量。"""
+    np.savez_compressed(path, region_ids=np.asarray(region_ids, dtype=np.int64),
+                        speed_bins=np.asarray(bins, dtype='float64'), **{k: rose[k] for k in ROSE_FIELDS})
+    return path
+
+
+def merge_roses(paths: Sequence[str]):
+    """把若干 windrose npz 按 region_id 对齐后相加；返回 (region_ids, speed_bins, {字段: 数组})，无文件时 None。
+
+    所有文件的风速分级必须一致。
+    """
+    parts = []
+    for p in paths:
+        with np.load(p) as data:
+            parts.append((data['region_ids'], data['speed_bins'], {k: data[k] for k in ROSE_FIELDS}))
+    if not parts:
+        return None
+    bins = parts[0][1]
+    if any(len(b) != len(bins) or not np.allclose(b, bins) for _, b, _ in parts):
+        raise ValueError('wind rose files use different speed bins')
+    region_ids = np.unique(np.concatenate([p[0] for p in parts]))
+    merged = {k: np.zeros((len(region_ids),) + parts[0][2][k].shape[1:], dtype=parts[0][2][k].dtype)
+              for k in ROSE_FIELDS}
+    for ids, _, fields in parts:
+        rows = np.searchsorted(region_ids, ids)
+        for k in ROSE_FIELDS:
+            merged[k][rows] += fields[k]
+    return region_ids, bins, merged